@@ -4,4 +4,4 @@ from .models import Feature
 
 @admin.register(Feature)
 class FeatureAdmin(admin.ModelAdmin):
-    list_display = ('name', 'id','developer','staging_enabled','production_enabled')
+    list_display = ('name', 'id','developer','staging_enabled','production_enabled','rollout_percentage')
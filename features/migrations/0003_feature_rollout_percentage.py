@@ -0,0 +1,19 @@
+# Generated by Django 6.0.2 on 2026-10-18 08:38
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('features', '0002_alter_feature_created_at_alter_feature_developer_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feature',
+            name='rollout_percentage',
+            field=models.PositiveSmallIntegerField(default=100, validators=[django.core.validators.MaxValueValidator(100)], verbose_name='Rollout Percentage'),
+        ),
+    ]
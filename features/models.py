@@ -1,3 +1,4 @@
+from django.core.validators import MaxValueValidator
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 
@@ -6,6 +7,7 @@ class Feature(models.Model):
     developer = models.CharField(max_length=255, unique=True,verbose_name=_('Developer'))
     staging_enabled = models.BooleanField(default=False,verbose_name=_('Staging Enabled'))
     production_enabled = models.BooleanField(default=False,verbose_name=_('Production Enabled'))
+    rollout_percentage = models.PositiveSmallIntegerField(default=100,validators=[MaxValueValidator(100)],verbose_name=_('Rollout Percentage'))
     created_at = models.DateTimeField(auto_now_add=True,verbose_name=_('Created At'))
 
     def __str__(self):
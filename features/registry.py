@@ -0,0 +1,54 @@
+import zlib
+
+from django.conf import settings
+
+from jnestagram.snapshots import VersionedSnapshot
+from .models import Feature
+
+
+class FlagState:
+    __slots__=('id','name','enabled','rollout_percentage')
+
+    def __init__(self,feature):
+        self.id=feature.id
+        self.name=feature.name
+        # Environment settings do not change at runtime, so this is resolved once per load
+        self.enabled=(feature.staging_enabled and settings.STAGING == 'True') or feature.production_enabled
+        self.rollout_percentage=feature.rollout_percentage
+
+    def in_rollout(self,key):
+        if self.rollout_percentage >= 100:
+            return True
+        if key is None or self.rollout_percentage <= 0:
+            return False
+        return zlib.crc32(f'{self.name}:{key}'.encode()) % 100 < self.rollout_percentage
+
+
+# Per-process snapshot of every feature flag, checks read plain dicts
+class FeatureRegistry(VersionedSnapshot):
+    version_key='features:version'
+    empty=({},{})
+
+    def fetch(self):
+        states=[FlagState(feature) for feature in Feature.objects.all()]
+        return {state.id:state for state in states},{state.name:state for state in states}
+
+    def get(self,id_or_name):
+        by_id,by_name=self.current()
+        return by_name.get(id_or_name) if isinstance(id_or_name,str) else by_id.get(id_or_name)
+
+    def is_enabled(self,id_or_name,key=None,developer=None):
+        if developer and settings.ENVIRONMENT == 'development' and settings.DEVELOPER == developer:
+            return True
+
+        state=self.get(id_or_name)
+        return state is not None and state.enabled and state.in_rollout(key)
+
+    def evaluate(self,ids_or_names,key=None,developer=None):
+        return {id_or_name:self.is_enabled(id_or_name,key,developer) for id_or_name in ids_or_names}
+
+
+registry=FeatureRegistry()
+
+def bump_version():
+    registry.bump_version()
@@ -0,0 +1,10 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Feature
+from .registry import bump_version
+
+@receiver(post_save, sender=Feature)
+@receiver(post_delete, sender=Feature)
+def bump_features_version(sender, **kwargs):
+    bump_version()
@@ -1,3 +1,52 @@
-from django.test import TestCase
+from django.test import TestCase,override_settings
+from django.core.cache import cache
 
-# Create your tests here.
+from .models import Feature
+from .registry import registry
+from .views import feature_enabled
+
+
+@override_settings(ENVIRONMENT='production',STAGING='False')
+class FeatureRegistryTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+        self.hero=Feature.objects.create(name='hero_button',developer='Jarvis',production_enabled=True)
+        self.beta=Feature.objects.create(name='beta',developer='Friday',production_enabled=True,rollout_percentage=30)
+        self.staging=Feature.objects.create(name='staging_only',developer='Karen',staging_enabled=True)
+
+    def test_checks_do_not_query_after_load(self):
+        registry.get('hero_button')
+        with self.assertNumQueries(0):
+            self.assertTrue(feature_enabled(self.hero.id,'Jarvis'))
+            self.assertTrue(registry.is_enabled('hero_button'))
+            self.assertFalse(registry.is_enabled('staging_only'))
+            self.assertFalse(registry.is_enabled('missing'))
+            self.assertFalse(feature_enabled(0,'Jarvis'))
+
+    def test_bulk_evaluation(self):
+        flags=registry.evaluate(['hero_button','staging_only',self.hero.id])
+        self.assertEqual(flags,{'hero_button':True,'staging_only':False,self.hero.id:True})
+
+    def test_save_bumps_version(self):
+        self.assertTrue(registry.is_enabled('hero_button'))
+
+        self.hero.production_enabled=False
+        self.hero.save()
+        self.assertFalse(registry.is_enabled('hero_button'))
+
+        self.hero.delete()
+        self.assertIsNone(registry.get('hero_button'))
+
+    def test_percentage_rollout_is_deterministic(self):
+        enabled=[key for key in range(1000) if registry.is_enabled('beta',key=key)]
+
+        self.assertTrue(250 < len(enabled) < 350)
+        self.assertEqual(enabled,[key for key in range(1000) if registry.is_enabled('beta',key=key)])
+        self.assertFalse(registry.is_enabled('beta'))
+
+    @override_settings(ENVIRONMENT='development',DEVELOPER='Karen',STAGING='True')
+    def test_developer_and_staging(self):
+        registry.reset()
+        self.assertTrue(feature_enabled(self.staging.id,'Karen'))
+        self.assertTrue(registry.is_enabled('staging_only'))
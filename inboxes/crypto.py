@@ -0,0 +1,141 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from cryptography.fernet import Fernet,MultiFernet,InvalidToken
+from django.conf import settings
+
+CACHE_SIZE=10000
+CACHE_TTL=5*60
+
+
+# Bounded LRU of decrypted bodies keyed by a digest of the ciphertext, so
+# plaintext never outlives CACHE_TTL and the cache keys reveal nothing
+class PlaintextCache:
+    def __init__(self,size=CACHE_SIZE,ttl=CACHE_TTL):
+        self.size=size
+        self.ttl=ttl
+        self.lock=threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.entries=OrderedDict()
+        self.hits=0
+        self.misses=0
+        self.evictions=0
+
+    def get(self,key):
+        with self.lock:
+            entry=self.entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses+=1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits+=1
+            return entry[0]
+
+    def set(self,key,value):
+        with self.lock:
+            self.entries[key]=(value,time.monotonic()+self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+                self.evictions+=1
+
+    def stats(self):
+        with self.lock:
+            lookups=self.hits+self.misses
+            return {
+                'hits':self.hits,
+                'misses':self.misses,
+                'evictions':self.evictions,
+                'size':len(self.entries),
+                'hit_rate':self.hits/lookups if lookups else 0.0,
+            }
+
+
+plaintexts=PlaintextCache()
+executor=None
+fernets={}
+rotation_fernet=None
+
+def get_fernet(keys=None):
+    keys=tuple(key for key in (keys or settings.ENCRYPT_KEYS) if key)
+    if keys not in fernets:
+        fernets[keys]=MultiFernet([Fernet(key) for key in keys])
+    return fernets[keys]
+
+def digest(token):
+    return hashlib.blake2b(token.encode(),digest_size=16).digest()
+
+def encrypt(text):
+    return get_fernet().encrypt(text.encode('utf-8')).decode('utf-8')
+
+def decrypt_token(token):
+    return get_fernet().decrypt(token).decode('utf-8')
+
+def decrypt(token):
+    return decrypt_many([token])[0]
+
+def decrypt_many(tokens):
+    global executor
+
+    results=[None]*len(tokens)
+    missing={}
+    for index,token in enumerate(tokens):
+        if not token:
+            results[index]=''
+            continue
+
+        key=digest(token)
+        plaintext=plaintexts.get(key)
+        if plaintext is None:
+            missing.setdefault(key,(token,[]))[1].append(index)
+        else:
+            results[index]=plaintext
+
+    if missing:
+        pending=[token for token,_ in missing.values()]
+        workers=settings.MESSAGE_DECRYPT_WORKERS
+        if workers and len(pending) > 1:
+            if executor is None:
+                executor=ThreadPoolExecutor(max_workers=workers,thread_name_prefix='decrypt')
+            decrypted=executor.map(decrypt_token,pending)
+        else:
+            decrypted=map(decrypt_token,pending)
+
+        for (key,(_,indexes)),plaintext in zip(missing.items(),decrypted):
+            plaintexts.set(key,plaintext)
+            for index in indexes:
+                results[index]=plaintext
+
+    return results
+
+def decrypt_messages(messages):
+    # One batch per rendered page, the templates read message.plaintext
+    for message,plaintext in zip(messages,decrypt_many([message.text for message in messages])):
+        message.plaintext=plaintext
+    return messages
+
+def stats():
+    return plaintexts.stats()
+
+# Key rotation runs in worker processes, they only get the keys
+def init_rotation_worker(keys):
+    global rotation_fernet
+    rotation_fernet=get_fernet(keys)
+
+def rotate_tokens(rows):
+    # Re-encrypts with the primary key, None marks rows no key can read
+    rotated=[]
+    for pk,token in rows:
+        try:
+            rotated.append((pk,rotation_fernet.rotate(token.encode()).decode()))
+        except InvalidToken:
+            rotated.append((pk,None))
+    return rotated
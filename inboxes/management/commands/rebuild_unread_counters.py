@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from inboxes.unread import rebuild_unread_counters
+
+
+class Command(BaseCommand):
+    help = 'Recount the unread messages of every conversation membership in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size',type=int,default=1000)
+
+    def handle(self, *args, **options):
+        total=rebuild_unread_counters(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Unread counters rebuilt for {total} memberships.'))
@@ -0,0 +1,91 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from inboxes.crypto import init_rotation_worker, rotate_tokens
+from inboxes.models import Message
+
+
+class Command(BaseCommand):
+    help = 'Re-encrypt every message with the first of ENCRYPT_KEYS, resuming from a checkpoint.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size',type=int,default=1000)
+        parser.add_argument('--workers',type=int,default=os.cpu_count() or 1,help='Worker processes, 0 rotates in this process.')
+        parser.add_argument('--checkpoint',default='rotate_message_keys.checkpoint',help='File keeping the last rotated message id.')
+        parser.add_argument('--restart',action='store_true',help='Ignore the checkpoint and start from the first message.')
+
+    def read_checkpoint(self, path):
+        if not os.path.exists(path):
+            return 0
+        with open(path) as checkpoint:
+            return int(checkpoint.read().strip() or 0)
+
+    def write_checkpoint(self, path, last_id):
+        with open(f'{path}.tmp','w') as checkpoint:
+            checkpoint.write(str(last_id))
+        os.replace(f'{path}.tmp',path)
+
+    def batches(self, last_id, batch_size):
+        # Streams on a server-side cursor, only the batches in flight are in memory
+        rows=Message.objects.filter(id__gt=last_id).order_by('id').values_list('id','text').iterator(chunk_size=batch_size)
+        batch=[]
+        for row in rows:
+            batch.append(row)
+            if len(batch) == batch_size:
+                yield batch
+                batch=[]
+        if batch:
+            yield batch
+
+    def save(self, rotated, batch_size):
+        messages=[Message(id=pk,text=text) for pk,text in rotated if text is not None]
+        Message.objects.bulk_update(messages,['text'],batch_size=batch_size)
+        return len(messages),len(rotated)-len(messages)
+
+    def handle(self, *args, **options):
+        keys=[key for key in settings.ENCRYPT_KEYS if key]
+        batch_size=options['batch_size']
+        workers=options['workers']
+        path=options['checkpoint']
+
+        last_id=0 if options['restart'] else self.read_checkpoint(path)
+        if last_id:
+            self.stdout.write(f'Resuming after message {last_id}.')
+        if len(keys) < 2:
+            self.stdout.write(self.style.WARNING('Only one key configured, messages are re-encrypted with the same key.'))
+
+        rotated=0
+        unreadable=0
+
+        def finish(last,result):
+            nonlocal rotated,unreadable
+            saved,skipped=self.save(result,batch_size)
+            rotated+=saved
+            unreadable+=skipped
+            self.write_checkpoint(path,last)
+            self.stdout.write(f'{rotated} messages rotated...')
+
+        if workers == 0:
+            init_rotation_worker(keys)
+            for batch in self.batches(last_id,batch_size):
+                finish(batch[-1][0],rotate_tokens(batch))
+        else:
+            # Batches are saved in order, so the checkpoint never passes an unsaved batch
+            with ProcessPoolExecutor(max_workers=workers,initializer=init_rotation_worker,initargs=(keys,)) as executor:
+                pending=deque()
+                for batch in self.batches(last_id,batch_size):
+                    pending.append((batch[-1][0],executor.submit(rotate_tokens,batch)))
+                    if len(pending) >= workers*2:
+                        last,future=pending.popleft()
+                        finish(last,future.result())
+                while pending:
+                    last,future=pending.popleft()
+                    finish(last,future.result())
+
+        if unreadable:
+            self.stdout.write(self.style.WARNING(f'{unreadable} messages could not be decrypted with any key and were left as they are.'))
+        self.stdout.write(self.style.SUCCESS(f'Rotated {rotated} messages.'))
@@ -0,0 +1,57 @@
+# Generated by Django 6.0.2 on 2026-10-18 09:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inboxes', '0003_alter_conversation_id_alter_conversation_is_seen_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # The auto-created participants table becomes the Membership model in place
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='Membership',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to='inboxes.conversation', verbose_name='Conversation')),
+                        ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to=settings.AUTH_USER_MODEL, verbose_name='User')),
+                    ],
+                    options={
+                        'db_table': 'inboxes_conversation_participants',
+                        'unique_together': {('conversation', 'user')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='conversation',
+                    name='participants',
+                    field=models.ManyToManyField(related_name='conversations', through='inboxes.Membership', to=settings.AUTH_USER_MODEL, verbose_name='Participants'),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='membership',
+            name='last_read_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Last Read At'),
+        ),
+        migrations.AddField(
+            model_name='membership',
+            name='last_read_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='inboxes.message', verbose_name='Last Read Message'),
+        ),
+        migrations.AddField(
+            model_name='membership',
+            name='unread_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Unread Count'),
+        ),
+        migrations.AddIndex(
+            model_name='membership',
+            index=models.Index(fields=['user', 'unread_count'], name='inbox_membership_unread_idx'),
+        ),
+    ]
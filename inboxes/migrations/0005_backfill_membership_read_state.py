@@ -0,0 +1,60 @@
+# Generated by Django 6.0.2 on 2026-10-18 09:00
+
+from django.db import migrations
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+BATCH_SIZE = 5000
+
+
+def backfill_read_state(apps, schema_editor):
+    Conversation = apps.get_model('inboxes', 'Conversation')
+    Membership = apps.get_model('inboxes', 'Membership')
+    Message = apps.get_model('inboxes', 'Message')
+
+    # Seen conversations were read up to their last message, unseen ones
+    # up to the last message the member sent there
+    seen_at = Conversation.objects.filter(pk=OuterRef('conversation')).values('lastmessage_created')[:1]
+    replied_at = Message.objects.filter(
+        conversation=OuterRef('conversation'),
+        sender=OuterRef('user'),
+    ).order_by('-created_at').values('created_at')[:1]
+    unread = Message.objects.filter(
+        conversation=OuterRef('conversation'),
+        created_at__gt=OuterRef('last_read_at'),
+    ).exclude(sender=OuterRef('user')).order_by().values('conversation').annotate(count=Count('id')).values('count')
+    never_read = Message.objects.filter(
+        conversation=OuterRef('conversation'),
+    ).exclude(sender=OuterRef('user')).order_by().values('conversation').annotate(count=Count('id')).values('count')
+
+    last_id = 0
+    while True:
+        ids = list(Membership.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:BATCH_SIZE])
+        if not ids:
+            break
+
+        batch = Membership.objects.filter(id__in=ids)
+        batch.filter(conversation__is_seen=True).update(last_read_at=Subquery(seen_at))
+        batch.filter(conversation__is_seen=False).update(last_read_at=Subquery(replied_at))
+        batch.filter(conversation__is_seen=False, last_read_at__isnull=False).update(unread_count=Coalesce(Subquery(unread), 0))
+        batch.filter(conversation__is_seen=False, last_read_at__isnull=True).update(unread_count=Coalesce(Subquery(never_read), 0))
+
+        last_id = ids[-1]
+
+
+def restore_is_seen(apps, schema_editor):
+    Conversation = apps.get_model('inboxes', 'Conversation')
+    Conversation.objects.filter(memberships__unread_count__gt=0).update(is_seen=False)
+    Conversation.objects.exclude(memberships__unread_count__gt=0).update(is_seen=True)
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('inboxes', '0004_membership'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_read_state, restore_is_seen),
+    ]
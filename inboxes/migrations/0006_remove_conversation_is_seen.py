@@ -0,0 +1,17 @@
+# Generated by Django 6.0.2 on 2026-10-18 09:00
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inboxes', '0005_backfill_membership_read_state'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='conversation',
+            name='is_seen',
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-18 09:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inboxes', '0006_remove_conversation_is_seen'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='pair_key',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, verbose_name='Pair Key'),
+        ),
+    ]
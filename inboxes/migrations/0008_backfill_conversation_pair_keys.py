@@ -0,0 +1,81 @@
+# Generated by Django 6.0.2 on 2026-10-18 09:20
+
+from collections import defaultdict
+
+from django.db import migrations, transaction
+
+BATCH_SIZE = 1000
+
+
+def merge_conversation(apps, conversation, duplicate):
+    Conversation = apps.get_model('inboxes', 'Conversation')
+    Membership = apps.get_model('inboxes', 'Membership')
+    Message = apps.get_model('inboxes', 'Message')
+
+    Message.objects.filter(conversation_id=duplicate.pk).update(conversation_id=conversation.pk)
+
+    # Unread messages of both copies add up, the later read position wins
+    kept = {membership.user_id: membership for membership in Membership.objects.filter(conversation_id=conversation.pk)}
+    for membership in Membership.objects.filter(conversation_id=duplicate.pk):
+        target = kept.get(membership.user_id)
+        if target is None:
+            Membership.objects.filter(pk=membership.pk).update(conversation_id=conversation.pk)
+            continue
+
+        target.unread_count += membership.unread_count
+        if membership.last_read_at and (target.last_read_at is None or membership.last_read_at > target.last_read_at):
+            target.last_read_at = membership.last_read_at
+            target.last_read_message_id = membership.last_read_message_id
+        target.save(update_fields=['unread_count', 'last_read_at', 'last_read_message'])
+
+    if duplicate.lastmessage_created > conversation.lastmessage_created:
+        Conversation.objects.filter(pk=conversation.pk).update(lastmessage_created=duplicate.lastmessage_created)
+    Conversation.objects.filter(pk=duplicate.pk).delete()
+
+
+def backfill_pair_keys(apps, schema_editor):
+    Conversation = apps.get_model('inboxes', 'Conversation')
+    Membership = apps.get_model('inboxes', 'Membership')
+
+    last_pk = None
+    while True:
+        conversations = Conversation.objects.order_by('pk')
+        if last_pk is not None:
+            conversations = conversations.filter(pk__gt=last_pk)
+        conversations = list(conversations[:BATCH_SIZE])
+        if not conversations:
+            break
+
+        members = defaultdict(set)
+        for conversation_id, user_id in Membership.objects.filter(
+            conversation_id__in=[conversation.pk for conversation in conversations],
+        ).values_list('conversation_id', 'user_id'):
+            members[conversation_id].add(user_id)
+
+        with transaction.atomic():
+            for conversation in conversations:
+                # Only direct conversations get a key, the others keep a NULL pair_key
+                user_ids = sorted(members[conversation.pk])
+                if len(user_ids) != 2:
+                    continue
+
+                pair_key = ':'.join(str(pk) for pk in user_ids)
+                existing = Conversation.objects.filter(pair_key=pair_key).first()
+                if existing is None:
+                    Conversation.objects.filter(pk=conversation.pk).update(pair_key=pair_key)
+                else:
+                    merge_conversation(apps, existing, conversation)
+
+        last_pk = conversations[-1].pk
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('inboxes', '0007_conversation_pair_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_pair_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-18 09:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inboxes', '0008_backfill_conversation_pair_keys'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='conversation',
+            name='pair_key',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, unique=True, verbose_name='Pair Key'),
+        ),
+    ]
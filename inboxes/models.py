@@ -1,6 +1,6 @@
 import uuid
 
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.utils import timezone
 from django.utils.timesince import timesince
@@ -8,9 +8,10 @@ from django.utils.translation import gettext_lazy as _
 
 class Conversation(models.Model):
     id=models.UUIDField(primary_key=True, default=uuid.uuid4,unique=True, editable=False,verbose_name=_('ID'))
-    participants=models.ManyToManyField(settings.AUTH_USER_MODEL,related_name='conversations',verbose_name=_('Participants'))
+    participants=models.ManyToManyField(settings.AUTH_USER_MODEL,through='Membership',related_name='conversations',verbose_name=_('Participants'))
     lastmessage_created=models.DateTimeField(default=timezone.now,verbose_name=_('Last Message Created'))
-    is_seen = models.BooleanField(default=False,verbose_name=_('Is Seen'))
+    # Sorted participant ids of a direct conversation, empty for groups
+    pair_key=models.CharField(max_length=64,null=True,blank=True,unique=True,editable=False,verbose_name=_('Pair Key'))
 
     class Meta:
         ordering = ['-lastmessage_created']
@@ -19,6 +20,24 @@ class Conversation(models.Model):
         user_names=", ".join(user.username for user in self.participants.all())
         return f'[{user_names}]'
 
+    @staticmethod
+    def make_pair_key(user_id,other_id):
+        return ':'.join(str(pk) for pk in sorted((user_id,other_id)))
+
+    @classmethod
+    def get_or_create_direct(cls,user,other):
+        pair_key=cls.make_pair_key(user.pk,other.pk)
+        conversation=cls.objects.filter(pair_key=pair_key).first()
+        if conversation is not None:
+            return conversation,False
+
+        # The unique pair key makes concurrent creates collapse into one conversation
+        with transaction.atomic():
+            conversation,created=cls.objects.get_or_create(pair_key=pair_key)
+            if created:
+                conversation.participants.add(user,other)
+        return conversation,created
+
 class Message(models.Model):
     sender=models.ForeignKey(settings.AUTH_USER_MODEL,on_delete=models.CASCADE,related_name='sent_message',verbose_name=_('Sender'))
     conversation=models.ForeignKey(Conversation,on_delete=models.CASCADE,related_name='messages',verbose_name=_('Conversation'))
@@ -27,9 +46,24 @@ class Message(models.Model):
 
     class Meta:
         ordering = ['created_at']
+        indexes=[models.Index(fields=['conversation','created_at','id'],name='inbox_message_history_idx')]
 
     def __str__(self):
         time_since=timesince(self.created_at,timezone.now())
         return f'[{self.sender.username} : {time_since} ago]'
 
+class Membership(models.Model):
+    conversation=models.ForeignKey(Conversation,on_delete=models.CASCADE,related_name='memberships',verbose_name=_('Conversation'))
+    user=models.ForeignKey(settings.AUTH_USER_MODEL,on_delete=models.CASCADE,related_name='memberships',verbose_name=_('User'))
+    last_read_at=models.DateTimeField(null=True,blank=True,verbose_name=_('Last Read At'))
+    last_read_message=models.ForeignKey(Message,null=True,blank=True,on_delete=models.SET_NULL,related_name='+',verbose_name=_('Last Read Message'))
+    unread_count=models.PositiveIntegerField(default=0,verbose_name=_('Unread Count'))
 
+    class Meta:
+        # Keeps the table of the former auto-created participants relation
+        db_table='inboxes_conversation_participants'
+        unique_together=('conversation','user')
+        indexes=[models.Index(fields=['user','unread_count'],name='inbox_membership_unread_idx')]
+
+    def __str__(self):
+        return f'[{self.user_id} : {self.unread_count}]'
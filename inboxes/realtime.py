@@ -0,0 +1,142 @@
+import asyncio
+import json
+import threading
+from collections import defaultdict
+from contextlib import asynccontextmanager
+
+from django.conf import settings
+from django.template.loader import render_to_string
+from django.utils.module_loading import import_string
+
+QUEUE_SIZE=100
+KEEPALIVE=15
+
+broker=None
+
+
+# Pub/sub between the threads that send messages and the event streams of
+# one ASGI process. Several processes need RedisBroker, configured through
+# INBOX_BROKER.
+class LocalBroker:
+    # Pushes of the other processes would never arrive, so outside
+    # development the chats poll instead
+    shared=False
+
+    def __init__(self):
+        self.lock=threading.Lock()
+        self.channels=defaultdict(set)
+
+    @asynccontextmanager
+    async def subscribe(self,channel):
+        subscriber=(asyncio.get_running_loop(),asyncio.Queue(QUEUE_SIZE))
+        with self.lock:
+            self.channels[channel].add(subscriber)
+        try:
+            yield subscriber[1]
+        finally:
+            with self.lock:
+                self.channels[channel].discard(subscriber)
+                if not self.channels[channel]:
+                    del self.channels[channel]
+
+    def has_subscribers(self,channel):
+        return channel in self.channels
+
+    def publish(self,channel,payload):
+        with self.lock:
+            subscribers=list(self.channels.get(channel,()))
+        for loop,queue in subscribers:
+            loop.call_soon_threadsafe(deliver,queue,payload)
+        return len(subscribers)
+
+
+# Pub/sub over redis channels, reaches the event streams of every process
+class RedisBroker:
+    shared=True
+
+    def __init__(self):
+        import redis
+
+        self.url=settings.INBOX_REDIS_URL
+        self.client=redis.Redis.from_url(self.url)
+        # Created in the event loop of the first stream
+        self.async_client=None
+
+    @asynccontextmanager
+    async def subscribe(self,channel):
+        import redis.asyncio
+
+        if self.async_client is None:
+            self.async_client=redis.asyncio.Redis.from_url(self.url)
+
+        queue=asyncio.Queue(QUEUE_SIZE)
+        pubsub=self.async_client.pubsub(ignore_subscribe_messages=True)
+        await pubsub.subscribe(channel)
+
+        async def listen():
+            async for message in pubsub.listen():
+                deliver(queue,json.loads(message['data']))
+
+        listener=asyncio.create_task(listen())
+        try:
+            yield queue
+        finally:
+            listener.cancel()
+            await pubsub.unsubscribe(channel)
+            await pubsub.aclose()
+
+    def has_subscribers(self,channel):
+        return any(count for _,count in self.client.pubsub_numsub(channel))
+
+    def publish(self,channel,payload):
+        return self.client.publish(channel,json.dumps(payload))
+
+
+def deliver(queue,payload):
+    # A client that stopped reading loses pushes, it reloads on reconnect
+    try:
+        queue.put_nowait(payload)
+    except asyncio.QueueFull:
+        pass
+
+def get_broker():
+    global broker
+    if broker is None:
+        broker=import_string(settings.INBOX_BROKER)()
+    return broker
+
+def realtime_enabled():
+    # A broker of one process only serves development, elsewhere chats fall back to polling
+    return settings.INBOX_REALTIME and (settings.DEBUG or get_broker().shared)
+
+def conversation_channel(conversation_id):
+    return f'inboxes:conversation:{conversation_id}'
+
+def publish_message(message):
+    if not realtime_enabled():
+        return 0
+
+    channel=conversation_channel(message.conversation_id)
+    if not get_broker().has_subscribers(channel):
+        return 0
+
+    html=render_to_string('inboxes/income_message.html',{'message':message})
+    return get_broker().publish(channel,{'sender_id':message.sender_id,'html':html})
+
+def format_event(event,html):
+    lines=''.join(f'data: {line}\n' for line in html.splitlines())
+    return f'event: {event}\n{lines}\n'
+
+async def message_events(conversation_id,user_id):
+    async with get_broker().subscribe(conversation_channel(conversation_id)) as queue:
+        yield ': connected\n\n'
+        while True:
+            try:
+                payload=await asyncio.wait_for(queue.get(),KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+
+            # The sender already got the fragment in the response to the send
+            if payload['sender_id'] != user_id:
+                yield format_event('message',payload['html'])
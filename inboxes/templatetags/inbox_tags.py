@@ -1,11 +1,8 @@
 from django import template
 
-from cryptography.fernet import Fernet
-
-from jnestagram.settings import env
+from inboxes.crypto import decrypt as decrypt_text
 
 register = template.Library()
-f=Fernet(env('ENCRYPT_KEY'))
 
 @register.filter
 def short_username(value):
@@ -19,5 +16,4 @@ def short_username(value):
 def decrypt(value):
     if not value:
         return ""
-    decrypt_message=f.decrypt(value)
-    return decrypt_message.decode("utf-8")
\ No newline at end of file
+    return decrypt_text(value)
\ No newline at end of file
@@ -1,3 +1,374 @@
-from django.test import TestCase
+import asyncio
+import os
+import tempfile
+from io import StringIO
 
-# Create your tests here.
+from cryptography.fernet import Fernet
+
+from importlib import import_module
+from types import SimpleNamespace
+
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.db import connection
+from django.test import TestCase,RequestFactory,AsyncRequestFactory,override_settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.http import Http404
+from django.urls import reverse
+
+from .context_processors import inbox_messages_count
+from .crypto import encrypt,decrypt_many,get_fernet,plaintexts,stats,CACHE_SIZE
+from .models import Conversation,Membership,Message
+from .realtime import LocalBroker,publish_message,realtime_enabled
+from .views import ConversationEventsView
+from .unread import unread_count
+
+User = get_user_model()
+
+
+class InboxTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice=User.objects.create_user(username='alice',password='testpassword')
+        self.bob=User.objects.create_user(username='bob',password='testpassword')
+
+    def send(self,sender,recipient,text='Hello'):
+        self.client.force_login(sender)
+        self.client.post(reverse('inbox_newmessage',args=[recipient.id]),{'message':text})
+
+    def test_counter_follows_messages(self):
+        self.send(self.alice,self.bob)
+        self.send(self.alice,self.bob)
+        self.assertEqual(unread_count(self.bob.id),1)
+        self.assertEqual(unread_count(self.alice.id),0)
+
+        conversation=Conversation.objects.get()
+        membership=Membership.objects.get(conversation=conversation,user=self.bob)
+        self.assertEqual(membership.unread_count,2)
+        self.client.force_login(self.bob)
+        self.client.get(reverse('chats',args=[conversation.pk]))
+        self.assertEqual(unread_count(self.bob.id),0)
+        membership.refresh_from_db()
+        self.assertEqual(membership.last_read_message,conversation.messages.last())
+
+        self.send(self.bob,self.alice)
+        self.assertEqual(unread_count(self.alice.id),1)
+
+        self.send(self.alice,self.bob)
+        self.assertEqual(unread_count(self.alice.id),0)
+        self.assertEqual(unread_count(self.bob.id),1)
+
+    def test_badge_reads_memberships(self):
+        self.send(self.alice,self.bob)
+        request=RequestFactory().get('/')
+        request.user=self.bob
+
+        with self.assertNumQueries(1):
+            self.assertEqual(inbox_messages_count(request),{'unread_messages_count':1})
+
+        Membership.objects.filter(user=self.bob).update(unread_count=0)
+        self.assertEqual(inbox_messages_count(request),{'unread_messages_count':0})
+
+    def test_rebuild_command(self):
+        self.send(self.alice,self.bob)
+        self.send(self.alice,self.bob)
+        Membership.objects.filter(user=self.bob).update(unread_count=0)
+        Membership.objects.filter(user=self.alice).update(unread_count=5)
+
+        out=StringIO()
+        call_command('rebuild_unread_counters','--batch-size','1',stdout=out)
+
+        self.assertIn('2 memberships',out.getvalue())
+        self.assertEqual(unread_count(self.bob.id),1)
+        self.assertEqual(unread_count(self.alice.id),0)
+        self.assertEqual(Membership.objects.get(user=self.bob).unread_count,2)
+
+    def test_inbox_lists_unread_state(self):
+        self.send(self.alice,self.bob,'First')
+        self.send(self.bob,self.alice,'Second')
+        self.send(self.alice,self.bob,'Third')
+
+        self.client.force_login(self.bob)
+        response=self.client.get(reverse('inbox'))
+        conversation=response.context['conversations'][0]
+        self.assertEqual(conversation.unread_count,1)
+        self.assertEqual(conversation.other_user,self.alice)
+        self.assertContains(response,'Third')
+
+    def test_direct_conversation_is_found_by_pair_key(self):
+        self.send(self.alice,self.bob)
+        self.send(self.bob,self.alice)
+
+        conversation=Conversation.objects.get()
+        self.assertEqual(conversation.pair_key,f'{self.alice.id}:{self.bob.id}')
+        self.assertEqual(conversation.messages.count(),2)
+
+        with self.assertNumQueries(1):
+            found,created=Conversation.get_or_create_direct(self.bob,self.alice)
+        self.assertEqual(found,conversation)
+        self.assertFalse(created)
+
+
+    def test_pair_key_backfill(self):
+        carol=User.objects.create_user(username='carol',password='testpassword')
+        def conversation(*users):
+            conversation=Conversation.objects.create()
+            conversation.participants.add(*users)
+            return conversation
+        direct,duplicate,alone,group=conversation(self.alice,self.bob),conversation(self.bob,self.alice),conversation(self.alice),conversation(self.alice,self.bob,carol)
+        Message.objects.create(conversation=duplicate,sender=self.bob,text=encrypt('Hello'))
+
+        migration=import_module('inboxes.migrations.0008_backfill_conversation_pair_keys')
+        migration.backfill_pair_keys(apps,SimpleNamespace(connection=connection))
+
+        # The copy with the lower primary key is kept
+        kept=Conversation.objects.get(pair_key=f'{self.alice.id}:{self.bob.id}')
+        self.assertEqual(kept.pk,min(direct.pk,duplicate.pk))
+        self.assertEqual(Conversation.objects.filter(pk__in=[direct.pk,duplicate.pk]).count(),1)
+        self.assertEqual(kept.messages.count(),1)
+        self.assertEqual(set(Conversation.objects.filter(pair_key__isnull=True).values_list('pk',flat=True)),{alone.pk,group.pk})
+
+
+class ChatHistoryTest(TestCase):
+    def setUp(self):
+        self.alice=User.objects.create_user(username='alice',password='testpassword')
+        self.bob=User.objects.create_user(username='bob',password='testpassword')
+        self.conversation,_=Conversation.get_or_create_direct(self.alice,self.bob)
+        self.messages=Message.objects.bulk_create([
+            Message(conversation=self.conversation,sender=self.alice,text=encrypt(f'Message {index}')) for index in range(35)
+        ])
+        self.client.force_login(self.bob)
+
+    def test_opens_on_newest_page(self):
+        response=self.client.get(reverse('chats',args=[self.conversation.pk]))
+
+        chats=response.context['chats']
+        self.assertEqual(len(chats),30)
+        self.assertEqual(chats[-1],self.messages[-1])
+        self.assertEqual(chats[0],self.messages[5])
+        self.assertTrue(response.context['page_obj'].has_next)
+        self.assertContains(response,'Message 34')
+
+    def test_load_older_messages(self):
+        response=self.client.get(reverse('chats',args=[self.conversation.pk]))
+        cursor=response.context['page_obj'].next_cursor
+
+        response=self.client.get(reverse('chats',args=[self.conversation.pk]),{'cursor':cursor},HTTP_HX_REQUEST='true')
+        self.assertTemplateUsed(response,'partials/inboxes/older_messages.html')
+        self.assertEqual(list(response.context['chats']),self.messages[:5])
+        self.assertFalse(response.context['page_obj'].has_next)
+
+    def test_send_returns_only_new_message(self):
+        response=self.client.post(reverse('inbox_newmessage',args=[self.alice.id]),{'message':'Hi there'},HTTP_HX_REQUEST='true')
+
+        self.assertTemplateUsed(response,'inboxes/outcome_message.html')
+        self.assertTemplateNotUsed(response,'inboxes/message_list.html')
+        self.assertContains(response,'Hi there')
+
+    def test_other_users_can_not_read(self):
+        carol=User.objects.create_user(username='carol',password='testpassword')
+        self.client.force_login(carol)
+
+        response=self.client.get(reverse('chats',args=[self.conversation.pk]))
+        self.assertEqual(response.status_code,404)
+
+
+class MessageDecryptionTest(TestCase):
+    def setUp(self):
+        plaintexts.clear()
+
+    def test_batch_reuses_plaintext(self):
+        tokens=[encrypt('Hello'),encrypt('Salam'),'']
+        tokens.append(tokens[0])
+
+        self.assertEqual(decrypt_many(tokens),['Hello','Salam','','Hello'])
+        self.assertEqual(stats()['misses'],3)
+
+        self.assertEqual(decrypt_many(tokens[:2]),['Hello','Salam'])
+        self.assertEqual(stats()['hits'],2)
+
+    @override_settings(MESSAGE_DECRYPT_WORKERS=2)
+    def test_thread_pool(self):
+        tokens=[encrypt(f'Message {index}') for index in range(10)]
+        self.assertEqual(decrypt_many(tokens),[f'Message {index}' for index in range(10)])
+
+    def test_cache_is_bounded(self):
+        plaintexts.size=2
+        try:
+            decrypt_many([encrypt('a'),encrypt('b'),encrypt('c')])
+            self.assertEqual(stats()['size'],2)
+            self.assertEqual(stats()['evictions'],1)
+        finally:
+            plaintexts.size=CACHE_SIZE
+
+
+class RotateMessageKeysTest(TestCase):
+    def setUp(self):
+        self.old_key=Fernet.generate_key().decode()
+        self.new_key=Fernet.generate_key().decode()
+        alice=User.objects.create_user(username='alice',password='testpassword')
+        bob=User.objects.create_user(username='bob',password='testpassword')
+        conversation,_=Conversation.get_or_create_direct(alice,bob)
+
+        with override_settings(ENCRYPT_KEYS=[self.old_key]):
+            self.messages=Message.objects.bulk_create([
+                Message(conversation=conversation,sender=alice,text=encrypt(f'Message {index}')) for index in range(5)
+            ])
+
+        self.directory=tempfile.TemporaryDirectory()
+        self.checkpoint=os.path.join(self.directory.name,'checkpoint')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def rotate(self,*args):
+        out=StringIO()
+        with override_settings(ENCRYPT_KEYS=[self.new_key,self.old_key]):
+            call_command('rotate_message_keys','--batch-size','2','--checkpoint',self.checkpoint,*args,stdout=out)
+        return out.getvalue()
+
+    def readable_with_new_key(self):
+        new=get_fernet([self.new_key])
+        readable=[]
+        for message in Message.objects.order_by('id'):
+            try:
+                readable.append(new.decrypt(message.text.encode()).decode())
+            except Exception:
+                readable.append(None)
+        return readable
+
+    def test_rotates_all_messages(self):
+        output=self.rotate('--workers','0')
+
+        self.assertIn('Rotated 5 messages',output)
+        self.assertEqual(self.readable_with_new_key(),[f'Message {index}' for index in range(5)])
+        with open(self.checkpoint) as checkpoint:
+            self.assertEqual(int(checkpoint.read()),self.messages[-1].id)
+
+    def test_resumes_from_checkpoint(self):
+        with open(self.checkpoint,'w') as checkpoint:
+            checkpoint.write(str(self.messages[2].id))
+
+        output=self.rotate('--workers','0')
+
+        self.assertIn('Rotated 2 messages',output)
+        self.assertEqual(self.readable_with_new_key(),[None,None,None,'Message 3','Message 4'])
+
+    def test_process_pool(self):
+        output=self.rotate('--workers','2','--restart')
+
+        self.assertIn('Rotated 5 messages',output)
+        self.assertEqual(self.readable_with_new_key(),[f'Message {index}' for index in range(5)])
+
+
+@override_settings(DEBUG=True,INBOX_REALTIME=True)
+class RealtimeTest(TestCase):
+    def setUp(self):
+        self.alice=User.objects.create_user(username='alice',password='testpassword')
+        self.bob=User.objects.create_user(username='bob',password='testpassword')
+        self.conversation,_=Conversation.get_or_create_direct(self.alice,self.bob)
+
+    async def events(self,user):
+        request=AsyncRequestFactory().get(reverse('chats_events',args=[self.conversation.pk]))
+        async def auser():
+            return user
+        request.auser=auser
+        return await ConversationEventsView.as_view()(request,pk=self.conversation.pk)
+
+    async def test_broker_delivers_across_threads(self):
+        broker=LocalBroker()
+        async with broker.subscribe('channel') as queue:
+            self.assertEqual(await asyncio.to_thread(broker.publish,'channel',{'html':'Hi'}),1)
+            self.assertEqual(await asyncio.wait_for(queue.get(),1),{'html':'Hi'})
+        self.assertFalse(broker.has_subscribers('channel'))
+
+    async def test_new_message_is_pushed(self):
+        response=await self.events(self.bob)
+        self.assertEqual(response['Content-Type'],'text/event-stream')
+
+        stream=aiter(response.streaming_content)
+        self.assertEqual(await anext(stream),b': connected\n\n')
+
+        message=Message(conversation=self.conversation,sender=self.alice,text='')
+        message.plaintext='Pushed hello'
+        self.assertEqual(await sync_to_async(publish_message)(message),1)
+
+        event=await asyncio.wait_for(anext(stream),1)
+        self.assertTrue(event.startswith(b'event: message\n'))
+        self.assertIn(b'Pushed hello',event)
+        await stream.aclose()
+
+    async def test_local_broker_polls_without_debug(self):
+        with override_settings(DEBUG=False):
+            self.assertFalse(realtime_enabled())
+            with self.assertRaises(Http404):
+                await self.events(self.bob)
+
+    async def test_stream_needs_realtime(self):
+        with override_settings(INBOX_REALTIME=False):
+            with self.assertRaises(Http404):
+                await self.events(self.bob)
+
+    async def test_only_participants_can_listen(self):
+        carol=await User.objects.acreate(username='carol')
+        with self.assertRaises(Http404):
+            await self.events(carol)
+
+
+class MessagePollTest(TestCase):
+    def setUp(self):
+        self.alice=User.objects.create_user(username='alice',password='testpassword')
+        self.bob=User.objects.create_user(username='bob',password='testpassword')
+        self.conversation,_=Conversation.get_or_create_direct(self.alice,self.bob)
+        self.client.force_login(self.bob)
+
+    def send(self,sender,text):
+        return Message.objects.create(conversation=self.conversation,sender=sender,text=encrypt(text))
+
+    def poll(self,cursor=None):
+        url=reverse('chats_new',args=[self.conversation.pk])
+        return self.client.get(url,{'cursor':cursor} if cursor else {},headers={'hx-request':'true'})
+
+    def test_chat_polls_without_realtime(self):
+        response=self.client.get(reverse('chats',args=[self.conversation.pk]))
+
+        self.assertNotContains(response,'sse-connect')
+        self.assertContains(response,reverse('chats_new',args=[self.conversation.pk]))
+
+    @override_settings(DEBUG=True,INBOX_REALTIME=True)
+    def test_chat_streams_with_realtime(self):
+        response=self.client.get(reverse('chats',args=[self.conversation.pk]))
+
+        self.assertContains(response,'sse-connect')
+        self.assertNotContains(response,'message-poll')
+
+    @override_settings(DEBUG=False,INBOX_REALTIME=True)
+    def test_chat_polls_without_shared_broker(self):
+        response=self.client.get(reverse('chats',args=[self.conversation.pk]))
+
+        self.assertNotContains(response,'sse-connect')
+        self.assertContains(response,reverse('chats_new',args=[self.conversation.pk]))
+
+    def test_poll_returns_messages_after_cursor(self):
+        self.send(self.alice,'Seen before')
+        response=self.client.get(reverse('chats',args=[self.conversation.pk]))
+        cursor=response.context['poll_cursor']
+
+        self.send(self.alice,'Polled hello')
+        self.send(self.bob,'Own reply')
+        response=self.poll(cursor)
+
+        self.assertContains(response,'Polled hello')
+        self.assertNotContains(response,'Seen before')
+        self.assertNotContains(response,'Own reply')
+        self.assertNotEqual(response.context['poll_cursor'],cursor)
+        self.assertNotContains(self.poll(response.context['poll_cursor']),'hx-swap-oob')
+
+    def test_poll_marks_messages_read(self):
+        self.send(self.alice,'Hello')
+        Membership.objects.filter(user=self.bob).update(unread_count=1)
+
+        self.assertContains(self.poll(),'Hello')
+        self.assertEqual(unread_count(self.bob.id),0)
@@ -0,0 +1,50 @@
+from django.db.models import F,Count,OuterRef,Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Membership,Message
+
+
+def unread_count(user_id):
+    # Conversations with unread messages, counted on the (user, unread_count) index
+    return Membership.objects.filter(user_id=user_id,unread_count__gt=0).count()
+
+def record_message(message):
+    memberships=Membership.objects.filter(conversation_id=message.conversation_id)
+    memberships.exclude(user_id=message.sender_id).update(unread_count=F('unread_count')+1)
+    memberships.filter(user_id=message.sender_id).update(
+        unread_count=0,
+        last_read_at=message.created_at,
+        last_read_message=message,
+    )
+
+def mark_read(conversation,user):
+    last_message=Message.objects.filter(conversation=conversation).order_by('-created_at','-id').values('id')[:1]
+    updated=Membership.objects.filter(conversation=conversation,user=user,unread_count__gt=0).update(
+        unread_count=0,
+        last_read_at=timezone.now(),
+        last_read_message_id=Subquery(last_message),
+    )
+    return bool(updated)
+
+def rebuild_unread_counters(batch_size=1000):
+    # Messages from the other participants after the member last read the conversation
+    received=Message.objects.filter(conversation=OuterRef('conversation')).exclude(sender=OuterRef('user'))
+    def count(messages):
+        return Coalesce(Subquery(messages.order_by().values('conversation').annotate(count=Count('id')).values('count')),0)
+
+    last_id=0
+    total=0
+    while True:
+        ids=list(Membership.objects.filter(id__gt=last_id).order_by('id').values_list('id',flat=True)[:batch_size])
+        if not ids:
+            break
+
+        batch=Membership.objects.filter(id__in=ids)
+        batch.filter(last_read_at__isnull=True).update(unread_count=count(received))
+        batch.filter(last_read_at__isnull=False).update(unread_count=count(received.filter(created_at__gt=OuterRef('last_read_at'))))
+
+        last_id=ids[-1]
+        total+=len(ids)
+
+    return total
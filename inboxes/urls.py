@@ -1,10 +1,12 @@
 from django.urls import path
 
-from .views import ConversationListView,ChatsListView, SearchUsersView, NewMessageView
+from .views import ConversationListView,ChatsListView, SearchUsersView, NewMessageView, ConversationEventsView, NewMessagesView
 
 urlpatterns = [
     path('inbox/', ConversationListView.as_view(), name='inbox'),
     path('chats/<uuid:pk>/',ChatsListView.as_view(), name='chats'),
+    path('chats/<uuid:pk>/events/',ConversationEventsView.as_view(), name='chats_events'),
+    path('chats/<uuid:pk>/new/',NewMessagesView.as_view(), name='chats_new'),
     path('search-users/', SearchUsersView.as_view(), name='inbox_search_users'),
     path('new-message/<int:recipient_id>', NewMessageView.as_view(), name='inbox_newmessage'),
 ]
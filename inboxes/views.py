@@ -2,16 +2,18 @@ from django.contrib.auth import get_user_model
 from django.shortcuts import render, get_object_or_404, redirect
 from django.views.generic import ListView, View
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.http import HttpResponse, Http404
-from django.db.models import Q
+from django.http import HttpResponse, Http404, StreamingHttpResponse
+from django.db.models import F, OuterRef, Subquery
 from django.utils import timezone
-from cryptography.fernet import Fernet
 
-from .models import Conversation, Message
-from jnestagram.settings import env
+from .models import Conversation, Message, Membership
+from .unread import mark_read, record_message
+from .crypto import encrypt, decrypt_many, decrypt_messages
+from .realtime import publish_message, message_events, realtime_enabled
+from profiles.search import search_users
+from jnestagram.pagination import KeysetPaginator, encode_cursor
 
 User = get_user_model()
-f=Fernet(env('ENCRYPT_KEY'))
 
 
 class ConversationListView(LoginRequiredMixin, ListView):
@@ -20,8 +22,12 @@ class ConversationListView(LoginRequiredMixin, ListView):
     context_object_name = 'conversations'
 
     def get_queryset(self):
+        last_message = Message.objects.filter(conversation=OuterRef('pk')).order_by('-created_at', '-id')
         return Conversation.objects.filter(
-            participants=self.request.user
+            memberships__user=self.request.user
+        ).annotate(
+            unread_count=F('memberships__unread_count'),
+            last_message_text=Subquery(last_message.values('text')[:1]),
         ).prefetch_related('participants').order_by('-lastmessage_created')
 
 
@@ -31,23 +37,18 @@ class ConversationListView(LoginRequiredMixin, ListView):
         active_pk = self.request.GET.get('pk')
 
         conversations = list(context['conversations'])
+        previews = decrypt_many([conv.last_message_text for conv in conversations])
 
-        for conv in conversations:
+        for conv, preview in zip(conversations, previews):
+            conv.last_message_preview = preview
             all_participants = conv.participants.all()
             conv.other_user = next((u for u in all_participants if u.id != self.request.user.id), None)
 
             if active_pk and str(conv.id) == active_pk:
-                if conv.is_seen == False and conv.messages.last().sender != self.request.user:
-                    conv.is_seen = True
-                    conv.save()
-
-                # Decrypting
-                inbox_messages=Message.objects.filter(conversation=conv).select_related('sender').order_by(
-                    'created_at')
-
+                if mark_read(conv, self.request.user):
+                    conv.unread_count = 0
 
                 context['conversation'] = conv
-                context['inbox_messages'] = inbox_messages
 
         context['conversations'] = conversations
         return context
@@ -55,32 +56,76 @@ class ConversationListView(LoginRequiredMixin, ListView):
 class ChatsListView(LoginRequiredMixin, ListView):
     model = Message
     template_name = 'inboxes/chats.html'
+    context_object_name = 'chats'
+    paginate_by = 30
+
+    def get(self, request, *args, **kwargs):
+        self.conversation = get_object_or_404(Conversation, pk=self.kwargs['pk'], participants=request.user)
+        return super().get(request, *args, **kwargs)
 
     def get_queryset(self):
         return Message.objects.filter(
-            conversation=self.kwargs['pk']
-        ).select_related('sender').order_by('created_at')
+            conversation=self.conversation
+        ).select_related('sender__profile')
+
+    def is_older_request(self):
+        return bool(self.request.htmx and self.request.GET.get('cursor'))
+
+    def paginate_queryset(self, queryset, page_size):
+        # Newest page first on the (conversation, created_at) index, shown oldest first
+        paginator = KeysetPaginator(('-created_at', '-id'), page_size)
+        page = paginator.paginate(queryset, self.request.GET.get('cursor'))
+        page.object_list = decrypt_messages(page.object_list[::-1])
+        return None, page, page.object_list, page.has_next
 
     def get_context_data(self, **kwargs):
         context=super().get_context_data(**kwargs)
         request=self.request
-        conversation_id = self.kwargs.get('pk')
+        conversation = self.conversation
 
-        if conversation_id:
-            conversation = get_object_or_404(Conversation, pk=conversation_id, participants=request.user)
+        if not self.is_older_request():
             conversation.other_user = conversation.participants.exclude(id=request.user.id).first()
+            mark_read(conversation, request.user)
+            context['realtime'] = realtime_enabled()
+            if not context['realtime'] and context['chats']:
+                context['poll_cursor'] = message_cursor(context['chats'][-1])
+
+        context['conversation'] = conversation
+        return context
 
+    def render_to_response(self, context, **response_kwargs):
+        if self.is_older_request():
+            return render(self.request, 'partials/inboxes/older_messages.html', {
+                'chats': context['chats'],
+                'page_obj': context['page_obj'],
+                'conversation': context['conversation'],
+            })
+        return super().render_to_response(context, **response_kwargs)
 
-            if not conversation.is_seen and conversation.messages.exists():
-                last_msg = conversation.messages.last()
-                if last_msg.sender != request.user:
-                    conversation.is_seen = True
-                    conversation.save()
+def message_cursor(message):
+    return encode_cursor((message.created_at, message.id))
 
-            context['conversation'] = conversation
-            context['chats'] = self.get_queryset()
 
-        return context
+class NewMessagesView(LoginRequiredMixin, View):
+    # Polled by open chats when new messages are not pushed over server-sent events
+    template_name = 'partials/inboxes/new_messages.html'
+    page_size = 30
+
+    def get(self, request, pk):
+        conversation = get_object_or_404(Conversation, pk=pk, participants=request.user)
+        messages = Message.objects.filter(conversation=conversation).exclude(sender=request.user).select_related('sender__profile')
+
+        cursor = request.GET.get('cursor')
+        page = KeysetPaginator(('created_at', 'id'), self.page_size).paginate(messages, cursor)
+        if page.object_list:
+            cursor = message_cursor(page.object_list[-1])
+            mark_read(conversation, request.user)
+
+        return render(request, self.template_name, {
+            'chats': decrypt_messages(page.object_list),
+            'conversation': conversation,
+            'poll_cursor': cursor,
+        })
 
 class SearchUsersView(LoginRequiredMixin, ListView):
     model = User
@@ -90,11 +135,7 @@ class SearchUsersView(LoginRequiredMixin, ListView):
         letters = request.GET.get('search_user')
         if request.htmx:
             if len(letters) > 0:
-                users = User.objects.filter(
-                    Q(username__icontains=letters) |
-                    Q(first_name__icontains=letters) |
-                    Q(last_name__icontains=letters)
-                ).exclude(username=request.user.username)
+                users = search_users(letters, exclude=request.user.pk)
                 return render(request, self.template_name, {'users': users})
             else:
                 return HttpResponse('')
@@ -119,34 +160,44 @@ class NewMessageView(LoginRequiredMixin, View):
             message_text = request.POST.get('message')
 
             if message_text:
-                conversation = Conversation.objects.filter(participants=request.user).filter(
-                    participants=recipient).first()
-                if not conversation:
-                    conversation = Conversation.objects.create()
-                    conversation.participants.add(request.user, recipient)
-
-                conversation.other_user = conversation.participants.exclude(id=request.user.id).first()
+                conversation, _ = Conversation.get_or_create_direct(request.user, recipient)
+                conversation.other_user = recipient
 
                 # Encrypting
-                message_encrypted = f.encrypt(message_text.encode('utf-8')).decode('utf-8')
+                message_encrypted = encrypt(message_text)
 
-                Message.objects.create(
+                message = Message.objects.create(
                     conversation=conversation,
                     sender=request.user,
                     text=message_encrypted,
                 )
+                record_message(message)
+                message.plaintext = message_text
+                publish_message(message)
 
                 conversation.lastmessage_created = timezone.now()
-                conversation.is_seen=False
-                conversation.save()
+                conversation.save(update_fields=['lastmessage_created'])
 
-                inbox_messages = conversation.messages.all().order_by('created_at')
                 context={
-                    'chats': inbox_messages,
+                    'message': message,
                     'conversation': conversation,
                 }
 
                 if self.request.htmx:
-                    return render(request, 'inboxes/message_list.html', context)
+                    return render(request, 'inboxes/outcome_message.html', context)
 
                 return redirect(f'/chats/{conversation.pk}/',context)
+
+class ConversationEventsView(View):
+    # Server-sent events of one conversation, served by the ASGI application
+    async def get(self, request, pk):
+        user = await request.auser()
+        if not realtime_enabled() or not user.is_authenticated:
+            raise Http404()
+        if not await Membership.objects.filter(conversation_id=pk, user=user).aexists():
+            raise Http404()
+
+        response = StreamingHttpResponse(message_events(pk, user.id), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
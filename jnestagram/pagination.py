@@ -0,0 +1,96 @@
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.http import Http404
+from django.utils.encoding import force_bytes,force_str
+from django.utils.http import urlsafe_base64_encode,urlsafe_base64_decode
+
+
+def encode_cursor(values):
+    payload=json.dumps([str(value) for value in values])
+    return urlsafe_base64_encode(force_bytes(payload))
+
+def decode_cursor(cursor,size):
+    try:
+        values=json.loads(force_str(urlsafe_base64_decode(cursor)))
+    except (TypeError,ValueError):
+        raise Http404('Invalid cursor')
+
+    if not isinstance(values,list) or len(values)!=size or not all(isinstance(value,str) for value in values):
+        raise Http404('Invalid cursor')
+
+    return values
+
+
+class KeysetPage:
+    def __init__(self,object_list,next_cursor):
+        self.object_list=object_list
+        self.next_cursor=next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+# Cursor pagination over a fixed ordering, e.g. ('-created_at','-id'):
+# every page is an index range scan with LIMIT, without OFFSET or COUNT.
+class KeysetPaginator:
+    def __init__(self,ordering,per_page):
+        self.ordering=ordering
+        self.per_page=per_page
+
+    def get_fields(self):
+        return [(field.lstrip('-'),'lt' if field.startswith('-') else 'gt') for field in self.ordering]
+
+    def get_output_field(self,queryset,name):
+        # Tag feeds order on annotations, everything else on model fields
+        annotation=queryset.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field
+        return queryset.model._meta.get_field(name)
+
+    def parse_values(self,queryset,values):
+        # A well-formed cursor can still carry values of the wrong type
+        try:
+            return [
+                self.get_output_field(queryset,name).to_python(value)
+                for (name,_),value in zip(self.get_fields(),values)
+            ]
+        except (TypeError,ValueError,ValidationError):
+            raise Http404('Invalid cursor')
+
+    def get_filter(self,values):
+        fields=self.get_fields()
+
+        condition=None
+        for index,(name,lookup) in enumerate(fields):
+            step=Q(**{f'{name}__{lookup}':values[index]})
+            for previous,(previous_name,_) in enumerate(fields[:index]):
+                step&=Q(**{previous_name:values[previous]})
+            condition=step if condition is None else condition|step
+
+        # Leading bound keeps the scan on the index range of the first column
+        first_name,first_lookup=fields[0]
+        return Q(**{f'{first_name}__{first_lookup}e':values[0]}) & condition
+
+    def paginate(self,queryset,cursor=None):
+        queryset=queryset.order_by(*self.ordering)
+        if cursor:
+            values=self.parse_values(queryset,decode_cursor(cursor,len(self.ordering)))
+            queryset=queryset.filter(self.get_filter(values))
+
+        object_list=list(queryset[:self.per_page+1])
+        next_cursor=None
+        if len(object_list)>self.per_page:
+            object_list=object_list[:self.per_page]
+            last=object_list[-1]
+            next_cursor=encode_cursor(getattr(last,name) for name,_ in self.get_fields())
+
+        return KeysetPage(object_list,next_cursor)
@@ -31,7 +31,33 @@ STAGING=env('STAGING',default='False')
 
 # Security
 SECRET_KEY = env('SECRET_KEY')
-ENCRYPT_KEY = env('ENCRYPT_KEY')
+ENCRYPT_KEY = env('ENCRYPT_KEY',default='')
+# Message keys, newest first. Messages are encrypted with the first one and
+# decrypted with any of them, so old keys stay until rotate_message_keys ran
+ENCRYPT_KEYS = env.list('ENCRYPT_KEYS',default=[ENCRYPT_KEY])
+
+# Likes
+# Number of counter shards per liked object, 0 updates likes_count in place
+LIKE_COUNTER_SHARDS=env.int('LIKE_COUNTER_SHARDS',default=0)
+
+# Images
+# Largest upload in pixels, JPEGs are decoded reduced to the output size
+IMAGE_MAX_PIXELS=env.int('IMAGE_MAX_PIXELS',default=100_000_000)
+# Formats without reduced decoding are decoded at full size, so they get a lower limit
+IMAGE_MAX_DECODE_PIXELS=env.int('IMAGE_MAX_DECODE_PIXELS',default=25_000_000)
+
+# Inbox
+# Threads decrypting a page of messages, 0 decrypts in the request thread
+MESSAGE_DECRYPT_WORKERS=env.int('MESSAGE_DECRYPT_WORKERS',default=0)
+# Push new messages to open chats over server-sent events. Only when served by
+# the ASGI application, under WSGI every open chat would hold a worker, so
+# chats poll for new messages instead
+INBOX_REALTIME=env.bool('INBOX_REALTIME',default=False)
+# Pub/sub behind the pushes. LocalBroker only serves a single DEBUG process,
+# outside development it leaves chats polling unless INBOX_BROKER is
+# inboxes.realtime.RedisBroker, publishing on INBOX_REDIS_URL
+INBOX_BROKER=env('INBOX_BROKER',default='inboxes.realtime.LocalBroker')
+INBOX_REDIS_URL=env('INBOX_REDIS_URL',default='redis://localhost:6379/0')
 
 ALLOWED_HOSTS = ['localhost', '127.0.0.1',env('RENDER_EXTERNAL_HOSTNAME'),
                  'jnestagram.onrender.com','jnestagram-staging.onrender.com']
@@ -56,6 +82,13 @@ if not DEBUG:
     CSRF_COOKIE_SECURE = True
     SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 
+# Cache
+# Liked sets, the trending snapshot and its recompute lock are shared by all
+# workers, so outside development CACHE_URL must name a shared cache (redis://)
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://') if DEBUG else env.cache('CACHE_URL'),
+}
+
 # Translation
 LANGUAGE_CODE = 'fa'
 LANGUAGES = [
@@ -0,0 +1,44 @@
+import time
+
+from django.core.cache import cache
+
+SNAPSHOT_TTL=30
+
+
+# Per-process copy of a small table. Reads are served from memory, the table
+# is only read again when the TTL ran out and the shared version in the cache
+# was bumped by a save or delete. Subclasses name the version key and build
+# their lookups in fetch.
+class VersionedSnapshot:
+    version_key=None
+    empty=None
+
+    def __init__(self,ttl=SNAPSHOT_TTL):
+        self.ttl=ttl
+        self.reset()
+
+    def fetch(self):
+        raise NotImplementedError
+
+    def reset(self):
+        self.data=self.empty
+        self.version=None
+        self.expires_at=0
+
+    def load(self):
+        version=cache.get(self.version_key)
+        if self.expires_at == 0 or version is None or version != self.version:
+            self.data=self.fetch()
+            self.version=version
+
+        self.expires_at=time.monotonic()+self.ttl
+
+    def current(self):
+        if time.monotonic() >= self.expires_at:
+            self.load()
+        return self.data
+
+    def bump_version(self):
+        # Every process reloads within its TTL, this one right away
+        cache.set(self.version_key,time.time_ns(),None)
+        self.reset()
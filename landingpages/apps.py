@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class LandingpagesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'landingpages'
+
+    def ready(self):
+        import landingpages.signals
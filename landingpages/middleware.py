@@ -1,24 +1,63 @@
-from django.http import HttpResponseRedirect
+from django.http import HttpResponse
+from django.template.loader import render_to_string
 from django.urls import reverse
+from django.utils import translation
 
-from jnestagram.settings import STAGING
+from jnestagram.snapshots import VersionedSnapshot
 from .models import LandingPage
 
+EXEMPT_PATHS=('/robots.txt','/sitemap.xml','/favicon.ico')
+MAINTENANCE_TEMPLATE='landingpages/maintenance.html'
+
+
+# Per-process copy of the landing page switches
+class LandingPageSnapshot(VersionedSnapshot):
+    version_key='landingpages:version'
+    empty={}
+
+    def fetch(self):
+        return dict(LandingPage.objects.values_list('name','is_active'))
+
+    def is_enabled(self,page_name):
+        return self.current().get(page_name,False)
+
+
+snapshot=LandingPageSnapshot()
+maintenance_pages={}
+
+def bump_version():
+    snapshot.bump_version()
+
+def page_is_enabled(page_name):
+    return snapshot.is_enabled(page_name)
+
+def maintenance_response():
+    # Rendered once per language without a request, so no context processors run
+    language=translation.get_language()
+    if language not in maintenance_pages:
+        with translation.override(language):
+            maintenance_pages[language]=render_to_string(MAINTENANCE_TEMPLATE)
+
+    response=HttpResponse(maintenance_pages[language],status=503)
+    response['Retry-After']='3600'
+    return response
+
 def landingpage_middleware(get_response):
+    exempt_urls=None
+
     def middleware(request):
+        nonlocal exempt_urls
+
         # Before middleware
-        exempt_urls = [
-            reverse('maintenance'),
-            '/robots.txt',
-            '/sitemap.xml',
-            '/favicon.ico',
-        ]
         if page_is_enabled('Maintenance'):
-            is_exempt = any(request.path == url for url in exempt_urls)
+            if exempt_urls is None:
+                exempt_urls=frozenset([reverse('maintenance'),*EXEMPT_PATHS])
+
+            is_exempt = request.path in exempt_urls
             is_admin = 'jnestagram-boss' in request.path
 
             if not is_exempt and not is_admin:
-                return HttpResponseRedirect(reverse('maintenance'))
+                return maintenance_response()
 
         response = get_response(request)
 
@@ -28,10 +67,3 @@ def landingpage_middleware(get_response):
 
         return response
     return middleware
-
-def page_is_enabled(page_name):
-    page=LandingPage.objects.filter(name=page_name).first()
-    if page:
-        return page.is_active
-    else:
-        return False
\ No newline at end of file
@@ -0,0 +1,10 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .middleware import bump_version
+from .models import LandingPage
+
+@receiver(post_save, sender=LandingPage)
+@receiver(post_delete, sender=LandingPage)
+def bump_landingpages_version(sender, **kwargs):
+    bump_version()
@@ -1,3 +1,45 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import TestCase,RequestFactory
 
-# Create your tests here.
+from .middleware import landingpage_middleware,snapshot,maintenance_pages
+from .models import LandingPage
+
+
+class LandingPageMiddlewareTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        snapshot.reset()
+        maintenance_pages.clear()
+        self.factory=RequestFactory()
+        self.middleware=landingpage_middleware(lambda request:HttpResponse('ok'))
+
+    def test_requests_do_not_query_after_load(self):
+        self.middleware(self.factory.get('/'))
+
+        with self.assertNumQueries(0):
+            response=self.middleware(self.factory.get('/'))
+        self.assertEqual(response.content,b'ok')
+
+    def test_maintenance_served_without_queries(self):
+        page=LandingPage.objects.create(name='Maintenance',is_active=True)
+        self.middleware(self.factory.get('/'))
+
+        with self.assertNumQueries(0):
+            response=self.middleware(self.factory.get('/profile/test/'))
+        self.assertEqual(response.status_code,503)
+        self.assertContains(response,'CONSTRUCTION',status_code=503)
+
+        for path in ['/robots.txt','/_/maintenanace/','/jnestagram-boss/']:
+            self.assertEqual(self.middleware(self.factory.get(path)).status_code,200)
+
+        page.is_active=False
+        page.save()
+        self.assertEqual(self.middleware(self.factory.get('/')).status_code,200)
+
+    def test_delete_disables_page(self):
+        page=LandingPage.objects.create(name='Maintenance',is_active=True)
+        self.assertEqual(self.middleware(self.factory.get('/')).status_code,503)
+
+        page.delete()
+        self.assertEqual(self.middleware(self.factory.get('/')).status_code,200)
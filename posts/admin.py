@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Post, Tag,Comment,Like,Replay
+from .models import Post, Tag,Comment,Like,Replay,ImageJob
 
 class ReplayInline(admin.TabularInline):
     model = Replay
@@ -14,8 +14,8 @@ class TagAdmin(admin.ModelAdmin):
 
 @admin.register(Post)
 class PostAdmin(admin.ModelAdmin):
-    list_display = ('title', 'user', 'is_active', 'is_public', 'created_at', 'updated_at')
-    list_filter = ('is_active', 'is_public', 'created_at')
+    list_display = ('title', 'user', 'is_active', 'is_public', 'image_status', 'created_at', 'updated_at')
+    list_filter = ('is_active', 'is_public', 'image_status', 'created_at')
     search_fields = ('title', 'text', 'user__username')
     filter_horizontal = ('tag',)
 
@@ -25,3 +25,9 @@ class CommentAdmin(admin.ModelAdmin):
     list_filter = ('is_approved','created_at')
     search_fields = ('text','post',)
     inlines = [ReplayInline]
+
+@admin.register(ImageJob)
+class ImageJobAdmin(admin.ModelAdmin):
+    list_display = ('content_type', 'object_id', 'field', 'status', 'attempts', 'created_at')
+    list_filter = ('status', 'content_type')
+    search_fields = ('object_id', 'source')
@@ -0,0 +1,176 @@
+import heapq
+from itertools import groupby
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Post,Comment,Replay,Like,LikeCounterShard
+from .likes import column,table
+
+BATCH_SIZE=1000
+
+
+def adjust_counter(model,pk,field,delta):
+    # One atomic UPDATE on the parent row, it is never loaded or recounted
+    queryset=model.objects.filter(pk=pk)
+    if delta < 0:
+        queryset=queryset.filter(**{f'{field}__gt':0})
+    return queryset.update(**{field:F(field)+delta})
+
+def set_comment_approval(comment,is_approved):
+    # Compare-and-set on the flag, only the request that flips it moves the counter
+    with transaction.atomic():
+        flipped=Comment.objects.filter(pk=comment.pk,is_approved=not is_approved).update(
+            is_approved=is_approved,
+            updated_at=timezone.now(),
+        )
+        if flipped:
+            adjust_counter(Post,comment.post_id,'comments_count',1 if is_approved else -1)
+
+    comment.is_approved=is_approved
+    return bool(flipped)
+
+
+class Counter:
+    def __init__(self,model,field,child,foreign_key,filters=None,shards=False):
+        self.model=model
+        self.field=field
+        self.child=child
+        self.foreign_key=foreign_key
+        self.filters=filters or {}
+        # likes_count plus the pending shard rows has to equal the like rows
+        self.shards=shards
+
+    def __str__(self):
+        return f'{self.model.__name__}.{self.field}'
+
+def counters():
+    def likes(model):
+        content_type=ContentType.objects.get_for_model(model)
+        return Counter(model,'likes_count',Like,'object_id',{'content_type':content_type.pk},shards=True)
+
+    return [
+        likes(Post),
+        Counter(Post,'comments_count',Comment,'post',{'is_approved':True}),
+        likes(Comment),
+        Counter(Comment,'replays_count',Replay,'comment'),
+        likes(Replay),
+    ]
+
+def counts_sql(counter,first,last,pks=None):
+    # Expected value of every parent in one pk range, the children are grouped once per range.
+    # With pks only those parents of the range are counted
+    model,child=counter.model,counter.child
+    pk=f"parent.{column(model,model._meta.pk.name)}"
+    foreign_key=column(child,counter.foreign_key)
+    filters=''.join(f" AND {column(child,name)} = %s" for name in counter.filters)
+
+    def within(name):
+        if pks is None:
+            return f"{name} BETWEEN %s AND %s",[first,last]
+        return f"{name} BETWEEN %s AND %s AND {name} IN ({', '.join(['%s']*len(pks))})",[first,last,*pks]
+
+    condition,range_params=within(foreign_key)
+    expected="COALESCE(children.total, 0)"
+    joins=(
+        f"LEFT JOIN (SELECT {foreign_key} AS target_id, COUNT(*) AS total FROM {table(child)} "
+        f"WHERE {condition}{filters} GROUP BY {foreign_key}) children ON children.target_id = {pk} "
+    )
+    params=[*range_params,*counter.filters.values()]
+
+    if counter.shards:
+        object_id=column(LikeCounterShard,'object_id')
+        condition,range_params=within(object_id)
+        expected=f"{expected} - COALESCE(shards.total, 0)"
+        expected=f"CASE WHEN {expected} < 0 THEN 0 ELSE {expected} END"
+        joins+=(
+            f"LEFT JOIN (SELECT {object_id} AS target_id, SUM({column(LikeCounterShard,'count')}) AS total "
+            f"FROM {table(LikeCounterShard)} WHERE {condition} "
+            f"AND {column(LikeCounterShard,'content_type')} = %s GROUP BY {object_id}) shards ON shards.target_id = {pk} "
+        )
+        params+=[*range_params,counter.filters['content_type']]
+
+    condition,range_params=within(pk)
+    sql=f"SELECT {pk} AS target_id, {expected} AS expected FROM {table(model)} parent {joins}WHERE {condition}"
+    return sql,params+range_params
+
+def stream_values(queryset,field,batch_size):
+    # Distinct values of one column in order, read batch_size at a time
+    last=None
+    while True:
+        page=queryset.order_by(field)
+        if last is not None:
+            page=page.filter(**{f'{field}__gt':last})
+        values=list(page.values_list(field,flat=True).distinct()[:batch_size])
+        if not values:
+            return
+        yield from values
+        last=values[-1]
+
+def candidate_pks(counter,batch_size,since):
+    model=counter.model
+    if since is None:
+        return stream_values(model.objects.all(),'pk',batch_size)
+
+    # Only parents created since, or with children inserted or updated since,
+    # can have drifted. A deleted child leaves no row behind, so drift from
+    # deletes is only found by a run without since
+    child=counter.child
+    changed='updated_at' if any(field.name == 'updated_at' for field in child._meta.fields) else 'created_at'
+    foreign_key=child._meta.get_field(counter.foreign_key).attname
+    # Children that stopped being counted (an un-approved comment) moved their parent too,
+    # so only the content type, which picks the parent model, narrows them
+    scope={name:value for name,value in counter.filters.items() if name == 'content_type'}
+    created=stream_values(model.objects.filter(created_at__gte=since),'pk',batch_size)
+    written=stream_values(child.objects.filter(**{f'{changed}__gte':since},**scope),foreign_key,batch_size)
+    return (pk for pk,_ in groupby(heapq.merge(created,written)))
+
+def chunks(counter,batch_size,since=None):
+    # Full runs reconcile contiguous pk ranges, since runs only their sparse candidates
+    chunk=[]
+    for pk in candidate_pks(counter,batch_size,since):
+        chunk.append(pk)
+        if len(chunk) == batch_size:
+            yield chunk[0],chunk[-1],None if since is None else chunk
+            chunk=[]
+    if chunk:
+        yield chunk[0],chunk[-1],None if since is None else chunk
+
+def reconcile_counter(counter,batch_size=BATCH_SIZE,since=None,dry_run=False):
+    model=counter.model
+    parent=table(model)
+    pk=column(model,model._meta.pk.name)
+    field=column(model,counter.field)
+
+    def prep(value):
+        return model._meta.pk.get_db_prep_value(value,connection)
+
+    corrected=0
+    for first,last,pks in chunks(counter,batch_size,since):
+        sql,params=counts_sql(
+            counter,
+            prep(first),
+            prep(last),
+            None if pks is None else [prep(value) for value in pks],
+        )
+
+        # One short autocommitted statement per range, locks never span the table
+        with connection.cursor() as cursor:
+            if dry_run:
+                cursor.execute(
+                    f"SELECT COUNT(*) FROM {parent} JOIN ({sql}) counts ON counts.target_id = {parent}.{pk} "
+                    f"WHERE {parent}.{field} <> counts.expected",
+                    params,
+                )
+                corrected+=cursor.fetchone()[0]
+            else:
+                cursor.execute(
+                    f"UPDATE {parent} SET {field} = counts.expected FROM ({sql}) counts "
+                    f"WHERE {parent}.{pk} = counts.target_id AND {parent}.{field} <> counts.expected",
+                    params,
+                )
+                corrected+=cursor.rowcount
+
+    return corrected
@@ -0,0 +1,383 @@
+import io
+import math
+import os
+import sys
+import tempfile
+from collections import namedtuple
+from concurrent.futures import Future
+from contextlib import ExitStack
+from datetime import timedelta
+from functools import partial
+
+try:
+    import resource
+except ImportError:
+    resource=None
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import F,Q
+from django.db.models.signals import pre_save,post_save,post_delete
+from django.dispatch import Signal
+from django.utils import timezone
+
+from pilkit.lib import Image
+from pilkit.processors import ResizeToFill
+from pilkit.utils import save_image
+
+from .models import ImageJob,IMAGE_READY,IMAGE_PENDING,IMAGE_FAILED
+from .validators import ImageTooLarge,check_pixels
+
+MAX_ATTEMPTS=3
+# Retrying these can not succeed, the job fails on the first attempt
+PERMANENT_ERRORS=(ImageTooLarge,Image.DecompressionBombError)
+# A running job older than this belongs to a dead worker and is claimed again
+LOCK_TIMEOUT=timedelta(minutes=10)
+BATCH_SIZE=10
+
+# Every rendition width is encoded in each of these, the order is the <source> order.
+# AVIF at speed 8 encodes about three times faster than the default for a few percent in size
+RENDITION_FORMATS=('AVIF','WEBP')
+FORMAT_OPTIONS={'AVIF':{'quality':60,'speed':8},'WEBP':{'quality':80}}
+
+# CSS width of an image slot as (min viewport width, vw, px), widest breakpoint first
+IMAGE_SLOTS={
+    'feed':((1280,0,660),(768,55,0),(0,100,-48)),
+    'thumbnail':((0,0,80),),
+    'sidebar':((0,0,40),),
+    'avatar_small':((0,0,24),),
+    'avatar':((0,0,40),),
+    'avatar_large':((0,0,128),),
+}
+
+ImageSpec=namedtuple('ImageSpec','width height status_field renditions_field widths format')
+
+specs={}
+
+# Sent with the target model and pk once a processed image replaced the upload
+image_processed=Signal()
+
+
+def register_image(model,field,width,height,status_field,renditions_field,widths=(),format='WEBP'):
+    # Uploads to model.field are saved as they came, the worker resizes them
+    # to width x height and adds the narrower widths as renditions
+    widths=sorted({*(rendition for rendition in widths if rendition < width),width})
+    specs[(model._meta.label_lower,field)]=ImageSpec(width,height,status_field,renditions_field,widths,format)
+    uid=f'{model._meta.label_lower}.{field}'
+    pre_save.connect(mark_upload,sender=model,dispatch_uid=f'mark_upload:{uid}')
+    post_save.connect(queue_upload,sender=model,dispatch_uid=f'queue_upload:{uid}')
+    post_delete.connect(delete_renditions,sender=model,dispatch_uid=f'delete_renditions:{uid}')
+
+def model_specs(model):
+    label=model._meta.label_lower
+    return {field:spec for (model_label,field),spec in specs.items() if model_label == label}
+
+def rendition_names(instance,field,spec):
+    # The full width rendition is the field file itself, django_cleanup owns it
+    main=getattr(instance,field).name
+    return [rendition['name'] for rendition in getattr(instance,spec.renditions_field) or () if rendition['name'] != main]
+
+def delete_files(storage,names):
+    for name in names:
+        storage.delete(name)
+
+def mark_upload(sender,instance,**kwargs):
+    uploaded=[]
+    stale={}
+    for field,spec in model_specs(sender).items():
+        file=getattr(instance,field)
+        if file and not file._committed:
+            stale[field]=rendition_names(instance,field,spec)
+            setattr(instance,spec.status_field,IMAGE_PENDING)
+            setattr(instance,spec.renditions_field,[])
+            uploaded.append(field)
+    instance._uploaded_images=uploaded
+    instance._stale_renditions=stale
+
+def queue_upload(sender,instance,**kwargs):
+    uploaded=getattr(instance,'_uploaded_images',())
+    if not uploaded:
+        return
+
+    content_type=ContentType.objects.get_for_model(sender)
+    object_id=str(instance.pk)
+    for field in uploaded:
+        # A newer upload supersedes whatever was still queued for the field
+        ImageJob.objects.filter(content_type=content_type,object_id=object_id,field=field).delete()
+        ImageJob.objects.create(content_type=content_type,object_id=object_id,field=field,source=getattr(instance,field).name)
+    instance._uploaded_images=[]
+
+    for field,names in instance._stale_renditions.items():
+        if names:
+            transaction.on_commit(partial(delete_files,sender._meta.get_field(field).storage,names))
+
+def delete_renditions(sender,instance,**kwargs):
+    for field,spec in model_specs(sender).items():
+        names=rendition_names(instance,field,spec)
+        if names:
+            transaction.on_commit(partial(delete_files,sender._meta.get_field(field).storage,names))
+
+def reset_peak_memory():
+    # Linux restarts the VmHWM high-water mark, so the next reading covers one image
+    try:
+        with open('/proc/self/clear_refs','w') as refs:
+            refs.write('5')
+    except OSError:
+        pass
+
+def peak_memory():
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])*1024
+    except OSError:
+        pass
+    if resource is None:
+        return 0
+    peak=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak*1024
+
+def decoded_bytes(image):
+    # Pillow keeps multi-band images at four bytes a pixel
+    return image.width*image.height*(1 if len(image.getbands()) == 1 else 4)
+
+def reduce_decoding(image,width,height):
+    # JPEGs decode straight to the smallest 1/2, 1/4 or 1/8 scale still covering
+    # width x height, other formats ignore the draft
+    scale=max(width/image.width,height/image.height)
+    if scale < 1:
+        image.draft(image.mode,(math.ceil(image.width*scale),math.ceil(image.height*scale)))
+
+def render_renditions(path,width,height,widths,format):
+    # Runs in the worker processes, every width of one format per task. The
+    # source is read from its path and checked before anything is decoded
+    reset_peak_memory()
+    with Image.open(path) as source:
+        check_pixels(source)
+        source_size=source.size
+        reduce_decoding(source,width,height)
+        source.load()
+        metrics={'source':source_size,'decoded':source.size,'decoded_bytes':decoded_bytes(source)}
+        image=ResizeToFill(width,height).process(source)
+
+    renditions=[]
+    for rendition_width in widths:
+        resized=image
+        if rendition_width < image.width:
+            resized=image.resize((rendition_width,round(image.height*rendition_width/image.width)),Image.Resampling.LANCZOS)
+        renditions.append((rendition_width,save_image(resized,io.BytesIO(),format,FORMAT_OPTIONS[format]).getvalue()))
+    metrics['peak_memory']=peak_memory()
+    return renditions,metrics
+
+def run_inline(function,*args):
+    future=Future()
+    try:
+        future.set_result(function(*args))
+    except Exception as error:
+        future.set_exception(error)
+    return future
+
+
+def job_spec(job):
+    return specs[(f'{job.content_type.app_label}.{job.content_type.model}',job.field)]
+
+def job_storage(job):
+    return job.content_type.model_class()._meta.get_field(job.field).storage
+
+def claim_jobs(limit=BATCH_SIZE):
+    now=timezone.now()
+    with transaction.atomic():
+        jobs=list(ImageJob.objects.select_for_update(skip_locked=True).filter(
+            Q(status=ImageJob.STATUS_PENDING) | Q(status=ImageJob.STATUS_RUNNING,locked_at__lt=now-LOCK_TIMEOUT),
+        ).select_related('content_type').order_by('created_at','id')[:limit])
+        ImageJob.objects.filter(id__in=[job.id for job in jobs]).update(
+            status=ImageJob.STATUS_RUNNING,
+            locked_at=now,
+            attempts=F('attempts')+1,
+        )
+
+    for job in jobs:
+        job.status=ImageJob.STATUS_RUNNING
+        job.locked_at=now
+        job.attempts+=1
+    return jobs
+
+def job_formats(job,spec):
+    # A renditions only job keeps the field file as its full width rendition
+    for format in dict.fromkeys((spec.format,*RENDITION_FORMATS)):
+        widths=spec.widths
+        if job.renditions_only and format == spec.format:
+            widths=widths[:-1]
+        if widths:
+            yield format,widths
+
+def finish_job(job,outputs):
+    spec=job_spec(job)
+    model=job.content_type.model_class()
+    storage=job_storage(job)
+    base=os.path.splitext(job.source)[0]
+
+    main=job.source
+    saved=[]
+    renditions=[]
+    if job.renditions_only:
+        renditions.append({'format':spec.format.lower(),'width':spec.width,'name':job.source,'size':storage.size(job.source)})
+    for format,images in outputs.items():
+        extension=format.lower()
+        for width,data in images:
+            if format == spec.format and width == spec.width:
+                name=main=storage.save(f'{base}.{extension}',ContentFile(data))
+            else:
+                name=storage.save(f'{base}-{width}w.{extension}',ContentFile(data))
+            saved.append(name)
+            renditions.append({'format':extension,'width':width,'name':name,'size':len(data)})
+    renditions.sort(key=lambda rendition:(rendition['format'],rendition['width']))
+
+    # Only swapped in while the field still holds the processed upload
+    with transaction.atomic():
+        target=model.objects.select_for_update().filter(pk=job.object_id,**{job.field:job.source})
+        previous=target.values_list(spec.renditions_field,flat=True).first()
+        updated=target.update(**{
+            job.field:main,
+            spec.status_field:IMAGE_READY,
+            spec.renditions_field:renditions,
+        })
+
+    if updated:
+        stale=[rendition['name'] for rendition in previous or () if rendition['name'] != job.source]
+        if main != job.source:
+            stale.append(job.source)
+    else:
+        stale=saved
+    delete_files(storage,stale)
+    job.delete()
+    if updated:
+        image_processed.send(sender=model,pk=job.object_id,field=job.field)
+
+def fail_job(job,error):
+    target=job.content_type.model_class().objects.filter(pk=job.object_id,**{job.field:job.source})
+    if not target.exists():
+        # Deleted or uploaded again meanwhile, nobody waits for this image
+        job.delete()
+        return
+
+    job.error=f'{type(error).__name__}: {error}'
+    job.locked_at=None
+    if job.attempts < MAX_ATTEMPTS and not isinstance(error,PERMANENT_ERRORS):
+        job.status=ImageJob.STATUS_PENDING
+    else:
+        job.status=ImageJob.STATUS_FAILED
+        target.update(**{job_spec(job).status_field:IMAGE_FAILED})
+    job.save(update_fields=['status','error','locked_at'])
+
+def source_path(storage,name,stack):
+    # Workers open the source themselves, a remote file is streamed to a temporary one first
+    try:
+        return storage.path(name)
+    except NotImplementedError:
+        pass
+
+    temporary=stack.enter_context(tempfile.NamedTemporaryFile(suffix=os.path.splitext(name)[1]))
+    with storage.open(name) as source:
+        for chunk in source.chunks():
+            temporary.write(chunk)
+    temporary.flush()
+    return temporary.name
+
+def merge_metrics(results):
+    metrics=dict(results[0])
+    metrics['decoded_bytes']=max(result['decoded_bytes'] for result in results)
+    metrics['peak_memory']=max(result['peak_memory'] for result in results)
+    return metrics
+
+def process_jobs(jobs,submit=run_inline,report=None):
+    # Reads and writes stay in this process, submit hands each format to the pool.
+    # report is called with every processed job and its memory metrics
+    processed=0
+    with ExitStack() as stack:
+        tasks=[]
+        for job in jobs:
+            try:
+                spec=job_spec(job)
+                path=source_path(job_storage(job),job.source,stack)
+            except Exception as error:
+                fail_job(job,error)
+                continue
+            tasks.append((job,[
+                (format,submit(render_renditions,path,spec.width,spec.height,widths,format))
+                for format,widths in job_formats(job,spec)
+            ]))
+
+        for job,futures in tasks:
+            try:
+                results={format:future.result() for format,future in futures}
+                finish_job(job,{format:renditions for format,(renditions,metrics) in results.items()})
+            except Exception as error:
+                fail_job(job,error)
+            else:
+                processed+=1
+                if report:
+                    report(job,merge_metrics([metrics for renditions,metrics in results.values()]))
+    return processed
+
+def queue_renditions(model,field,force=False,batch_size=1000):
+    # Jobs for images stored before renditions existed, uploads still queued are left alone
+    spec=specs[(model._meta.label_lower,field)]
+    content_type=ContentType.objects.get_for_model(model)
+    queued=set(ImageJob.objects.filter(content_type=content_type,field=field).values_list('object_id',flat=True))
+
+    rows=model.objects.filter(**{spec.status_field:IMAGE_READY}).exclude(**{field:''}).values_list('pk',field,spec.renditions_field)
+    jobs=[
+        ImageJob(content_type=content_type,object_id=str(pk),field=field,source=name,renditions_only=True)
+        for pk,name,renditions in rows.iterator(chunk_size=batch_size)
+        if (force or not renditions) and str(pk) not in queued
+    ]
+    ImageJob.objects.bulk_create(jobs,batch_size=batch_size)
+    return len(jobs)
+
+
+def slot_sizes(slot):
+    sizes=[]
+    for min_width,vw,px in IMAGE_SLOTS[slot]:
+        if vw and px:
+            length=f'calc({vw}vw {"-" if px < 0 else "+"} {abs(px)}px)'
+        else:
+            length=f'{vw}vw' if vw else f'{px}px'
+        sizes.append(f'(min-width: {min_width}px) {length}' if min_width else length)
+    return ', '.join(sizes)
+
+def slot_width(slot,viewport):
+    for min_width,vw,px in IMAGE_SLOTS[slot]:
+        if viewport >= min_width:
+            return viewport*vw/100+px
+    return viewport
+
+def rendition_sets(renditions):
+    # Renditions per format in <source> order, narrowest first
+    by_format={format.lower():[] for format in RENDITION_FORMATS}
+    for rendition in renditions or ():
+        if rendition['format'] in by_format:
+            by_format[rendition['format']].append(rendition)
+    return [(format,sorted(images,key=lambda rendition:rendition['width'])) for format,images in by_format.items() if images]
+
+def pick_rendition(renditions,width):
+    # What a browser takes: the first format it decodes, the narrowest width covering the slot
+    for format,images in rendition_sets(renditions):
+        return next((rendition for rendition in images if rendition['width'] >= width),images[-1])
+    return None
+
+def page_image_bytes(images,viewport,dpr):
+    # Bytes of (renditions, slot) pairs on one page served full size and through srcset,
+    # an image repeated on the page is downloaded once
+    full={}
+    responsive={}
+    for renditions,slot in images:
+        if not renditions:
+            continue
+        largest=max(renditions,key=lambda rendition:(rendition['width'],rendition['format'] == 'webp'))
+        chosen=pick_rendition(renditions,slot_width(slot,viewport)*dpr)
+        full[largest['name']]=largest['size']
+        responsive[chosen['name']]=chosen['size']
+    return sum(full.values()),sum(responsive.values())
@@ -0,0 +1,94 @@
+import uuid
+from bisect import bisect_left
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+
+from .models import Like
+
+LIKED_SET_SIZE=1000
+LIKED_SET_TIMEOUT=60*60
+ID_SIZE=16
+
+
+def as_uuid(object_id):
+    return object_id if isinstance(object_id,uuid.UUID) else uuid.UUID(str(object_id))
+
+
+# A user's most recent liked ids of one model, sorted and packed 16 bytes
+# each, so a thousand likes cost 16KB in the cache and membership is a
+# binary search. complete is False when older likes did not fit.
+class LikedSet:
+    def __init__(self,blob=b'',complete=True):
+        self.blob=blob
+        self.complete=complete
+
+    @classmethod
+    def from_ids(cls,object_ids,complete=True):
+        return cls(b''.join(sorted({as_uuid(object_id).bytes for object_id in object_ids})),complete)
+
+    def __len__(self):
+        return len(self.blob)//ID_SIZE
+
+    def __getitem__(self,index):
+        return self.blob[index*ID_SIZE:(index+1)*ID_SIZE]
+
+    def position(self,key):
+        index=bisect_left(self,key)
+        return index,index < len(self) and self[index] == key
+
+    def __contains__(self,object_id):
+        return self.position(as_uuid(object_id).bytes)[1]
+
+
+def cache_key(user_id,content_type_id):
+    return f'posts:liked:{user_id}:{content_type_id}'
+
+def load_liked_set(user_id,content_type_id):
+    object_ids=list(Like.objects.filter(
+        user_id=user_id,
+        content_type_id=content_type_id,
+    ).order_by('-created_at').values_list('object_id',flat=True)[:LIKED_SET_SIZE+1])
+
+    liked_set=LikedSet.from_ids(object_ids[:LIKED_SET_SIZE],complete=len(object_ids) <= LIKED_SET_SIZE)
+    cache.set(cache_key(user_id,content_type_id),(liked_set.blob,liked_set.complete),LIKED_SET_TIMEOUT)
+    return liked_set
+
+def get_liked_set(user_id,content_type_id):
+    cached=cache.get(cache_key(user_id,content_type_id))
+    if cached is None:
+        return load_liked_set(user_id,content_type_id)
+    return LikedSet(*cached)
+
+def forget_liked_set(user_id,content_type_id):
+    # Called after a like commits. Changing the cached set in place would lose one of
+    # two concurrent likes, so the next read loads it fresh instead
+    cache.delete(cache_key(user_id,content_type_id))
+
+def liked_ids(user,model,object_ids):
+    # Which of a page of objects the user liked, the database only answers
+    # for ids older than the cached window
+    object_ids=[as_uuid(object_id) for object_id in object_ids]
+    if user is None or not user.is_authenticated or not object_ids:
+        return set()
+
+    content_type=ContentType.objects.get_for_model(model)
+    liked_set=get_liked_set(user.pk,content_type.pk)
+    liked={object_id for object_id in object_ids if object_id in liked_set}
+
+    misses=[object_id for object_id in object_ids if object_id not in liked]
+    if misses and not liked_set.complete:
+        liked.update(Like.objects.filter(
+            user=user,
+            content_type=content_type,
+            object_id__in=misses,
+        ).values_list('object_id',flat=True))
+    return liked
+
+def mark_liked(user,objects):
+    objects=list(objects)
+    if objects:
+        liked=liked_ids(user,type(objects[0]),[obj.pk for obj in objects])
+        for obj in objects:
+            obj.is_liked=obj.pk in liked
+    return objects
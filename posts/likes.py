@@ -0,0 +1,168 @@
+import random
+from collections import defaultdict
+from functools import partial
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models import F,Sum
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Like,LikeCounterShard,Post
+from .trending import is_trending,invalidate_trending_for_likes
+from .liked import forget_liked_set
+
+
+class LikeState:
+    def __init__(self,is_liked,likes_count,user_id):
+        self.is_liked=is_liked
+        self.likes_count=likes_count
+        self.user_id=user_id
+
+
+def column(model,field_name):
+    return connection.ops.quote_name(model._meta.get_field(field_name).column)
+
+def table(model):
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+def toggle_like(user,model,pk):
+    # Insert-or-delete plus the counter adjustment, without loading the target
+    # or counting its likes. Returns None when the target does not exist.
+    try:
+        pk=model._meta.pk.to_python(pk)
+    except ValidationError:
+        return None
+
+    trending=model is Post and is_trending(pk)
+    content_type=ContentType.objects.get_for_model(model)
+    object_id=Like._meta.get_field('object_id').get_db_prep_value(pk,connection)
+    pk=model._meta.pk.get_db_prep_value(pk,connection)
+    like_params=[user.pk,content_type.pk,object_id]
+    like_where=f"{column(Like,'user')} = %s AND {column(Like,'content_type')} = %s AND {column(Like,'object_id')} = %s"
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Raw SQL skips the Like signals, so the trending snapshot is dropped here
+        if trending:
+            transaction.on_commit(invalidate_trending_for_likes)
+
+        cursor.execute(
+            f"DELETE FROM {table(Like)} WHERE {like_where} RETURNING {column(Like,'id')}",
+            like_params,
+        )
+        if cursor.fetchone():
+            transaction.on_commit(partial(forget_liked_set,user.pk,content_type.pk))
+            return update_likes_count(cursor,model,pk,content_type,object_id,-1,is_liked=False)
+
+        # The SELECT only yields a row when the target exists
+        cursor.execute(
+            f"INSERT INTO {table(Like)} ({column(Like,'user')}, {column(Like,'content_type')}, "
+            f"{column(Like,'object_id')}, {column(Like,'created_at')}) "
+            f"SELECT %s, %s, %s, %s FROM {table(model)} WHERE {column(model,model._meta.pk.name)} = %s "
+            f"ON CONFLICT ({column(Like,'user')}, {column(Like,'content_type')}, {column(Like,'object_id')}) DO NOTHING "
+            f"RETURNING {column(Like,'id')}",
+            like_params+[connection.ops.adapt_datetimefield_value(timezone.now()),pk],
+        )
+        if cursor.fetchone():
+            transaction.on_commit(partial(forget_liked_set,user.pk,content_type.pk))
+            return update_likes_count(cursor,model,pk,content_type,object_id,1,is_liked=True)
+
+        # Either the target is missing or a concurrent request already liked it
+        cursor.execute(
+            f"SELECT {column(model,'likes_count')}, {column(model,'user')} FROM {table(model)} "
+            f"WHERE {column(model,model._meta.pk.name)} = %s",
+            [pk],
+        )
+        row=cursor.fetchone()
+        if row is None:
+            return None
+        return LikeState(True,row[0],row[1])
+
+def update_likes_count(cursor,model,pk,content_type,object_id,delta,is_liked):
+    if settings.LIKE_COUNTER_SHARDS:
+        return update_likes_count_shard(cursor,model,pk,content_type,object_id,delta,is_liked)
+
+    likes_count=column(model,'likes_count')
+    cursor.execute(
+        f"UPDATE {table(model)} SET {likes_count} = CASE WHEN {likes_count} + %s < 0 THEN 0 ELSE {likes_count} + %s END "
+        f"WHERE {column(model,model._meta.pk.name)} = %s "
+        f"RETURNING {likes_count}, {column(model,'user')}",
+        [delta,delta,pk],
+    )
+    row=cursor.fetchone()
+    if row is None:
+        return None
+    return LikeState(is_liked,row[0],row[1])
+
+def update_likes_count_shard(cursor,model,pk,content_type,object_id,delta,is_liked):
+    # A random shard row takes the increment, so concurrent likes on one
+    # hot object do not queue up on the target row lock
+    shards=table(LikeCounterShard)
+    count=column(LikeCounterShard,'count')
+    target_columns=f"{column(LikeCounterShard,'content_type')}, {column(LikeCounterShard,'object_id')}"
+    cursor.execute(
+        f"INSERT INTO {shards} ({target_columns}, {column(LikeCounterShard,'shard')}, {count}) VALUES (%s, %s, %s, %s) "
+        f"ON CONFLICT ({target_columns}, {column(LikeCounterShard,'shard')}) DO UPDATE SET {count} = {shards}.{count} + EXCLUDED.{count}",
+        [content_type.pk,object_id,random.randrange(settings.LIKE_COUNTER_SHARDS),delta],
+    )
+    cursor.execute(
+        f"SELECT {column(model,'likes_count')} + COALESCE((SELECT SUM({count}) FROM {shards} "
+        f"WHERE {column(LikeCounterShard,'content_type')} = %s AND {column(LikeCounterShard,'object_id')} = %s), 0), "
+        f"{column(model,'user')} FROM {table(model)} WHERE {column(model,model._meta.pk.name)} = %s",
+        [content_type.pk,object_id,pk],
+    )
+    row=cursor.fetchone()
+    if row is None:
+        return None
+    return LikeState(is_liked,max(row[0],0),row[1])
+
+
+def fresh_likes_counts(model,pks):
+    # likes_count plus the shard deltas that are not rolled up yet
+    content_type=ContentType.objects.get_for_model(model)
+    counts=dict(model.objects.filter(pk__in=pks).values_list('pk','likes_count'))
+
+    pending=LikeCounterShard.objects.filter(
+        content_type=content_type,
+        object_id__in=list(counts),
+    ).values('object_id').annotate(total=Sum('count'))
+    for row in pending:
+        counts[row['object_id']]=max(counts[row['object_id']]+row['total'],0)
+
+    return counts
+
+def fresh_likes_count(obj):
+    return fresh_likes_counts(type(obj),[obj.pk]).get(obj.pk,0)
+
+def rollup_like_shards(batch_size=1000):
+    # Shard rows created after the rollup started wait for the next run
+    max_id=LikeCounterShard.objects.order_by('-id').values_list('id',flat=True).first()
+    if max_id is None:
+        return 0
+
+    rolled=0
+    while True:
+        with transaction.atomic():
+            shards=list(LikeCounterShard.objects.select_for_update(skip_locked=True).filter(
+                id__lte=max_id,
+            ).order_by('id')[:batch_size])
+            if not shards:
+                break
+
+            totals=defaultdict(int)
+            for shard in shards:
+                totals[(shard.content_type_id,shard.object_id)]+=shard.count
+
+            for (content_type_id,object_id),total in totals.items():
+                model=ContentType.objects.get_for_id(content_type_id).model_class()
+                if total and model is not None:
+                    model.objects.filter(pk=object_id).update(likes_count=Greatest(F('likes_count')+total,0))
+
+            LikeCounterShard.objects.filter(id__in=[shard.id for shard in shards]).delete()
+
+        rolled+=len(shards)
+
+    return rolled
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import Post,TagFeed
+
+
+class Command(BaseCommand):
+    help = 'Build the denormalized tag feed for existing posts in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size',type=int,default=1000)
+
+    def handle(self, *args, **options):
+        batch_size=options['batch_size']
+        through=Post.tag.through
+
+        last_id=0
+        total=0
+        while True:
+            rows=list(through.objects.filter(id__gt=last_id).order_by('id').values_list(
+                'id','tag_id','post_id','post__created_at','post__is_active','post__is_public',
+            )[:batch_size])
+            if not rows:
+                break
+
+            entries=[
+                TagFeed(tag_id=tag_id,post_id=post_id,created_at=created_at,is_active=is_active,is_public=is_public)
+                for _,tag_id,post_id,created_at,is_active,is_public in rows
+            ]
+            TagFeed.objects.bulk_create(
+                entries,
+                update_conflicts=True,
+                unique_fields=['tag','post'],
+                update_fields=['created_at','is_active','is_public'],
+            )
+
+            last_id=rows[-1][0]
+            total+=len(rows)
+            self.stdout.write(f'{total} tag feed entries written...')
+
+        self.stdout.write(self.style.SUCCESS(f'Tag feed backfilled with {total} entries.'))
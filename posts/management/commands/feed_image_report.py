@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+
+from posts.images import page_image_bytes
+from posts.models import Post
+from posts.views import PostListView
+from jnestagram.pagination import KeysetPaginator
+
+
+def kilobytes(size):
+    return f'{size/1024:.1f}KB'
+
+
+class Command(BaseCommand):
+    help = 'Report the image bytes each home feed page downloads full size and through srcset renditions.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages',type=int,default=3)
+        parser.add_argument('--viewport',type=int,default=390,help='Viewport width in CSS pixels.')
+        parser.add_argument('--dpr',type=float,default=2.0,help='Device pixel ratio.')
+
+    def handle(self, *args, **options):
+        feed=Post.objects.filter(is_active=True,is_public=True).select_related('user__profile')
+        paginator=KeysetPaginator(('-created_at','-id'),PostListView.paginate_by)
+
+        total_full=total_responsive=0
+        cursor=None
+        for number in range(1,options['pages']+1):
+            page=paginator.paginate(feed,cursor)
+            images=[]
+            for post in page.object_list:
+                images.append((post.image_renditions,'feed'))
+                images.append((post.user.profile.avatar_renditions,'avatar_small'))
+
+            full,responsive=page_image_bytes(images,options['viewport'],options['dpr'])
+            saved=100*(full-responsive)/full if full else 0
+            self.stdout.write(f'Page {number}: {len(page.object_list)} posts, {kilobytes(full)} -> {kilobytes(responsive)} ({saved:.0f}% saved)')
+            total_full+=full
+            total_responsive+=responsive
+
+            if not page.has_next:
+                break
+            cursor=page.next_cursor
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{kilobytes(total_full-total_responsive)} saved of {kilobytes(total_full)} at {options["viewport"]}px x{options["dpr"]:g}.'
+        ))
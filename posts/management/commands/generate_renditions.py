@@ -0,0 +1,29 @@
+import os
+
+from django.apps import apps
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from posts.images import queue_renditions,specs
+
+
+class Command(BaseCommand):
+    help = 'Queue responsive renditions of post images and avatars stored before they existed, then process the queue.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size',type=int,default=1000)
+        parser.add_argument('--workers',type=int,default=os.cpu_count() or 1,help='Worker processes, 0 processes images in this process.')
+        parser.add_argument('--force',action='store_true',help='Render images that already have renditions again.')
+        parser.add_argument('--queue-only',action='store_true',help='Only queue the jobs and leave them to process_images.')
+
+    def handle(self, *args, **options):
+        queued=0
+        for label,field in specs:
+            model=apps.get_model(label)
+            count=queue_renditions(model,field,force=options['force'],batch_size=options['batch_size'])
+            self.stdout.write(f'{model.__name__}.{field}: {count} queued')
+            queued+=count
+
+        if queued and not options['queue_only']:
+            call_command('process_images',workers=options['workers'],once=True,stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(f'Queued {queued} images for renditions.'))
@@ -0,0 +1,60 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from posts.images import claim_jobs,process_jobs,run_inline
+
+
+class Command(BaseCommand):
+    help = 'Resize and encode uploaded post images and avatars queued as image jobs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers',type=int,default=os.cpu_count() or 1,help='Worker processes, 0 processes images in this process.')
+        parser.add_argument('--batch-size',type=int,default=0,help='Jobs claimed at once, twice the workers by default.')
+        parser.add_argument('--sleep',type=float,default=2.0,help='Seconds to wait when the queue is empty.')
+        parser.add_argument('--once',action='store_true',help='Exit once the queue is empty.')
+
+    def megabytes(self, size):
+        return f'{size/1024/1024:.1f}MB'
+
+    def report(self, job, metrics):
+        self.peak_memory=max(self.peak_memory,metrics['peak_memory'])
+        if self.verbosity >= 2:
+            self.stdout.write(
+                f'{job.content_type.model} {job.object_id} {job.field}: '
+                f'{"x".join(map(str,metrics["source"]))} decoded at {"x".join(map(str,metrics["decoded"]))}, '
+                f'{self.megabytes(metrics["decoded_bytes"])} pixels, peak memory {self.megabytes(metrics["peak_memory"])}'
+            )
+
+    def run(self, submit, batch_size, sleep, once):
+        processed=0
+        claimed=0
+        while True:
+            jobs=claim_jobs(batch_size)
+            if not jobs:
+                if once:
+                    return processed,claimed
+                time.sleep(sleep)
+                continue
+
+            processed+=process_jobs(jobs,submit,self.report)
+            claimed+=len(jobs)
+            self.stdout.write(f'{processed} images processed, peak memory {self.megabytes(self.peak_memory)}...')
+
+    def handle(self, *args, **options):
+        workers=options['workers']
+        batch_size=options['batch_size'] or max(workers*2,1)
+        self.verbosity=options['verbosity']
+        self.peak_memory=0
+
+        if workers == 0:
+            processed,claimed=self.run(run_inline,batch_size,options['sleep'],options['once'])
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                processed,claimed=self.run(executor.submit,batch_size,options['sleep'],options['once'])
+
+        if claimed > processed:
+            self.stdout.write(self.style.WARNING(f'{claimed-processed} images failed and were queued again or marked failed.'))
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} images.'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from posts.search import rebuild_post_search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the search terms of every post in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size',type=int,default=500)
+
+    def handle(self, *args, **options):
+        total=rebuild_post_search(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Search terms rebuilt for {total} posts.'))
@@ -0,0 +1,47 @@
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils import timezone
+
+from posts.counters import counters, reconcile_counter
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the likes, comments and replays counters from their rows in pk-range chunks. '
+        '--since only checks rows created since then or with likes, comments or replays written since, '
+        'drift from deleted likes, comments or replays needs a run without it.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size',type=int,default=1000)
+        parser.add_argument('--since',help='Date or datetime, e.g. 2026-10-01')
+        parser.add_argument('--dry-run',action='store_true',help='Count the drifted rows without correcting them')
+
+    def parse_since(self, value):
+        if value is None:
+            return None
+
+        since=parse_datetime(value)
+        if since is None:
+            date=parse_date(value)
+            if date is None:
+                raise CommandError(f'Invalid --since value: {value}')
+            since=datetime.combine(date,time.min)
+        if timezone.is_naive(since):
+            since=timezone.make_aware(since)
+        return since
+
+    def handle(self, *args, **options):
+        since=self.parse_since(options['since'])
+        dry_run=options['dry_run']
+
+        total=0
+        for counter in counters():
+            corrected=reconcile_counter(counter,options['batch_size'],since,dry_run)
+            total+=corrected
+            self.stdout.write(f'{counter}: {corrected} {"drifted" if dry_run else "corrected"}')
+
+        verb='would be corrected' if dry_run else 'corrected'
+        self.stdout.write(self.style.SUCCESS(f'{total} counters {verb}.'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from posts.trending import refresh_trending
+
+
+class Command(BaseCommand):
+    help = 'Recompute the trending posts and tags snapshot served by the sidebar.'
+
+    def handle(self, *args, **options):
+        snapshot=refresh_trending()
+        self.stdout.write(self.style.SUCCESS(
+            f"Trending refreshed: {len(snapshot['global'])} posts, {len(snapshot['by_tag'])} tag boards."
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from posts.likes import rollup_like_shards
+
+
+class Command(BaseCommand):
+    help = 'Fold sharded like counters back into likes_count. Run it periodically when LIKE_COUNTER_SHARDS is enabled.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size',type=int,default=1000)
+
+    def handle(self, *args, **options):
+        rolled=rollup_like_shards(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rolled up {rolled} like counter shards.'))
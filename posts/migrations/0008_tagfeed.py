@@ -0,0 +1,32 @@
+# Generated by Django 6.0.2 on 2026-10-18 08:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0007_alter_comment_created_at_alter_comment_id_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TagFeed',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(verbose_name='Created At')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Is Active')),
+                ('is_public', models.BooleanField(default=True, verbose_name='Is Public')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tag_feed', to='posts.post', verbose_name='Post')),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed', to='posts.tag', verbose_name='Tag')),
+            ],
+            options={
+                'verbose_name': 'Tag Feed',
+                'verbose_name_plural': 'Tag Feeds',
+                'db_table': 'tag_feed',
+                'indexes': [models.Index(fields=['tag', 'is_active', 'is_public', '-created_at', '-post'], name='tag_feed_tag_id_f05b43_idx')],
+                'constraints': [models.UniqueConstraint(fields=('tag', 'post'), name='tag_feed_tag_post_uniq')],
+            },
+        ),
+    ]
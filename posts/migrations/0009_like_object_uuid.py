@@ -0,0 +1,25 @@
+# Generated by Django 6.0.2 on 2026-10-18 09:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0008_tagfeed'),
+    ]
+
+    operations = [
+        # Reversing 0011 adds object_id back to a filled table before 0010's
+        # reverse copies the ids into it, so the old column has to allow NULL
+        migrations.AlterField(
+            model_name='like',
+            name='object_id',
+            field=models.CharField(max_length=100, null=True, verbose_name='Object ID'),
+        ),
+        migrations.AddField(
+            model_name='like',
+            name='object_uuid',
+            field=models.UUIDField(null=True, verbose_name='Object ID'),
+        ),
+    ]
@@ -0,0 +1,69 @@
+import uuid
+
+from django.db import migrations, transaction
+
+BATCH_SIZE = 5000
+
+
+def copy_object_ids(apps, schema_editor):
+    Like = apps.get_model('posts', 'Like')
+    using = schema_editor.connection.alias
+
+    # Small batches in their own transactions, so the likes table is never locked for long
+    last_id = 0
+    while True:
+        rows = list(
+            Like.objects.using(using).filter(id__gt=last_id).order_by('id').values_list('id', 'object_id', 'object_uuid')[:BATCH_SIZE]
+        )
+        if not rows:
+            break
+
+        updates = []
+        invalid_ids = []
+        for like_id, object_id, object_uuid in rows:
+            if object_uuid is not None:
+                continue
+            try:
+                updates.append(Like(id=like_id, object_uuid=uuid.UUID(object_id)))
+            except (TypeError, ValueError):
+                invalid_ids.append(like_id)
+
+        with transaction.atomic(using=using):
+            Like.objects.using(using).bulk_update(updates, ['object_uuid'])
+            # Likes pointing to non UUID ids can never match a Post, Comment or Replay
+            Like.objects.using(using).filter(id__in=invalid_ids).delete()
+
+        last_id = rows[-1][0]
+
+
+def copy_object_ids_back(apps, schema_editor):
+    Like = apps.get_model('posts', 'Like')
+    using = schema_editor.connection.alias
+
+    last_id = 0
+    while True:
+        rows = list(
+            Like.objects.using(using).filter(id__gt=last_id).order_by('id').values_list('id', 'object_uuid')[:BATCH_SIZE]
+        )
+        if not rows:
+            break
+
+        with transaction.atomic(using=using):
+            Like.objects.using(using).bulk_update(
+                [Like(id=like_id, object_id=str(object_uuid)) for like_id, object_uuid in rows if object_uuid],
+                ['object_id'],
+            )
+
+        last_id = rows[-1][0]
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('posts', '0009_like_object_uuid'),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_object_ids, copy_object_ids_back),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 6.0.2 on 2026-10-18 09:10
+
+import uuid
+
+from django.conf import settings
+from django.db import migrations, models
+
+BATCH_SIZE = 5000
+
+
+def copy_missing_object_ids(apps, schema_editor):
+    # Likes written by the old code while 0010 ran only have object_id,
+    # they are copied here right before the old column goes away
+    Like = apps.get_model('posts', 'Like')
+    using = schema_editor.connection.alias
+
+    last_id = 0
+    while True:
+        rows = list(
+            Like.objects.using(using).filter(id__gt=last_id, object_uuid__isnull=True).order_by('id').values_list('id', 'object_id')[:BATCH_SIZE]
+        )
+        if not rows:
+            break
+
+        updates = []
+        invalid_ids = []
+        for like_id, object_id in rows:
+            try:
+                updates.append(Like(id=like_id, object_uuid=uuid.UUID(object_id)))
+            except (TypeError, ValueError):
+                invalid_ids.append(like_id)
+
+        Like.objects.using(using).bulk_update(updates, ['object_uuid'])
+        Like.objects.using(using).filter(id__in=invalid_ids).delete()
+        last_id = rows[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('posts', '0010_copy_like_object_ids'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_missing_object_ids, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='like',
+            unique_together=set(),
+        ),
+        migrations.RemoveField(
+            model_name='like',
+            name='object_id',
+        ),
+        migrations.RenameField(
+            model_name='like',
+            old_name='object_uuid',
+            new_name='object_id',
+        ),
+        migrations.AlterField(
+            model_name='like',
+            name='object_id',
+            field=models.UUIDField(verbose_name='Object ID'),
+        ),
+        migrations.AddConstraint(
+            model_name='like',
+            constraint=models.UniqueConstraint(fields=('user', 'content_type', 'object_id'), name='likes_user_target_uniq'),
+        ),
+        migrations.AddIndex(
+            model_name='like',
+            index=models.Index(fields=['content_type', 'object_id'], name='likes_target_idx'),
+        ),
+    ]
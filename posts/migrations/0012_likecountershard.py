@@ -0,0 +1,31 @@
+# Generated by Django 6.0.2 on 2026-10-18 08:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('posts', '0011_like_typed_object_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LikeCounterShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.UUIDField(verbose_name='Object ID')),
+                ('shard', models.PositiveSmallIntegerField(verbose_name='Shard')),
+                ('count', models.IntegerField(default=0, verbose_name='Count')),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype', verbose_name='Content Type')),
+            ],
+            options={
+                'verbose_name': 'Like Counter Shard',
+                'verbose_name_plural': 'Like Counter Shards',
+                'db_table': 'like_counter_shards',
+                'constraints': [models.UniqueConstraint(fields=('content_type', 'object_id', 'shard'), name='like_shard_target_uniq')],
+            },
+        ),
+    ]
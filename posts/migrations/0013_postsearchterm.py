@@ -0,0 +1,29 @@
+# Generated by Django 6.0.2 on 2026-10-18 09:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_likecountershard'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostSearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64, verbose_name='Term')),
+                ('weight', models.PositiveSmallIntegerField(default=1, verbose_name='Weight')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='posts.post', verbose_name='Post')),
+            ],
+            options={
+                'verbose_name': 'Post Search Term',
+                'verbose_name_plural': 'Post Search Terms',
+                'db_table': 'post_search_terms',
+                'constraints': [models.UniqueConstraint(fields=('term', 'post'), name='post_search_term_post_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 6.0.2 on 2026-10-18 09:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('posts', '0015_likes_user_recent_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='image_status',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'Ready'), (1, 'Pending'), (2, 'Failed')], default=0, verbose_name='Image Status'),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(upload_to='posts/%Y/%m/%d', verbose_name='Image'),
+        ),
+        migrations.CreateModel(
+            name='ImageJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.CharField(max_length=64, verbose_name='Object ID')),
+                ('field', models.CharField(max_length=50, verbose_name='Field')),
+                ('source', models.CharField(max_length=255, verbose_name='Source')),
+                ('status', models.PositiveSmallIntegerField(choices=[(0, 'Pending'), (1, 'Running'), (2, 'Failed')], default=0, verbose_name='Status')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Attempts')),
+                ('error', models.TextField(blank=True, verbose_name='Error')),
+                ('locked_at', models.DateTimeField(blank=True, null=True, verbose_name='Locked At')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created At')),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype', verbose_name='Content Type')),
+            ],
+            options={
+                'verbose_name': 'Image Job',
+                'verbose_name_plural': 'Image Jobs',
+                'db_table': 'image_jobs',
+                'indexes': [models.Index(fields=['status', 'created_at'], name='image_jobs_queue_idx'), models.Index(fields=['content_type', 'object_id'], name='image_jobs_target_idx')],
+            },
+        ),
+    ]
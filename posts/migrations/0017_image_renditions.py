@@ -0,0 +1,23 @@
+# Generated by Django 6.0.2 on 2026-10-18 09:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0016_image_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imagejob',
+            name='renditions_only',
+            field=models.BooleanField(default=False, verbose_name='Renditions Only'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='image_renditions',
+            field=models.JSONField(blank=True, default=list, editable=False, verbose_name='Image Renditions'),
+        ),
+    ]
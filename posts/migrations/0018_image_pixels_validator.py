@@ -0,0 +1,19 @@
+# Generated by Django 6.0.2 on 2026-10-18 09:48
+
+import posts.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_image_renditions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(upload_to='posts/%Y/%m/%d', validators=[posts.validators.validate_image_pixels], verbose_name='Image'),
+        ),
+    ]
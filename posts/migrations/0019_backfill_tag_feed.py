@@ -0,0 +1,44 @@
+# Generated by Django 6.0.2 on 2026-10-18 10:05
+
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+
+def backfill_tag_feed(apps, schema_editor):
+    # Same batches as the backfill_tag_feed command, so tag pages are filled on deploy
+    Post = apps.get_model('posts', 'Post')
+    TagFeed = apps.get_model('posts', 'TagFeed')
+    through = Post._meta.get_field('tag').remote_field.through
+    using = schema_editor.connection.alias
+
+    last_id = 0
+    while True:
+        rows = list(through.objects.using(using).filter(id__gt=last_id).order_by('id').values_list(
+            'id', 'tag_id', 'post_id', 'post__created_at', 'post__is_active', 'post__is_public',
+        )[:BATCH_SIZE])
+        if not rows:
+            break
+
+        TagFeed.objects.using(using).bulk_create(
+            [
+                TagFeed(tag_id=tag_id, post_id=post_id, created_at=created_at, is_active=is_active, is_public=is_public)
+                for _, tag_id, post_id, created_at, is_active, is_public in rows
+            ],
+            update_conflicts=True,
+            unique_fields=['tag', 'post'],
+            update_fields=['created_at', 'is_active', 'is_public'],
+        )
+        last_id = rows[-1][0]
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('posts', '0018_image_pixels_validator'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_tag_feed, migrations.RunPython.noop),
+    ]
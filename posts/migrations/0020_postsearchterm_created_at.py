@@ -0,0 +1,24 @@
+# Generated by Django 6.0.2 on 2026-10-18 10:30
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0019_backfill_tag_feed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='postsearchterm',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Created At'),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='postsearchterm',
+            index=models.Index(fields=['term', '-weight', '-created_at', '-post'], name='post_search_term_rank_idx'),
+        ),
+    ]
@@ -0,0 +1,114 @@
+# Generated by Django 6.0.2 on 2026-10-18 10:35
+
+import re
+import unicodedata
+
+from django.db import migrations, transaction
+
+BATCH_SIZE = 500
+
+# Frozen copy of the posts.search tokenizer
+CHARACTER_MAP = str.maketrans({
+    'ي': 'ی', 'ى': 'ی', 'ئ': 'ی', 'ك': 'ک', 'ة': 'ه', 'ۀ': 'ه', 'أ': 'ا', 'إ': 'ا', 'ٱ': 'ا', 'ؤ': 'و',
+    **{chr(0x0660 + digit): str(digit) for digit in range(10)},
+    **{chr(0x06F0 + digit): str(digit) for digit in range(10)},
+})
+WORD_RE = re.compile(r'\w+')
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in', 'is', 'it', 'of', 'on', 'or', 'the', 'to', 'with',
+    'و', 'در', 'به', 'از', 'که', 'را', 'با', 'این', 'آن', 'برای', 'تا', 'یا', 'هم', 'است', 'بود', 'شد',
+}
+ENGLISH_SUFFIXES = (('sses', 'ss'), ('ies', 'y'), ('ing', ''), ('ed', ''), ('s', ''))
+ENGLISH_KEEP = ('ss', 'us', 'is', 'eed')
+PERSIAN_SUFFIXES = ('هایی', 'های', 'ها', 'ترین', 'تر')
+VOWELS = set('aeiouy')
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKC', text or '').translate(CHARACTER_MAP)
+    text = text.replace('\u200c', '').replace('\u0640', '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return text.casefold()
+
+
+def undouble(stem):
+    if len(stem) < 2 or stem[-1] != stem[-2] or stem[-1] in VOWELS or stem[-1] in 'sz':
+        return stem
+    if stem[-1] == 'l' and len(stem) < 6:
+        return stem
+    return stem[:-1]
+
+
+def stem(word):
+    if word.isascii():
+        if word.endswith(ENGLISH_KEEP):
+            return word
+        for suffix, replacement in ENGLISH_SUFFIXES:
+            if not word.endswith(suffix):
+                continue
+            stem = word[:-len(suffix)]
+            if len(stem) < 4 or not VOWELS & set(stem):
+                return word
+            if suffix in ('ing', 'ed'):
+                stem = undouble(stem)
+            return stem + replacement
+        return word
+
+    for suffix in PERSIAN_SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 2:
+            return word[:-len(suffix)]
+    return word
+
+
+def tokenize(text):
+    return [
+        stem(word)[:64]
+        for word in WORD_RE.findall(normalize(text))
+        if word not in STOPWORDS and (len(word) > 1 or word.isdigit())
+    ]
+
+
+def post_terms(title, text):
+    weights = {}
+    for term in tokenize(title):
+        weights[term] = weights.get(term, 0) + 3
+    for term in tokenize(text):
+        weights[term] = weights.get(term, 0) + 1
+    return weights
+
+
+def backfill_search_terms(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    PostSearchTerm = apps.get_model('posts', 'PostSearchTerm')
+
+    # Posts saved before the term table existed were never indexed, the ones
+    # indexed since used the earlier stemmer and have no created_at copy yet
+    last_pk = None
+    while True:
+        posts = Post.objects.order_by('pk')
+        if last_pk is not None:
+            posts = posts.filter(pk__gt=last_pk)
+        posts = list(posts.values_list('pk', 'title', 'text', 'created_at')[:BATCH_SIZE])
+        if not posts:
+            break
+
+        with transaction.atomic():
+            PostSearchTerm.objects.filter(post_id__in=[pk for pk, _, _, _ in posts]).delete()
+            PostSearchTerm.objects.bulk_create([
+                PostSearchTerm(post_id=pk, term=term, weight=min(weight, 32767), created_at=created_at)
+                for pk, title, text, created_at in posts
+                for term, weight in post_terms(title, text).items()
+            ], batch_size=BATCH_SIZE)
+        last_pk = posts[-1][0]
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('posts', '0020_postsearchterm_created_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_search_terms, migrations.RunPython.noop),
+    ]
@@ -3,13 +3,22 @@ import uuid
 from django.contrib.contenttypes.fields import GenericForeignKey,GenericRelation
 from django.contrib.contenttypes.models import ContentType
 
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.urls import reverse
 from django.utils.translation import gettext_lazy as _
 
-from imagekit.models import ProcessedImageField
-from imagekit.processors import ResizeToFill
+from .validators import validate_image_pixels
+
+# Processing state of an uploaded image, the original is served until it is ready
+IMAGE_READY=0
+IMAGE_PENDING=1
+IMAGE_FAILED=2
+IMAGE_STATUS_CHOICES=(
+    (IMAGE_READY,_('Ready')),
+    (IMAGE_PENDING,_('Pending')),
+    (IMAGE_FAILED,_('Failed')),
+)
 
 class Tag(models.Model):
     name = models.CharField(max_length=20,db_index=True,verbose_name=_('Name'))
@@ -36,28 +45,47 @@ class Like(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE,verbose_name=_('User'))
 
     content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE,verbose_name=_('Content Type'))
-    object_id = models.CharField(max_length=100,verbose_name=_('Object ID'))
+    object_id = models.UUIDField(verbose_name=_('Object ID'))
     content_object = GenericForeignKey('content_type', 'object_id')
 
     created_at = models.DateTimeField(auto_now_add=True,verbose_name=_('Created At'))
 
     class Meta:
-        unique_together = ('user', 'content_type', 'object_id')
+        constraints=[
+            models.UniqueConstraint(fields=['user','content_type','object_id'],name='likes_user_target_uniq'),
+        ]
+        indexes=[
+            models.Index(fields=['content_type','object_id'],name='likes_target_idx'),
+            models.Index(fields=['user','content_type','-created_at'],name='likes_user_recent_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user} liked {self.content_object}"
 
+class LikeCounterShard(models.Model):
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE,verbose_name=_('Content Type'))
+    object_id = models.UUIDField(verbose_name=_('Object ID'))
+    shard = models.PositiveSmallIntegerField(verbose_name=_('Shard'))
+    count = models.IntegerField(default=0,verbose_name=_('Count'))
+
+    class Meta:
+        db_table = 'like_counter_shards'
+        verbose_name = 'Like Counter Shard'
+        verbose_name_plural = 'Like Counter Shards'
+        constraints=[
+            models.UniqueConstraint(fields=['content_type','object_id','shard'],name='like_shard_target_uniq'),
+        ]
+
+    def __str__(self):
+        return f'{self.content_type} {self.object_id} #{self.shard} : {self.count}'
+
 class Post(models.Model):
     id = models.UUIDField(primary_key=True, unique=True, default=uuid.uuid4, editable=False,verbose_name=_('ID'))
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='user_posts',verbose_name=_('User'))
     title = models.CharField(max_length=100,verbose_name=_('Title'))
-    image = ProcessedImageField(
-        upload_to='posts/%Y/%m/%d',
-        processors=[ResizeToFill(1080, 566)],
-        format='WEBP',
-        options={'quality': 80},
-        verbose_name=_('Image'),
-    )
+    image = models.ImageField(upload_to='posts/%Y/%m/%d',validators=[validate_image_pixels],verbose_name=_('Image'))
+    image_status = models.PositiveSmallIntegerField(choices=IMAGE_STATUS_CHOICES,default=IMAGE_READY,verbose_name=_('Image Status'))
+    image_renditions = models.JSONField(default=list,blank=True,editable=False,verbose_name=_('Image Renditions'))
     text = models.TextField(verbose_name=_('Text'))
     tag= models.ManyToManyField(Tag, related_name='tag_posts',blank=True,verbose_name=_('Tag'))
     likes=GenericRelation(Like,related_query_name='posts',verbose_name=_('Likes'))
@@ -84,6 +112,49 @@ class Post(models.Model):
 
     def get_absolute_url(self):
         return reverse('post_detail', args=[str(self.id)])
+
+
+class TagFeed(models.Model):
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, related_name='feed',verbose_name=_('Tag'))
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='tag_feed',verbose_name=_('Post'))
+    created_at = models.DateTimeField(verbose_name=_('Created At'))
+    is_active = models.BooleanField(default=True,verbose_name=_('Is Active'))
+    is_public = models.BooleanField(default=True,verbose_name=_('Is Public'))
+
+    class Meta:
+        db_table = 'tag_feed'
+        verbose_name = 'Tag Feed'
+        verbose_name_plural = 'Tag Feeds'
+        constraints=[
+            models.UniqueConstraint(fields=['tag','post'],name='tag_feed_tag_post_uniq'),
+        ]
+        indexes=[
+            models.Index(fields=['tag','is_active','is_public','-created_at','-post']),
+        ]
+
+    def __str__(self):
+        return f'{self.tag} : {self.post}'
+
+
+class PostSearchTerm(models.Model):
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='search_terms',verbose_name=_('Post'))
+    term = models.CharField(max_length=64,verbose_name=_('Term'))
+    weight = models.PositiveSmallIntegerField(default=1,verbose_name=_('Weight'))
+    created_at = models.DateTimeField(verbose_name=_('Created At'))
+
+    class Meta:
+        db_table = 'post_search_terms'
+        verbose_name = 'Post Search Term'
+        verbose_name_plural = 'Post Search Terms'
+        constraints=[
+            models.UniqueConstraint(fields=['term','post'],name='post_search_term_post_uniq'),
+        ]
+        indexes=[
+            models.Index(fields=['term','-weight','-created_at','-post'],name='post_search_term_rank_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.term} : {self.post_id}'
 
 
 class Comment(models.Model):
@@ -106,12 +177,20 @@ class Comment(models.Model):
         indexes=[
             models.Index(fields=['-likes_count','-created_at']),
             models.Index(fields=['post','is_approved','-created_at']),
+            models.Index(fields=['post','is_approved','-likes_count','-created_at'],name='comments_post_top_idx'),
             models.Index(fields=['user','-created_at']),
         ]
 
     def __str__(self):
         return f'Comment by {self.user.username} on {self.post.title}'
 
+    def save(self, *args, **kwargs):
+        # The approval signals lock the row in pre_save, the lock has to last
+        # until post_save moved the comments counter. An enclosing transaction
+        # already does, so no savepoint is needed
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+
 class Replay(models.Model):
     id = models.UUIDField(primary_key=True, unique=True, default=uuid.uuid4, editable=False,verbose_name=_('ID'))
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='user_replays',verbose_name=_('User'))
@@ -135,3 +214,38 @@ class Replay(models.Model):
 
     def __str__(self):
         return  self.text
+
+
+# Upload waiting for the process_images worker, a finished job is deleted
+class ImageJob(models.Model):
+    STATUS_PENDING=0
+    STATUS_RUNNING=1
+    STATUS_FAILED=2
+    STATUS_CHOICES=(
+        (STATUS_PENDING,_('Pending')),
+        (STATUS_RUNNING,_('Running')),
+        (STATUS_FAILED,_('Failed')),
+    )
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE,verbose_name=_('Content Type'))
+    object_id = models.CharField(max_length=64,verbose_name=_('Object ID'))
+    content_object = GenericForeignKey('content_type', 'object_id')
+    field = models.CharField(max_length=50,verbose_name=_('Field'))
+    source = models.CharField(max_length=255,verbose_name=_('Source'))
+    renditions_only = models.BooleanField(default=False,verbose_name=_('Renditions Only'))
+    status = models.PositiveSmallIntegerField(choices=STATUS_CHOICES,default=STATUS_PENDING,verbose_name=_('Status'))
+    attempts = models.PositiveSmallIntegerField(default=0,verbose_name=_('Attempts'))
+    error = models.TextField(blank=True,verbose_name=_('Error'))
+    locked_at = models.DateTimeField(null=True,blank=True,verbose_name=_('Locked At'))
+    created_at = models.DateTimeField(auto_now_add=True,verbose_name=_('Created At'))
+
+    class Meta:
+        db_table = 'image_jobs'
+        verbose_name = 'Image Job'
+        verbose_name_plural = 'Image Jobs'
+        indexes=[
+            models.Index(fields=['status','created_at'],name='image_jobs_queue_idx'),
+            models.Index(fields=['content_type','object_id'],name='image_jobs_target_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.content_type} {self.object_id} {self.field}'
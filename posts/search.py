@@ -0,0 +1,147 @@
+import re
+import unicodedata
+
+from django.db import transaction
+from django.db.models import Count,Sum
+
+from .models import Post,PostSearchTerm
+
+TITLE_WEIGHT=3
+MAX_TERM_LENGTH=64
+MAX_QUERY_TERMS=8
+# Ranked matches a search pages through, deeper pages are not served
+MAX_RESULTS=200
+# Postings of the rarest query term read as candidates
+MAX_CANDIDATES=1000
+BATCH_SIZE=500
+
+# Arabic letters typed on Persian text, Arabic and Persian digits
+CHARACTER_MAP=str.maketrans({
+    'ي':'ی','ى':'ی','ئ':'ی','ك':'ک','ة':'ه','ۀ':'ه','أ':'ا','إ':'ا','ٱ':'ا','ؤ':'و',
+    **{chr(0x0660+digit):str(digit) for digit in range(10)},
+    **{chr(0x06F0+digit):str(digit) for digit in range(10)},
+})
+WORD_RE=re.compile(r'\w+')
+
+STOPWORDS={
+    'a','an','and','are','as','at','be','by','for','from','in','is','it','of','on','or','the','to','with',
+    'و','در','به','از','که','را','با','این','آن','برای','تا','یا','هم','است','بود','شد',
+}
+ENGLISH_SUFFIXES=(('sses','ss'),('ies','y'),('ing',''),('ed',''),('s',''))
+ENGLISH_KEEP=('ss','us','is','eed')
+MIN_STEM_LENGTH=4
+VOWELS=set('aeiouy')
+PERSIAN_SUFFIXES=('هایی','های','ها','ترین','تر')
+
+
+def normalize(text):
+    text=unicodedata.normalize('NFKC',text or '').translate(CHARACTER_MAP)
+    # Half-spaced and joined compounds (می‌روم, میروم) index alike
+    text=text.replace('\u200c','').replace('\u0640','')
+    text=''.join(char for char in text if not unicodedata.combining(char))
+    return text.casefold()
+
+def undouble(stem):
+    # stopp -> stop, runn -> run, travell -> travel, but pass, buzz and short
+    # -ll words (call, sell) keep their double letter
+    if len(stem) < 2 or stem[-1] != stem[-2] or stem[-1] in VOWELS or stem[-1] in 'sz':
+        return stem
+    if stem[-1] == 'l' and len(stem) < 6:
+        return stem
+    return stem[:-1]
+
+def stem_english(word):
+    if word.endswith(ENGLISH_KEEP):
+        return word
+
+    for suffix,replacement in ENGLISH_SUFFIXES:
+        if not word.endswith(suffix):
+            continue
+        # Short stems are left alone: news, series, used
+        stem=word[:-len(suffix)]
+        if len(stem) < MIN_STEM_LENGTH or not VOWELS & set(stem):
+            return word
+        if suffix in ('ing','ed'):
+            stem=undouble(stem)
+        return stem+replacement
+    return word
+
+def stem(word):
+    if word.isascii():
+        return stem_english(word)
+
+    for suffix in PERSIAN_SUFFIXES:
+        if word.endswith(suffix) and len(word)-len(suffix) >= 2:
+            return word[:-len(suffix)]
+    return word
+
+def tokenize(text):
+    return [
+        stem(word)[:MAX_TERM_LENGTH]
+        for word in WORD_RE.findall(normalize(text))
+        if word not in STOPWORDS and (len(word) > 1 or word.isdigit())
+    ]
+
+def post_terms(title,text):
+    weights={}
+    for term in tokenize(title):
+        weights[term]=weights.get(term,0)+TITLE_WEIGHT
+    for term in tokenize(text):
+        weights[term]=weights.get(term,0)+1
+    return weights
+
+def build_terms(post):
+    return [
+        PostSearchTerm(post_id=post.pk,term=term,weight=min(weight,32767),created_at=post.created_at)
+        for term,weight in post_terms(post.title,post.text).items()
+    ]
+
+def index_post(post):
+    with transaction.atomic():
+        PostSearchTerm.objects.filter(post_id=post.pk).delete()
+        PostSearchTerm.objects.bulk_create(build_terms(post))
+
+def rebuild_post_search(batch_size=BATCH_SIZE):
+    # Each batch is replaced on its own, so search keeps working during a rebuild
+    total=0
+    last_id=None
+    while True:
+        posts=Post.objects.order_by('pk').only('title','text','created_at')
+        if last_id is not None:
+            posts=posts.filter(pk__gt=last_id)
+        posts=list(posts[:batch_size])
+        if not posts:
+            break
+
+        with transaction.atomic():
+            PostSearchTerm.objects.filter(post_id__in=[post.pk for post in posts]).delete()
+            PostSearchTerm.objects.bulk_create([term for post in posts for term in build_terms(post)],batch_size=batch_size)
+        total+=len(posts)
+        last_id=posts[-1].pk
+
+    return total
+
+def query_terms(query):
+    return list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+
+def driving_term(terms,candidates):
+    # The term with the fewest postings, counted no further than the candidates read
+    return min(terms,key=lambda term:PostSearchTerm.objects.filter(term=term)[:candidates].count())
+
+def search_posts(queryset,query,limit=MAX_RESULTS,candidates=MAX_CANDIDATES):
+    # Posts holding every query term, the best title and text matches first.
+    # Only the best postings of the rarest term are ranked, read in order off
+    # the rank index, and the slice keeps the paginator's COUNT and OFFSET
+    # within the top matches, so common terms cost no more than rare ones
+    terms=query_terms(query)
+    if not terms:
+        return queryset.none()
+
+    postings=PostSearchTerm.objects.filter(term=driving_term(terms,candidates)).order_by('-weight','-created_at','-post')
+    # Read up front and matched on the (term, post) pairs, otherwise the planner
+    # joins every posting of the terms first
+    post_ids=list(postings.values_list('post',flat=True)[:candidates])
+    return queryset.filter(search_terms__term__in=terms,search_terms__post__in=post_ids).annotate(
+        search_score=Sum('search_terms__weight'),
+        matched_terms=Count('search_terms'),
+    ).filter(matched_terms=len(terms)).order_by('-search_score','-created_at','-id')[:limit]
@@ -1,59 +1,146 @@
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
 from django.dispatch import receiver
-from django.db.models import F
+from django.contrib.contenttypes.models import ContentType
 
-from .models import Comment,Like,Replay
+from .models import Comment,Like,Replay,Post,Tag,TagFeed
+from .trending import is_trending,invalidate_trending,invalidate_trending_for_likes
+from .search import index_post
+from .liked import forget_liked_set
+from .counters import adjust_counter
+from .images import register_image,image_processed
+
+def adjust_likes_count(like,delta):
+    # Update the target by pk instead of loading it through content_object
+    model=ContentType.objects.get_for_id(like.content_type_id).model_class()
+    if model is None or not hasattr(model,'likes_count'):
+        return
+
+    adjust_counter(model,like.object_id,'likes_count',delta)
+
+register_image(Post,'image',1080,566,'image_status','image_renditions',widths=(160,360,720))
 
 @receiver(post_save, sender=Like)
 def update_like_count_on_save(sender, instance, created,**kwargs):
-    obj=instance.content_object
-
-    if created and obj and hasattr(obj,'likes_count'):
-        obj.likes_count=F('likes_count')+1
-        obj.save(update_fields=['likes_count'])
+    if created:
+        adjust_likes_count(instance,1)
 
 @receiver(post_delete, sender=Like)
 def update_like_count_on_delete(sender, instance,**kwargs):
-    obj=instance.content_object
+    adjust_likes_count(instance,-1)
+
+@receiver(post_save, sender=Like)
+@receiver(post_delete, sender=Like)
+def forget_liked_set_on_change(sender, instance, **kwargs):
+    # Likes written through the ORM, toggle_like updates the cached set itself
+    forget_liked_set(instance.user_id,instance.content_type_id)
+
+@receiver(pre_save, sender=Comment)
+def remember_comment_approval(sender, instance, update_fields=None, **kwargs):
+    instance._was_approved=None
+    if instance._state.adding or (update_fields is not None and 'is_approved' not in update_fields):
+        return
+
+    # Comment.save runs in a transaction, the row stays locked until the save
+    # commits, so concurrent saves of one comment see each other's approval
+    instance._was_approved=Comment.objects.filter(pk=instance.pk).select_for_update().values_list('is_approved',flat=True).first()
 
-    if obj and hasattr(obj,'likes_count'):
-        if obj.likes_count > 0:
-            obj.likes_count=F('likes_count')-1
-            obj.save(update_fields=['likes_count'])
 @receiver(post_save, sender=Comment)
 def update_comments_count_on_save(sender, instance, created, **kwargs):
     if created:
         if instance.is_approved:
-            instance.post.comments_count += 1
-            instance.post.save(update_fields=['comments_count'])
-    else:
-        approved_count = instance.post.post_comments.filter(is_approved=True).count()
-        if instance.post.comments_count != approved_count:
-            instance.post.comments_count = approved_count
-            instance.post.save(update_fields=['comments_count'])
+            adjust_counter(Post,instance.post_id,'comments_count',1)
+    elif instance._was_approved is not None and instance._was_approved != instance.is_approved:
+        adjust_counter(Post,instance.post_id,'comments_count',1 if instance.is_approved else -1)
 
 @receiver(post_delete, sender=Comment)
 def update_comments_count_on_delete(sender, instance, **kwargs):
     if instance.is_approved:
-        approved_count = instance.post.post_comments.filter(is_approved=True).count()
-        instance.post.comments_count = approved_count
-        instance.post.save(update_fields=['comments_count'])
+        adjust_counter(Post,instance.post_id,'comments_count',-1)
 
 @receiver(post_save, sender=Replay)
 def update_replay_count_on_save(sender, instance, created, **kwargs):
-    comment=instance.comment
-    if created and comment and hasattr(comment,'replays_count'):
-        comment.replays_count += 1
-        comment.save(update_fields=['replays_count'])
-    else:
-        replays_count=comment.comment_replays.count()
-        if comment.replays_count!=replays_count:
-            comment.replays_count=replays_count
-            comment.save(update_fields=['replays_count'])
+    if created:
+        adjust_counter(Comment,instance.comment_id,'replays_count',1)
 
 @receiver(post_delete, sender=Replay)
 def update_replay_count_on_delete(sender, instance,**kwargs):
-    comment=instance.comment
-    if comment and hasattr(comment,'replays_count') and comment.replays_count > 0:
-        comment.replays_count-=1
-        comment.save(update_fields=['replays_count'])
+    adjust_counter(Comment,instance.comment_id,'replays_count',-1)
+
+# Tag feed maintenance
+FEED_FIELDS={'created_at','is_active','is_public'}
+
+@receiver(post_save, sender=Post)
+def update_tag_feed_on_save(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        return
+    if update_fields and not FEED_FIELDS.intersection(update_fields):
+        return
+
+    TagFeed.objects.filter(post=instance).update(
+        created_at=instance.created_at,
+        is_active=instance.is_active,
+        is_public=instance.is_public,
+    )
+
+@receiver(m2m_changed, sender=Post.tag.through)
+def update_tag_feed_on_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'post_add' and pk_set:
+        if reverse:
+            posts=Post.objects.filter(pk__in=pk_set).only('created_at','is_active','is_public')
+            entries=[TagFeed(tag=instance,post=post,created_at=post.created_at,
+                             is_active=post.is_active,is_public=post.is_public) for post in posts]
+        else:
+            entries=[TagFeed(tag_id=tag_id,post=instance,created_at=instance.created_at,
+                             is_active=instance.is_active,is_public=instance.is_public) for tag_id in pk_set]
+        TagFeed.objects.bulk_create(entries,ignore_conflicts=True)
+
+    elif action == 'post_remove' and pk_set:
+        if reverse:
+            TagFeed.objects.filter(tag=instance,post_id__in=pk_set).delete()
+        else:
+            TagFeed.objects.filter(post=instance,tag_id__in=pk_set).delete()
+
+    elif action == 'pre_clear':
+        if reverse:
+            TagFeed.objects.filter(tag=instance).delete()
+        else:
+            TagFeed.objects.filter(post=instance).delete()
+
+# Search index maintenance
+SEARCH_FIELDS={'title','text','created_at'}
+
+@receiver(post_save, sender=Post)
+def update_search_terms_on_save(sender, instance, created, update_fields=None, **kwargs):
+    if created or not update_fields or SEARCH_FIELDS.intersection(update_fields):
+        index_post(instance)
+
+# Trending sidebar invalidation
+TRENDING_FIELDS={'title','image','is_active','is_public'}
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_trending_on_tag_change(sender, **kwargs):
+    invalidate_trending()
+
+@receiver(post_save, sender=Post)
+def invalidate_trending_on_post_save(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields and not TRENDING_FIELDS.intersection(update_fields)):
+        return
+    if is_trending(instance.pk):
+        invalidate_trending()
+
+@receiver(image_processed, sender=Post)
+def invalidate_trending_on_image(sender, pk, **kwargs):
+    if is_trending(pk):
+        invalidate_trending()
+
+@receiver(post_delete, sender=Post)
+def invalidate_trending_on_post_delete(sender, instance, **kwargs):
+    if is_trending(instance.pk):
+        invalidate_trending()
+
+@receiver(post_save, sender=Like)
+@receiver(post_delete, sender=Like)
+def invalidate_trending_on_like(sender, instance, created=True, **kwargs):
+    if created and instance.content_type_id==ContentType.objects.get_for_model(Post).id and is_trending(instance.object_id):
+        invalidate_trending_for_likes()
@@ -0,0 +1,16 @@
+from django.core.files.storage import default_storage
+from django.template import Library
+from django.utils.html import format_html_join
+
+from posts.images import rendition_sets,slot_sizes
+
+register = Library()
+
+@register.simple_tag
+def image_sources(renditions,slot):
+    # <source> elements for a <picture>, empty until the worker stored the renditions
+    sizes=slot_sizes(slot)
+    return format_html_join('','<source type="image/{}" srcset="{}" sizes="{}">',(
+        (format,', '.join(f"{default_storage.url(rendition['name'])} {rendition['width']}w" for rendition in images),sizes)
+        for format,images in rendition_sets(renditions)
+    ))
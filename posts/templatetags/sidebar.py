@@ -1,26 +1,24 @@
 from django.template import Library
-from django.db.models import Prefetch
 
-from posts.models import Tag,Post,Like
+from posts.models import Post
+from posts.liked import liked_ids
+from posts.trending import get_trending,get_tags,trending_version,CACHE_TIMEOUT
 
 register = Library()
 
 @register.inclusion_tag('partials/sidebar.html')
 def sidebar_view(current_tag=None,user=None):
-    tags=Tag.objects.all()
-    top_posts=Post.objects.select_related('user').prefetch_related(
-        Prefetch('likes',queryset=Like.objects.select_related('user'),to_attr='likess')
-    ).filter(
-        is_active=True,
-        is_public=True,
-        likes_count__gt=0
-    ).order_by('-likes_count','-comments_count')[:4]
-    context={'tags':tags,'top_posts':top_posts,'current_tag':current_tag,'user':user}
-    return context
+    top_posts=get_trending(current_tag)
 
-@register.filter
-def is_liked_by(obj,user):
-    if user.is_anonymous:
-        return False
+    liked={str(object_id) for object_id in liked_ids(user,Post,[top_post['id'] for top_post in top_posts])}
 
-    return any(like.user_id == user.id for like in obj.likess)
\ No newline at end of file
+    context={
+        'tags':get_tags(),
+        'top_posts':top_posts,
+        'liked_ids':liked,
+        'current_tag':current_tag,
+        'user':user,
+        'sidebar_timeout':CACHE_TIMEOUT,
+        'sidebar_version':trending_version(),
+    }
+    return context
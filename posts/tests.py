@@ -1,3 +1,924 @@
-from django.test import TestCase
+from datetime import timedelta
+from importlib import import_module
+from types import SimpleNamespace
 
-# Create your tests here.
+import io
+import tempfile
+from io import StringIO
+
+from django.apps import apps
+from django.db import connection
+from django.test import TestCase,override_settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.urls import reverse
+from django.utils import timezone
+
+from PIL import Image
+
+from posts.models import Post,Tag,TagFeed,Like,Comment,Replay,LikeCounterShard,PostSearchTerm,ImageJob,IMAGE_READY,IMAGE_PENDING,IMAGE_FAILED
+from posts.likes import toggle_like,fresh_likes_count,rollup_like_shards
+from posts.trending import refresh_trending,compute_trending,get_trending,get_snapshot,invalidate_trending,is_trending,CACHE_KEY as TRENDING_KEY,LOCK_KEY,LOCK_TIMEOUT
+from posts.search import tokenize,rebuild_post_search,search_posts,post_terms
+from posts.liked import LikedSet,liked_ids,cache_key
+from posts.counters import set_comment_approval
+from posts.images import MAX_ATTEMPTS,page_image_bytes,slot_sizes,render_renditions
+from posts.form import PostForm
+from posts.templatetags.images import image_sources
+from posts.templatetags.sidebar import sidebar_view
+from jnestagram.pagination import encode_cursor
+
+User = get_user_model()
+
+small_gif = (
+    b'\x47\x49\x46\x38\x39\x61\x01\x00\x01\x00\x00\x00\x00\x21\xf9'
+    b'\x04\x01\x0a\x00\x01\x00\x2c\x00\x00\x00\x00\x01\x00\x01\x00'
+    b'\x00\x02\x02\x4c\x01\x00\x3b'
+)
+
+def create_posts(user,count,**kwargs):
+    now=timezone.now()
+    posts=[]
+    for index in range(count):
+        image=SimpleUploadedFile('test_image.gif',small_gif,content_type='image/gif')
+        post=Post.objects.create(user=user,title=f'Post {index}',text='Text',image=image,**kwargs)
+        # Spread created_at so the feed order is deterministic
+        post.created_at=now-timedelta(minutes=index)
+        Post.objects.filter(pk=post.pk).update(created_at=post.created_at)
+        posts.append(post)
+    return posts
+
+class PostListViewCursorTest(TestCase):
+    def setUp(self):
+        self.user=User.objects.create_user(username='test',password='testpassword')
+        self.posts=create_posts(self.user,15)
+        self.url=reverse('home')
+
+    def test_first_page_has_next_cursor(self):
+        response=self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['posts']),10)
+        self.assertIsNone(response.context['paginator'])
+        self.assertTrue(response.context['page_obj'].has_next)
+        self.assertTemplateUsed(response,'partials/posts/feed_next.html')
+
+    def test_follow_cursor_to_last_page(self):
+        first=self.client.get(self.url)
+        cursor=first.context['page_obj'].next_cursor
+
+        second=self.client.get(self.url,{'cursor':cursor})
+
+        first_ids=[post.pk for post in first.context['posts']]
+        second_ids=[post.pk for post in second.context['posts']]
+        self.assertEqual(len(second_ids),5)
+        self.assertFalse(set(first_ids) & set(second_ids))
+        self.assertEqual(first_ids+second_ids,[post.pk for post in self.posts])
+        self.assertFalse(second.context['page_obj'].has_next)
+
+    def test_htmx_cursor_request_renders_feed_page(self):
+        cursor=self.client.get(self.url).context['page_obj'].next_cursor
+
+        response=self.client.get(self.url,{'cursor':cursor},HTTP_HX_REQUEST='true')
+
+        self.assertTemplateUsed(response,'partials/posts/feed_page.html')
+        self.assertTemplateNotUsed(response,'posts/home.html')
+
+    def test_invalid_cursor_returns_404(self):
+        response=self.client.get(self.url,{'cursor':'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_cursor_with_wrong_value_types_returns_404(self):
+        for values in (['x','y'],[timezone.now(),'not-a-uuid'],[timezone.now()]):
+            response=self.client.get(self.url,{'cursor':encode_cursor(values)})
+            self.assertEqual(response.status_code, 404)
+
+        response=self.client.get(self.url,{'tag':'urban','cursor':encode_cursor(['x','y'])})
+        self.assertEqual(response.status_code, 404)
+
+    def test_legacy_page_param(self):
+        response=self.client.get(self.url,{'page':2})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['posts']),5)
+        self.assertEqual(response.context['page_obj'].number,2)
+
+    def test_tag_filter_with_cursor(self):
+        tag=Tag.objects.create(name='Urban',slug='urban')
+        for post in self.posts[:12]:
+            post.tag.add(tag)
+
+        first=self.client.get(self.url,{'tag':'urban'})
+        second=self.client.get(self.url,{'tag':'urban','cursor':first.context['page_obj'].next_cursor})
+
+        self.assertEqual(len(first.context['posts']),10)
+        self.assertEqual([post.pk for post in second.context['posts']],[post.pk for post in self.posts[10:12]])
+
+class TagFeedTest(TestCase):
+    def setUp(self):
+        self.user=User.objects.create_user(username='test',password='testpassword')
+        self.post=create_posts(self.user,1)[0]
+        self.tag=Tag.objects.create(name='Urban',slug='urban')
+        self.other_tag=Tag.objects.create(name='People',slug='people')
+
+    def test_feed_follows_tag_changes(self):
+        self.post.tag.set([self.tag,self.other_tag])
+        self.assertEqual(TagFeed.objects.filter(post=self.post).count(),2)
+
+        self.post.tag.set([self.other_tag])
+        self.assertEqual(list(TagFeed.objects.filter(post=self.post).values_list('tag_id',flat=True)),[self.other_tag.id])
+
+        # Reverse side of the relation
+        self.tag.tag_posts.add(self.post)
+        self.assertTrue(TagFeed.objects.filter(post=self.post,tag=self.tag).exists())
+
+        self.post.tag.clear()
+        self.assertFalse(TagFeed.objects.filter(post=self.post).exists())
+
+    def test_feed_follows_visibility(self):
+        self.post.tag.add(self.tag)
+        self.post.is_public=False
+        self.post.save()
+
+        entry=TagFeed.objects.get(post=self.post,tag=self.tag)
+        self.assertFalse(entry.is_public)
+
+        response=self.client.get(reverse('home'),{'tag':'urban'})
+        self.assertEqual(len(response.context['posts']),0)
+
+    def test_backfill_command(self):
+        self.post.tag.add(self.tag,self.other_tag)
+        TagFeed.objects.all().delete()
+
+        call_command('backfill_tag_feed',batch_size=1,stdout=StringIO())
+
+        self.assertEqual(TagFeed.objects.filter(post=self.post).count(),2)
+
+    def test_backfill_migration(self):
+        self.post.tag.add(self.tag,self.other_tag)
+        TagFeed.objects.all().delete()
+
+        migration=import_module('posts.migrations.0019_backfill_tag_feed')
+        migration.backfill_tag_feed(apps,SimpleNamespace(connection=connection))
+
+        self.assertEqual(TagFeed.objects.filter(post=self.post).count(),2)
+
+class TypedLikeTest(TestCase):
+    def setUp(self):
+        self.user=User.objects.create_user(username='test',password='testpassword')
+        self.visitor=User.objects.create_user(username='visitor',password='testpassword')
+        self.post=create_posts(self.user,1)[0]
+
+    def test_object_id_is_uuid(self):
+        like=Like.objects.create(user=self.visitor,content_object=self.post)
+        like.refresh_from_db()
+
+        self.assertEqual(like.object_id,self.post.pk)
+        self.assertEqual(self.post.likes.get(),like)
+
+    def test_home_feed_is_liked(self):
+        Like.objects.create(user=self.visitor,content_object=self.post)
+        self.client.force_login(self.visitor)
+
+        response=self.client.get(reverse('home'))
+
+        self.assertTrue(response.context['posts'][0].is_liked)
+
+class LikeToggleTest(TestCase):
+    def setUp(self):
+        self.user=User.objects.create_user(username='test',password='testpassword')
+        self.visitor=User.objects.create_user(username='visitor',password='testpassword')
+        self.post=create_posts(self.user,1)[0]
+        self.comment=Comment.objects.create(user=self.user,post=self.post,text='Comment',is_approved=True)
+
+    def test_toggle_like_and_unlike(self):
+        state=toggle_like(self.visitor,Post,self.post.pk)
+        self.assertTrue(state.is_liked)
+        self.assertEqual(state.likes_count,1)
+        self.assertEqual(state.user_id,self.user.id)
+        self.assertTrue(Like.objects.filter(user=self.visitor,object_id=self.post.pk).exists())
+
+        state=toggle_like(self.visitor,Post,str(self.post.pk))
+        self.assertFalse(state.is_liked)
+        self.assertEqual(state.likes_count,0)
+        self.assertFalse(Like.objects.filter(user=self.visitor,object_id=self.post.pk).exists())
+
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count,0)
+
+    def test_toggle_missing_or_invalid_target(self):
+        self.assertIsNone(toggle_like(self.visitor,Post,'not-a-uuid'))
+        self.assertIsNone(toggle_like(self.visitor,Post,self.comment.pk))
+        self.assertFalse(Like.objects.exists())
+
+    def test_like_view_renders_new_state(self):
+        self.client.force_login(self.visitor)
+        url=reverse('like',kwargs={'model_name':'comment','obj_id':self.comment.pk})
+
+        response=self.client.get(url)
+
+        self.assertTemplateUsed(response,'partials/likes/comment_like.html')
+        self.assertTrue(response.context['obj'].is_liked)
+        self.assertEqual(response.context['obj'].likes_count,1)
+        self.comment.refresh_from_db()
+        self.assertEqual(self.comment.likes_count,1)
+
+    def test_like_view_unknown_object(self):
+        self.client.force_login(self.visitor)
+        url=reverse('like',kwargs={'model_name':'post','obj_id':self.comment.pk})
+
+        response=self.client.get(url)
+        self.assertEqual(response.status_code,404)
+
+@override_settings(LIKE_COUNTER_SHARDS=4)
+class ShardedLikeCounterTest(TestCase):
+    def setUp(self):
+        self.user=User.objects.create_user(username='test',password='testpassword')
+        self.post=create_posts(self.user,1)[0]
+        self.fans=[User.objects.create_user(username=f'fan{index}',password='testpassword') for index in range(6)]
+
+    def test_likes_go_to_shards(self):
+        for index,fan in enumerate(self.fans):
+            state=toggle_like(fan,Post,self.post.pk)
+            self.assertEqual(state.likes_count,index+1)
+
+        toggle_like(self.fans[0],Post,self.post.pk)
+
+        # The post row itself is untouched until the rollup
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count,0)
+        self.assertTrue(LikeCounterShard.objects.exists())
+        self.assertLessEqual(LikeCounterShard.objects.count(),4)
+        self.assertEqual(fresh_likes_count(self.post),5)
+
+    def test_rollup_into_likes_count(self):
+        for fan in self.fans:
+            toggle_like(fan,Post,self.post.pk)
+
+        shards_count=LikeCounterShard.objects.count()
+        rolled=rollup_like_shards(batch_size=2)
+
+        self.assertEqual(rolled,shards_count)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count,6)
+        self.assertFalse(LikeCounterShard.objects.exists())
+        self.assertEqual(fresh_likes_count(self.post),6)
+
+
+class TrendingTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user=User.objects.create_user(username='test',password='testpassword')
+        self.tag=Tag.objects.create(name='Travel',slug='travel')
+        self.old,self.new,self.quiet=create_posts(self.user,3)
+
+        Post.objects.filter(pk=self.old.pk).update(likes_count=10,created_at=timezone.now()-timedelta(days=3))
+        Post.objects.filter(pk=self.new.pk).update(likes_count=3)
+        self.new.tag.add(self.tag)
+
+    def test_recent_engagement_ranks_first(self):
+        snapshot=refresh_trending()
+
+        self.assertEqual([entry['id'] for entry in snapshot['global']],[str(self.new.pk),str(self.old.pk)])
+        self.assertEqual([entry['id'] for entry in snapshot['by_tag']['travel']],[str(self.new.pk)])
+        self.assertEqual(snapshot['global'][0]['username'],'test')
+
+    def test_tag_boards_rank_posts_off_the_global_board(self):
+        food=Tag.objects.create(name='Food',slug='food')
+        self.old.tag.add(food)
+
+        snapshot=compute_trending(size=1)
+        self.assertEqual([entry['id'] for entry in snapshot['global']],[str(self.new.pk)])
+        self.assertEqual([entry['id'] for entry in snapshot['by_tag']['food']],[str(self.old.pk)])
+
+    def test_is_trending_reads_only_the_ids(self):
+        refresh_trending()
+        invalidate_trending()
+        cache.delete(TRENDING_KEY)
+
+        self.assertTrue(is_trending(self.new.pk))
+        self.assertFalse(is_trending(self.quiet.pk))
+
+    def test_sidebar_served_from_snapshot(self):
+        refresh_trending()
+
+        with self.assertNumQueries(0):
+            context=sidebar_view(None,AnonymousUser())
+        self.assertEqual(len(context['top_posts']),2)
+        self.assertEqual(context['tags'][0]['slug'],'travel')
+
+        Like.objects.create(user=self.user,content_object=self.new)
+        refresh_trending()
+        with self.assertNumQueries(1):
+            context=sidebar_view('travel',self.user)
+        self.assertEqual(context['liked_ids'],{str(self.new.pk)})
+        self.assertEqual(get_trending('missing')[0]['id'],str(self.new.pk))
+
+    def test_signals_invalidate_snapshot(self):
+        first=refresh_trending()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            toggle_like(self.user,Post,self.new.pk)
+        self.assertIsNot(get_snapshot(),first)
+        self.assertEqual(get_trending()[0]['likes_count'],4)
+
+        second=get_snapshot()
+        self.tag.name='Trips'
+        self.tag.save()
+        self.assertIsNot(get_snapshot(),second)
+
+    def test_stale_snapshot_served_while_locked(self):
+        first=refresh_trending()
+        Post.objects.filter(pk=self.quiet.pk).update(likes_count=50)
+        invalidate_trending()
+
+        cache.add(LOCK_KEY,True,LOCK_TIMEOUT)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_snapshot(),first)
+
+        cache.delete(LOCK_KEY)
+        invalidate_trending()
+        self.assertEqual(get_trending()[0]['id'],str(self.quiet.pk))
+
+    def test_cold_cache_while_locked(self):
+        cache.add(LOCK_KEY,True,LOCK_TIMEOUT)
+
+        snapshot=get_snapshot()
+        self.assertEqual(snapshot['global'],[])
+        self.assertEqual(snapshot['tags'][0]['slug'],'travel')
+        self.assertIsNone(cache.get(TRENDING_KEY))
+
+    def test_sidebar_fragment_follows_snapshot(self):
+        refresh_trending()
+        response=self.client.get(reverse('home'))
+        self.assertContains(response,'Travel')
+
+        Tag.objects.filter(pk=self.tag.pk).update(name='Trips')
+        response=self.client.get(reverse('home'))
+        self.assertContains(response,'Travel')
+
+        self.tag.refresh_from_db()
+        self.tag.save()
+        response=self.client.get(reverse('home'))
+        self.assertContains(response,'Trips')
+        self.assertNotContains(response,'Travel')
+
+
+class PostSearchTest(TestCase):
+    def setUp(self):
+        self.user=User.objects.create_user(username='test',password='testpassword')
+        self.travel,self.cooking,self.hidden=create_posts(self.user,3)
+        self.travel.title='Travelling to Shiraz'
+        self.travel.text='Photos of the gardens in Shiraz'
+        self.travel.save()
+        self.cooking.title='کتاب آشپزی'
+        self.cooking.text='غذاهای شیراز و باغ‌ها'
+        self.cooking.save()
+        self.hidden.text='Shiraz'
+        self.hidden.is_public=False
+        self.hidden.save()
+
+    def search(self,query,**params):
+        response=self.client.get(reverse('home'),{'q':query,**params})
+        return [post.pk for post in response.context['posts']]
+
+    def test_tokenize_normalizes_persian_and_stems_english(self):
+        self.assertEqual(tokenize('كتاب هاي'),['کتاب','های'])
+        self.assertEqual(tokenize('باغ‌ها'),tokenize('باغها'))
+        self.assertEqual(tokenize('باغها'),['باغ'])
+        self.assertEqual(tokenize('The Gardens, travelling!'),['garden','travel'])
+        self.assertEqual(tokenize('۱۴۰۳'),['1403'])
+
+    def test_stem_keeps_short_and_undoubles_stems(self):
+        words='running stopped travelling calling passing speed indeed news series stories'.split()
+        self.assertEqual(tokenize(' '.join(words)),['run','stop','travel','call','pass','speed','indeed','news','series','story'])
+
+    def test_ranks_title_matches_and_requires_every_term(self):
+        self.assertEqual(self.search('shiraz'),[self.travel.pk])
+        self.assertEqual(self.search('garden photo'),[self.travel.pk])
+        self.assertEqual(self.search('garden kitchen'),[])
+        self.assertEqual(self.search('كتاب'),[self.cooking.pk])
+        self.assertEqual(self.search('باغ'),[self.cooking.pk])
+
+    def test_index_follows_edits(self):
+        self.travel.title='Isfahan'
+        self.travel.text='Bridges'
+        self.travel.save()
+
+        self.assertEqual(self.search('shiraz'),[])
+        self.assertEqual(self.search('bridge'),[self.travel.pk])
+
+        Post.objects.filter(pk=self.travel.pk).update(likes_count=4)
+        self.travel.save(update_fields=['likes_count'])
+        self.assertEqual(self.search('bridge'),[self.travel.pk])
+
+    def test_results_are_paginated(self):
+        posts=create_posts(self.user,12)
+        Post.objects.filter(pk=posts[3].pk).update(title='Post 3 Post')
+        rebuild_post_search()
+
+        first=self.search('post')
+        self.assertEqual(len(first),10)
+        self.assertEqual(first[0],posts[3].pk)
+        self.assertEqual(len(self.search('post',page=2)),2)
+
+    def test_results_are_bounded(self):
+        create_posts(self.user,12)
+        rebuild_post_search()
+
+        self.assertEqual(search_posts(Post.objects.all(),'post',limit=5).count(),5)
+
+    def test_best_postings_of_the_rarest_term_are_ranked(self):
+        posts=create_posts(self.user,6)
+        Post.objects.filter(pk=posts[5].pk).update(title='Post Post')
+        rebuild_post_search()
+
+        self.assertEqual([post.pk for post in search_posts(Post.objects.all(),'post',candidates=1)],[posts[5].pk])
+        self.assertEqual(search_posts(Post.objects.all(),'post text',candidates=3).count(),3)
+
+    def test_rebuild(self):
+        PostSearchTerm.objects.all().delete()
+        self.assertEqual(rebuild_post_search(batch_size=2),3)
+        self.assertEqual(self.search('shiraz'),[self.travel.pk])
+
+        PostSearchTerm.objects.filter(post=self.travel,term='shiraz').update(term='stale')
+        rebuild_post_search(batch_size=2)
+        self.assertFalse(PostSearchTerm.objects.filter(term='stale').exists())
+
+    def test_backfill_migration(self):
+        PostSearchTerm.objects.all().delete()
+        PostSearchTerm.objects.create(post=self.travel,term='travell',weight=3,created_at=self.travel.created_at)
+
+        migration=import_module('posts.migrations.0021_backfill_post_search_terms')
+        migration.backfill_search_terms(apps,SimpleNamespace(connection=connection))
+
+        self.assertEqual(
+            set(PostSearchTerm.objects.filter(post=self.travel).values_list('term','weight')),
+            set(post_terms(self.travel.title,self.travel.text).items()),
+        )
+        self.assertEqual(self.search('travelled'),[self.travel.pk])
+
+
+class CommentThreadTest(TestCase):
+    def setUp(self):
+        invalidate_trending()
+        self.owner=User.objects.create_user(username='owner',password='testpassword')
+        self.reader=User.objects.create_user(username='reader',password='testpassword')
+        self.post=create_posts(self.owner,1)[0]
+        self.url=reverse('post_detail',args=[self.post.pk])
+
+        now=timezone.now()
+        self.comments=[]
+        for index in range(13):
+            comment=Comment.objects.create(post=self.post,user=self.owner,text=f'Comment {index}',is_approved=True)
+            Comment.objects.filter(pk=comment.pk).update(created_at=now-timedelta(minutes=index))
+            self.comments.append(comment)
+        Comment.objects.create(post=self.post,user=self.reader,text='Pending',is_approved=False)
+
+    def test_comments_are_paginated_newest_first(self):
+        self.client.force_login(self.reader)
+        Like.objects.create(user=self.reader,content_object=self.comments[1])
+
+        response=self.client.get(self.url)
+        comments=response.context['display_comments']
+        self.assertEqual([comment.pk for comment in comments],[comment.pk for comment in self.comments[:10]])
+        self.assertEqual([comment.is_liked for comment in comments[:3]],[False,True,False])
+        self.assertTrue(response.context['comments_page'].has_next)
+
+        cursor=response.context['comments_page'].next_cursor
+        response=self.client.get(self.url,{'cursor':cursor},HTTP_HX_REQUEST='true')
+        self.assertTemplateUsed(response,'partials/posts/comments_container.html')
+        self.assertEqual([comment.pk for comment in response.context['display_comments']],[comment.pk for comment in self.comments[10:]])
+        self.assertFalse(response.context['comments_page'].has_next)
+
+    def test_page_queries_do_not_grow_with_comments(self):
+        self.client.force_login(self.reader)
+        self.client.get(self.url)
+        with self.assertNumQueries(9):
+            self.client.get(self.url)
+
+        for index in range(20):
+            comment=Comment.objects.create(post=self.post,user=self.reader,text=f'More {index}',is_approved=True)
+            Replay.objects.create(comment=comment,user=self.owner,text='Reply')
+        with self.assertNumQueries(9):
+            self.client.get(self.url)
+
+    def test_top_comments_are_ordered_by_likes(self):
+        Comment.objects.filter(pk=self.comments[5].pk).update(likes_count=3)
+        Comment.objects.filter(pk=self.comments[2].pk).update(likes_count=7)
+
+        response=self.client.get(self.url+'?top',HTTP_HX_REQUEST='true')
+        self.assertEqual([comment.pk for comment in response.context['display_comments']],[self.comments[2].pk,self.comments[5].pk])
+
+    def test_replies_are_loaded_per_comment(self):
+        comment=self.comments[0]
+        now=timezone.now()
+        replies=[]
+        for index in range(12):
+            replay=Replay.objects.create(comment=comment,user=self.owner,text=f'Reply {index}')
+            Replay.objects.filter(pk=replay.pk).update(created_at=now-timedelta(minutes=index))
+            replies.append(replay)
+        self.client.force_login(self.reader)
+        Like.objects.create(user=self.reader,content_object=replies[0])
+
+        url=reverse('comment_replies',args=[comment.pk])
+        response=self.client.get(url)
+        self.assertEqual([replay.pk for replay in response.context['replies']],[replay.pk for replay in replies[:10]])
+        self.assertTrue(response.context['replies'][0].is_liked)
+        self.assertContains(response,'Reply 9')
+
+        response=self.client.get(url,{'cursor':response.context['page_obj'].next_cursor})
+        self.assertEqual([replay.pk for replay in response.context['replies']],[replay.pk for replay in replies[10:]])
+        self.assertFalse(response.context['page_obj'].has_next)
+
+    def test_replies_of_pending_comment_are_hidden(self):
+        pending=Comment.objects.get(is_approved=False)
+        response=self.client.get(reverse('comment_replies',args=[pending.pk]))
+        self.assertEqual(response.status_code,404)
+
+
+class LikedSetTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner=User.objects.create_user(username='owner',password='testpassword')
+        self.visitor=User.objects.create_user(username='visitor',password='testpassword')
+        self.posts=create_posts(self.owner,3)
+        self.post_type=ContentType.objects.get_for_model(Post)
+
+    def ids(self):
+        return [post.pk for post in self.posts]
+
+    def test_packed_set_membership(self):
+        liked_set=LikedSet.from_ids([self.posts[2].pk,str(self.posts[0].pk)])
+        self.assertEqual(len(liked_set),2)
+        self.assertIn(self.posts[0].pk,liked_set)
+        self.assertNotIn(self.posts[1].pk,liked_set)
+        self.assertEqual([post.pk in liked_set for post in self.posts],[True,False,True])
+
+    def test_page_is_answered_from_the_cached_set(self):
+        Like.objects.create(user=self.visitor,content_object=self.posts[1])
+        self.assertEqual(liked_ids(self.visitor,Post,self.ids()),{self.posts[1].pk})
+
+        with self.assertNumQueries(0):
+            self.assertEqual(liked_ids(self.visitor,Post,self.ids()),{self.posts[1].pk})
+
+    def test_toggle_reloads_the_cached_set(self):
+        liked_ids(self.visitor,Post,self.ids())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            toggle_like(self.visitor,Post,self.posts[0].pk)
+        self.assertIsNone(cache.get(cache_key(self.visitor.pk,self.post_type.pk)))
+        with self.assertNumQueries(1):
+            self.assertEqual(liked_ids(self.visitor,Post,self.ids()),{self.posts[0].pk})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            toggle_like(self.visitor,Post,self.posts[0].pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(liked_ids(self.visitor,Post,self.ids()),set())
+        with self.assertNumQueries(0):
+            self.assertEqual(liked_ids(self.visitor,Post,self.ids()),set())
+
+    def test_incomplete_set_falls_back_to_database(self):
+        Like.objects.create(user=self.visitor,content_object=self.posts[2])
+        Like.objects.create(user=self.visitor,content_object=self.posts[0])
+        # Only the newest like fits the window
+        cache.set(cache_key(self.visitor.pk,self.post_type.pk),(LikedSet.from_ids([self.posts[0].pk]).blob,False))
+
+        with self.assertNumQueries(1):
+            self.assertEqual(liked_ids(self.visitor,Post,self.ids()),{self.posts[0].pk,self.posts[2].pk})
+
+    def test_feed_marks_liked_posts(self):
+        Like.objects.create(user=self.visitor,content_object=self.posts[0])
+        self.client.force_login(self.visitor)
+
+        response=self.client.get(reverse('home'))
+        self.assertEqual([post.is_liked for post in response.context['posts']],[True,False,False])
+        response=self.client.get(reverse('home'),{'page':1})
+        self.assertEqual([post.is_liked for post in response.context['posts']],[True,False,False])
+
+
+class CommentCounterTest(TestCase):
+    def setUp(self):
+        self.user=User.objects.create_user(username='test',password='testpassword')
+        self.post=create_posts(self.user,1)[0]
+        self.comment=Comment.objects.create(post=self.post,user=self.user,text='First',is_approved=True)
+        Comment.objects.create(post=self.post,user=self.user,text='Pending')
+
+    def counts(self):
+        self.post.refresh_from_db()
+        self.comment.refresh_from_db()
+        return self.post.comments_count,self.comment.replays_count
+
+    def test_edits_do_not_recount(self):
+        self.comment.text='Edited'
+        with self.assertNumQueries(2):
+            self.comment.save()
+        with self.assertNumQueries(1):
+            self.comment.save(update_fields=['text'])
+        self.assertEqual(self.counts(),(1,0))
+
+    def test_approval_transitions_apply_deltas(self):
+        self.comment.is_approved=False
+        self.comment.save()
+        self.assertEqual(self.counts(),(0,0))
+
+        pending=Comment.objects.get(text='Pending')
+        self.assertTrue(set_comment_approval(pending,True))
+        self.assertFalse(set_comment_approval(pending,True))
+        self.assertEqual(self.counts(),(1,0))
+
+        pending.delete()
+        Comment.objects.create(post=self.post,user=self.user,text='Approved',is_approved=True)
+        self.assertEqual(self.counts(),(1,0))
+
+    def test_counters_never_go_negative(self):
+        Post.objects.filter(pk=self.post.pk).update(comments_count=0)
+        self.comment.delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count,0)
+
+    def test_replies_apply_deltas(self):
+        replays=[Replay.objects.create(comment=self.comment,user=self.user,text=f'Reply {index}') for index in range(3)]
+        replays[0].text='Edited'
+        replays[0].save()
+        self.assertEqual(self.counts(),(1,3))
+
+        replays[1].delete()
+        self.assertEqual(self.counts(),(1,2))
+
+
+class ReconcileCountersTest(TestCase):
+    def setUp(self):
+        self.user=User.objects.create_user(username='test',password='testpassword')
+        self.fan=User.objects.create_user(username='fan',password='testpassword')
+        self.post,self.other=create_posts(self.user,2)
+        self.comment=Comment.objects.create(post=self.post,user=self.user,text='Approved',is_approved=True)
+        Comment.objects.create(post=self.post,user=self.user,text='Pending')
+        self.replay=Replay.objects.create(comment=self.comment,user=self.user,text='Reply')
+        for user in (self.user,self.fan):
+            Like.objects.create(user=user,content_object=self.post)
+        Like.objects.create(user=self.fan,content_object=self.replay)
+
+    def reconcile(self,*args):
+        out=StringIO()
+        call_command('reconcile_counters','--batch-size=1',*args,stdout=out)
+        return out.getvalue()
+
+    def counters(self):
+        return (
+            Post.objects.get(pk=self.post.pk).likes_count,
+            Post.objects.get(pk=self.post.pk).comments_count,
+            Comment.objects.get(pk=self.comment.pk).replays_count,
+            Replay.objects.get(pk=self.replay.pk).likes_count,
+            Post.objects.get(pk=self.other.pk).likes_count,
+        )
+
+    def drift(self):
+        Post.objects.filter(pk=self.post.pk).update(likes_count=7,comments_count=5)
+        Post.objects.filter(pk=self.other.pk).update(likes_count=3)
+        Comment.objects.filter(pk=self.comment.pk).update(replays_count=0)
+        Replay.objects.filter(pk=self.replay.pk).update(likes_count=4)
+
+    def test_dry_run_only_reports(self):
+        self.drift()
+        output=self.reconcile('--dry-run')
+
+        self.assertIn('Post.likes_count: 2 drifted',output)
+        self.assertIn('5 counters would be corrected.',output)
+        self.assertEqual(self.counters(),(7,5,0,4,3))
+
+    def test_corrects_drifted_counters(self):
+        self.drift()
+        output=self.reconcile()
+
+        self.assertIn('Post.comments_count: 1 corrected',output)
+        self.assertIn('Comment.likes_count: 0 corrected',output)
+        self.assertEqual(self.counters(),(2,1,1,1,0))
+        self.assertIn('0 counters corrected.',self.reconcile())
+
+    def test_pending_shards_are_accounted_for(self):
+        post_type=ContentType.objects.get_for_model(Post)
+        LikeCounterShard.objects.create(content_type=post_type,object_id=self.post.pk,shard=0,count=2)
+        Post.objects.filter(pk=self.post.pk).update(likes_count=0)
+
+        self.assertIn('0 counters corrected.',self.reconcile())
+
+    def test_since_skips_untouched_rows(self):
+        self.drift()
+        Post.objects.update(created_at=timezone.now()-timedelta(days=10))
+        Like.objects.filter(object_id=self.post.pk).update(created_at=timezone.now()-timedelta(days=10))
+        since=(timezone.now()-timedelta(days=1)).date().isoformat()
+
+        self.reconcile(f'--since={since}')
+        self.assertEqual(self.counters(),(7,1,1,1,3))
+
+    def test_since_only_touches_candidates(self):
+        posts=sorted([self.post,self.other,*create_posts(self.user,1)],key=lambda post:post.pk)
+        Post.objects.update(likes_count=9,created_at=timezone.now()-timedelta(days=10))
+        Like.objects.update(created_at=timezone.now()-timedelta(days=10))
+        # The outer posts are candidates, the one between them in pk order is not
+        Post.objects.filter(pk__in=[posts[0].pk,posts[2].pk]).update(created_at=timezone.now())
+        since=(timezone.now()-timedelta(days=1)).date().isoformat()
+
+        out=StringIO()
+        call_command('reconcile_counters','--batch-size=5',f'--since={since}',stdout=out)
+
+        likes={post.pk:post.likes_count for post in Post.objects.all()}
+        self.assertEqual(likes[posts[1].pk],9)
+        self.assertNotEqual(likes[posts[0].pk],9)
+        self.assertNotEqual(likes[posts[2].pk],9)
+
+    def test_since_catches_unapproved_comments(self):
+        Post.objects.update(created_at=timezone.now()-timedelta(days=10))
+        # Un-approved without the signals, the post keeps counting it
+        Comment.objects.filter(pk=self.comment.pk).update(is_approved=False,updated_at=timezone.now())
+        since=(timezone.now()-timedelta(days=1)).date().isoformat()
+
+        self.assertIn('Post.comments_count: 1 corrected',self.reconcile(f'--since={since}'))
+        self.assertEqual(Post.objects.get(pk=self.post.pk).comments_count,0)
+
+
+class ImageQueueTest(TestCase):
+    def setUp(self):
+        self.user=User.objects.create_user(username='test',password='testpassword')
+        self.post=create_posts(self.user,1)[0]
+
+    def process(self,workers=0):
+        call_command('process_images',workers=workers,once=True,stdout=StringIO())
+        self.post.refresh_from_db()
+
+    def test_upload_is_stored_and_queued(self):
+        self.post.refresh_from_db()
+        job=ImageJob.objects.get()
+
+        self.assertEqual(self.post.image_status,IMAGE_PENDING)
+        self.assertTrue(self.post.image.name.endswith('.gif'))
+        self.assertEqual(job.source,self.post.image.name)
+        self.assertEqual(job.content_object,self.post)
+
+    def test_worker_replaces_upload(self):
+        original=self.post.image.name
+        self.process()
+
+        self.assertEqual(self.post.image_status,IMAGE_READY)
+        self.assertTrue(self.post.image.name.endswith('.webp'))
+        self.assertFalse(self.post.image.storage.exists(original))
+        with Image.open(self.post.image) as image:
+            self.assertEqual((image.format,image.size),('WEBP',(1080,566)))
+        self.assertFalse(ImageJob.objects.exists())
+
+    def test_worker_stores_renditions(self):
+        self.process()
+        renditions={(rendition['format'],rendition['width']):rendition for rendition in self.post.image_renditions}
+
+        self.assertEqual(sorted(renditions),[(format,width) for format in ('avif','webp') for width in (160,360,720,1080)])
+        self.assertEqual(renditions[('webp',1080)]['name'],self.post.image.name)
+        with self.post.image.storage.open(renditions[('avif',360)]['name']) as file:
+            self.assertEqual(file.size,renditions[('avif',360)]['size'])
+            with Image.open(file) as image:
+                self.assertEqual((image.format,image.size),('AVIF',(360,189)))
+
+    def test_new_upload_deletes_old_renditions(self):
+        self.process()
+        storage=self.post.image.storage
+        old=[rendition['name'] for rendition in self.post.image_renditions]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.image=SimpleUploadedFile('second.gif',small_gif,content_type='image/gif')
+            self.post.save()
+
+        self.assertEqual(self.post.image_renditions,[])
+        self.assertFalse(any(storage.exists(name) for name in old))
+
+    def test_generate_renditions_for_existing_images(self):
+        self.process()
+        name=self.post.image.name
+        Post.objects.filter(pk=self.post.pk).update(image_renditions=[])
+
+        call_command('generate_renditions',workers=0,stdout=StringIO())
+        self.post.refresh_from_db()
+
+        self.assertEqual(self.post.image.name,name)
+        self.assertEqual(len(self.post.image_renditions),8)
+        self.assertIn({'format':'webp','width':1080,'name':name,'size':self.post.image.size},self.post.image_renditions)
+        self.assertFalse(ImageJob.objects.exists())
+
+    def test_image_sources(self):
+        renditions=[
+            {'format':'webp','width':360,'name':'posts/a-360w.webp','size':20},
+            {'format':'avif','width':720,'name':'posts/a-720w.avif','size':30},
+            {'format':'avif','width':360,'name':'posts/a-360w.avif','size':10},
+        ]
+        html=image_sources(renditions,'feed')
+
+        self.assertEqual(html,
+            f'<source type="image/avif" srcset="/media/posts/a-360w.avif 360w, /media/posts/a-720w.avif 720w" sizes="{slot_sizes("feed")}">'
+            f'<source type="image/webp" srcset="/media/posts/a-360w.webp 360w" sizes="{slot_sizes("feed")}">'
+        )
+        self.assertEqual(slot_sizes('feed'),'(min-width: 1280px) 660px, (min-width: 768px) 55vw, calc(100vw - 48px)')
+        self.assertEqual(image_sources([],'feed'),'')
+
+    def test_feed_image_report(self):
+        self.process()
+        full,responsive=page_image_bytes([(self.post.image_renditions,'feed'),(self.post.image_renditions,'feed')],390,2)
+        renditions={(rendition['format'],rendition['width']):rendition['size'] for rendition in self.post.image_renditions}
+
+        self.assertEqual((full,responsive),(renditions[('webp',1080)],renditions[('avif',720)]))
+        output=StringIO()
+        call_command('feed_image_report',stdout=output)
+        self.assertIn('Page 1: 1 posts',output.getvalue())
+
+    def test_process_pool(self):
+        create_posts(self.user,3)
+        self.process(workers=2)
+
+        self.assertFalse(ImageJob.objects.exists())
+        self.assertEqual(Post.objects.filter(image_status=IMAGE_READY).count(),4)
+
+    def test_save_without_upload_queues_nothing(self):
+        self.process()
+        self.post.title='Renamed'
+        self.post.save()
+
+        self.assertFalse(ImageJob.objects.exists())
+
+    def test_new_upload_supersedes_queued_job(self):
+        self.post.image=SimpleUploadedFile('second.gif',small_gif,content_type='image/gif')
+        self.post.save()
+
+        self.assertEqual(ImageJob.objects.get().source,self.post.image.name)
+
+    def test_broken_upload_fails_after_retries(self):
+        self.post.image=SimpleUploadedFile('broken.jpg',b'not an image',content_type='image/jpeg')
+        self.post.save()
+        self.process()
+
+        job=ImageJob.objects.get()
+        self.assertEqual(job.status,ImageJob.STATUS_FAILED)
+        self.assertEqual(job.attempts,MAX_ATTEMPTS)
+        self.assertIn('UnidentifiedImageError',job.error)
+        self.assertEqual(self.post.image_status,IMAGE_FAILED)
+
+    def test_deleted_post_drops_job(self):
+        Post.objects.filter(pk=self.post.pk).delete()
+        call_command('process_images',workers=0,once=True,stdout=StringIO())
+
+        self.assertFalse(ImageJob.objects.exists())
+
+
+def image_upload(name,format,size):
+    data=io.BytesIO()
+    Image.new('RGB',size,(200,80,40)).save(data,format)
+    return SimpleUploadedFile(name,data.getvalue(),content_type=f'image/{format.lower()}')
+
+@override_settings(IMAGE_MAX_PIXELS=4000*3000,IMAGE_MAX_DECODE_PIXELS=1000*1000)
+class ImageDecodingTest(TestCase):
+    def setUp(self):
+        self.user=User.objects.create_user(username='test',password='testpassword')
+
+    def form(self,image):
+        return PostForm(data={'title':'Post','text':'Text','is_public':True},files={'image':image})
+
+    def test_oversized_upload_is_rejected_by_header(self):
+        form=self.form(image_upload('big.png','PNG',(1200,1000)))
+
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors.as_data()['image'][0].code,'image_too_large')
+
+    def test_reduced_formats_get_the_higher_limit(self):
+        self.assertTrue(self.form(image_upload('big.jpg','JPEG',(1200,1000))).is_valid())
+        self.assertFalse(self.form(image_upload('huge.jpg','JPEG',(4100,3000))).is_valid())
+
+    def test_jpeg_is_decoded_reduced(self):
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as file:
+            Image.new('RGB',(4320,2264),(200,80,40)).save(file,'JPEG')
+            file.flush()
+            renditions,metrics=render_renditions(file.name,1080,566,[360,1080],'WEBP')
+
+        self.assertEqual((metrics['source'],metrics['decoded']),((4320,2264),(1080,566)))
+        self.assertEqual(metrics['decoded_bytes'],1080*566*4)
+        self.assertGreater(metrics['peak_memory'],0)
+        with Image.open(io.BytesIO(renditions[-1][1])) as image:
+            self.assertEqual(image.size,(1080,566))
+
+    def test_worker_fails_oversized_image_without_retries(self):
+        post=Post.objects.create(user=self.user,title='Post',text='Text',image=image_upload('big.png','PNG',(1200,1000)))
+        call_command('process_images',workers=0,once=True,stdout=StringIO())
+        post.refresh_from_db()
+
+        job=ImageJob.objects.get()
+        self.assertEqual((job.status,job.attempts),(ImageJob.STATUS_FAILED,1))
+        self.assertIn('ImageTooLarge',job.error)
+        self.assertEqual(post.image_status,IMAGE_FAILED)
+
+    def test_worker_reports_memory_per_image(self):
+        Post.objects.create(user=self.user,title='Post',text='Text',image=image_upload('photo.jpg','JPEG',(2160,1132)))
+        output=StringIO()
+        call_command('process_images',workers=0,once=True,verbosity=2,stdout=output)
+
+        self.assertIn('image: 2160x1132 decoded at 1080x566',output.getvalue())
+        self.assertIn('peak memory',output.getvalue())
@@ -0,0 +1,178 @@
+import heapq
+import math
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db.models import F,Q,Window
+from django.db.models.functions import RowNumber,TruncHour
+from django.utils import timezone
+
+from .models import Post,Tag,TagFeed
+
+CACHE_KEY='posts:trending'
+IDS_KEY='posts:trending:ids'
+CACHE_TIMEOUT=15*60
+FRESH_KEY='posts:trending:fresh'
+STALE_TIMEOUT=24*60*60
+LOCK_KEY='posts:trending:lock'
+LOCK_TIMEOUT=60
+MEMORY_TTL=60
+LIKES_THROTTLE_KEY='posts:trending:likes'
+LIKES_THROTTLE=60
+
+TRENDING_SIZE=10
+TRENDING_WINDOW=timedelta(days=30)
+COMMENT_WEIGHT=2
+GRAVITY=1.5
+
+_snapshot=None
+_trending_ids=None
+_loaded_at=0
+
+
+def trending_score(likes_count,comments_count,created_at,now):
+    # Engagement decays with age, so old posts leave the board on their own
+    age_hours=max((now-created_at).total_seconds(),0)/3600
+    return (likes_count+COMMENT_WEIGHT*comments_count)/math.pow(age_hours+2,GRAVITY)
+
+def file_url(field,name):
+    return field.storage.url(name) if name else ''
+
+def load_tags():
+    return [
+        {'id':tag_id,'name':name,'slug':slug,'icon_url':file_url(Tag._meta.get_field('icon'),icon)}
+        for tag_id,name,slug,icon in Tag.objects.values_list('id','name','slug','icon')
+    ]
+
+def most_engaged(queryset,prefix,partition,size,*fields):
+    # Posts of the same hour decay nearly alike, so each hour only sends its most engaged
+    # posts to be scored and the rows read stay bounded however busy the window was
+    engagement=F(f'{prefix}likes_count')+COMMENT_WEIGHT*F(f'{prefix}comments_count')
+    return queryset.filter(
+        Q(**{f'{prefix}likes_count__gt':0})|Q(**{f'{prefix}comments_count__gt':0}),
+        **{f'{prefix}is_active':True,f'{prefix}is_public':True},
+    ).annotate(
+        rank=Window(RowNumber(),partition_by=[*partition,TruncHour('created_at')],order_by=[engagement.desc(),F('created_at').desc()]),
+    ).filter(rank__lte=size).values_list(
+        *fields,
+        *(f'{prefix}{name}' for name in ('id','title','image','image_renditions','user__username','likes_count','comments_count','created_at')),
+    )
+
+def compute_trending(size=TRENDING_SIZE,window=TRENDING_WINDOW):
+    now=timezone.now()
+    since=now-window
+    image_field=Post._meta.get_field('image')
+
+    entries={}
+    def entry(pk,title,image,renditions,username,likes_count,comments_count,created_at):
+        if pk not in entries:
+            entries[pk]={
+                'id':str(pk),
+                'title':title,
+                'image_url':file_url(image_field,image),
+                'image_renditions':renditions,
+                'username':username,
+                'likes_count':likes_count,
+                'comments_count':comments_count,
+                'score':trending_score(likes_count,comments_count,created_at,now),
+            }
+        return entries[pk]
+
+    # Only the engaged posts of the decay window are scored, older ones can not rank anymore
+    for row in most_engaged(Post.objects.filter(created_at__gte=since),'',[],size):
+        entry(*row)
+    board=list(entries.values())
+
+    tags=load_tags()
+    slugs={tag['id']:tag['slug'] for tag in tags}
+
+    tagged=defaultdict(list)
+    feed=TagFeed.objects.filter(is_active=True,is_public=True,created_at__gte=since,tag_id__in=slugs)
+    for tag_id,*row in most_engaged(feed,'post__',[F('tag_id')],size,'tag_id'):
+        tagged[slugs[tag_id]].append(entry(*row))
+
+    def top(candidates):
+        return heapq.nlargest(size,candidates,key=lambda entry:entry['score'])
+
+    return {
+        'computed_at':now,
+        'tags':tags,
+        'global':top(board),
+        'by_tag':{slug:top(candidates) for slug,candidates in tagged.items()},
+    }
+
+def trending_ids(snapshot):
+    boards=[snapshot['global'],*snapshot['by_tag'].values()]
+    return frozenset(entry['id'] for board in boards for entry in board)
+
+def refresh_trending():
+    global _snapshot,_trending_ids,_loaded_at
+
+    snapshot=compute_trending()
+    ids=trending_ids(snapshot)
+    # The snapshot outlives its freshness so it can still be served while it is recomputed,
+    # its ids are kept apart for the checks on every like and save
+    cache.set_many({CACHE_KEY:snapshot,IDS_KEY:ids},STALE_TIMEOUT)
+    cache.set(FRESH_KEY,True,CACHE_TIMEOUT)
+    _snapshot,_trending_ids,_loaded_at=snapshot,ids,time.monotonic()
+    return snapshot
+
+def empty_snapshot():
+    return {'computed_at':timezone.now(),'tags':load_tags(),'global':[],'by_tag':{}}
+
+def rebuild_trending(stale):
+    # Only the worker holding the lock recomputes, the others serve the stale snapshot meanwhile
+    if not cache.add(LOCK_KEY,True,LOCK_TIMEOUT):
+        return stale
+    try:
+        return refresh_trending()
+    finally:
+        cache.delete(LOCK_KEY)
+
+def get_snapshot():
+    global _snapshot,_trending_ids,_loaded_at
+
+    if _snapshot is not None and time.monotonic()-_loaded_at < MEMORY_TTL:
+        return _snapshot
+
+    cached=cache.get_many([CACHE_KEY,FRESH_KEY])
+    snapshot=cached.get(CACHE_KEY)
+    if snapshot is None or FRESH_KEY not in cached:
+        snapshot=rebuild_trending(snapshot)
+        if snapshot is None:
+            # Cold cache while another worker computes the first snapshot
+            return empty_snapshot()
+
+    _snapshot,_trending_ids,_loaded_at=snapshot,trending_ids(snapshot),time.monotonic()
+    return snapshot
+
+def get_trending(tag_slug=None,limit=4):
+    snapshot=get_snapshot()
+    if tag_slug and snapshot['by_tag'].get(tag_slug):
+        return snapshot['by_tag'][tag_slug][:limit]
+    return snapshot['global'][:limit]
+
+def get_tags():
+    return get_snapshot()['tags']
+
+def trending_version():
+    # Part of the sidebar fragment key, a new snapshot renders a new fragment
+    return get_snapshot()['computed_at'].isoformat()
+
+def is_trending(post_id):
+    ids=_trending_ids if _trending_ids is not None else cache.get(IDS_KEY)
+    return ids is not None and str(post_id) in ids
+
+def invalidate_trending():
+    global _snapshot,_trending_ids
+
+    # Only mark the snapshot stale, the next reader recomputes it under the lock
+    cache.delete(FRESH_KEY)
+    _snapshot=_trending_ids=None
+
+def invalidate_trending_for_likes():
+    # Likes on a hot post arrive in bursts, recompute at most once a minute for them
+    if cache.add(LIKES_THROTTLE_KEY,True,LIKES_THROTTLE):
+        invalidate_trending()
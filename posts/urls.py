@@ -3,7 +3,8 @@ from django.views.generic import TemplateView
 
 from .views import (PostListView, LikeView, PostCreateView, PostUpdateView,
                     PostDeleteView, CommentCreateView, CommentUpdateView,
-                    CommentDeleteView, PostDetailView,ReplayCreateView,ReplayDeleteView)
+                    CommentDeleteView, PostDetailView,ReplayCreateView,ReplayDeleteView,
+                    CommentRepliesView)
 
 urlpatterns = [
     path('',PostListView.as_view(),name='home'),
@@ -16,6 +17,7 @@ urlpatterns = [
     path('comment/<pk>/edit/', CommentUpdateView.as_view(), name='update_comment'),
     path('comment/<pk>/delete/', CommentDeleteView.as_view(), name='delete_comment'),
     path('comment/<pk>/replay/', ReplayCreateView.as_view(), name='replay'),
+    path('comment/<uuid:pk>/replies/', CommentRepliesView.as_view(), name='comment_replies'),
     path('replay/<pk>/delete',ReplayDeleteView.as_view(), name='delete_replay'),
     path('about/',TemplateView.as_view(template_name='about.html'),name='about'),
 ]
\ No newline at end of file
@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.utils.translation import gettext_lazy as _
+
+from PIL import Image
+
+# Formats Pillow can decode at 1/2, 1/4 or 1/8 scale, the rest decode at full size
+REDUCED_DECODE_FORMATS={'JPEG','MPO'}
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+def pixel_limit(format):
+    return settings.IMAGE_MAX_PIXELS if format in REDUCED_DECODE_FORMATS else settings.IMAGE_MAX_DECODE_PIXELS
+
+def check_pixels(image):
+    # Reads the header only, a decompression bomb is refused before any pixel is decoded
+    limit=pixel_limit(image.format)
+    if image.width*image.height > limit:
+        raise ImageTooLarge(f'{image.width}x{image.height} {image.format} is over the {limit} pixel limit')
+
+def validate_image_pixels(file):
+    # Stored files were checked when they were uploaded
+    if getattr(file,'_committed',False):
+        return
+
+    limit=settings.IMAGE_MAX_PIXELS
+    file.seek(0)
+    try:
+        with Image.open(file) as image:
+            limit=pixel_limit(image.format)
+            check_pixels(image)
+    except (ImageTooLarge,Image.DecompressionBombError):
+        raise ValidationError(
+            _('The image is too large, upload one of at most %(megapixels)s megapixels.'),
+            code='image_too_large',
+            params={'megapixels':limit//1_000_000},
+        )
+    except OSError:
+        # Not an image, the image field reports it
+        pass
+    finally:
+        file.seek(0)
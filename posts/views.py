@@ -3,18 +3,20 @@ from django.shortcuts import get_object_or_404,render
 from django.views.generic import ListView, CreateView, UpdateView, DeleteView,DetailView,View
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin,UserPassesTestMixin
-from django.contrib.contenttypes.models import ContentType
-from django.db import transaction
-from django.db.models import Prefetch,OuterRef,Exists,Value,BooleanField,CharField
-from django.db.models.functions import Cast
-from django.http import HttpResponseRedirect,HttpResponse
+from django.db.models import F
+from django.http import HttpResponseRedirect,HttpResponse,Http404
 from django.urls import reverse,reverse_lazy
 from django.utils.http import url_has_allowed_host_and_scheme
 from django.utils.translation import gettext_lazy as _
 
 from .models import Post,Tag,Like,Comment,Replay
 from .form import PostForm, CommentForm,ReplayForm
+from .likes import toggle_like
+from .liked import mark_liked
+from .trending import get_trending
+from .search import search_posts
 from features.views import feature_enabled
+from jnestagram.pagination import KeysetPaginator
 
 
 class PostListView(ListView):
@@ -32,106 +34,108 @@ class PostListView(ListView):
 
         tag_slug = self.request.GET.get('tag')
         if tag_slug:
-            queryset = queryset.filter(tag__slug=tag_slug)
+            # Tag pages read the denormalized tag feed instead of the M2M join
+            queryset = queryset.filter(
+                tag_feed__tag__slug=tag_slug,
+                tag_feed__is_active=True,
+                tag_feed__is_public=True,
+            ).annotate(feed_created_at=F('tag_feed__created_at'),feed_post_id=F('tag_feed__post_id'))
 
 
-        if self.request.user.is_authenticated:
-            post_type = ContentType.objects.get_for_model(Post)
-            user_likes=Like.objects.filter(
-                user=self.request.user,
-                content_type=post_type,
-                object_id=Cast(OuterRef('pk'),CharField()),
-            )
-            queryset = queryset.annotate(is_liked=Exists(user_likes))
-        else:
-            queryset = queryset.annotate(is_liked=Value(False,output_field=BooleanField()))
+        query = self.request.GET.get('q')
+        if query:
+            return search_posts(queryset, query)
+
+        return queryset.order_by(*self.get_feed_ordering())
+
+    def get_feed_ordering(self):
+        if self.request.GET.get('tag'):
+            return ('-feed_created_at','-feed_post_id')
+        return ('-created_at','-id')
+
+    def is_cursor_mode(self):
+        # ?page= keeps the legacy numbered pagination working, ranked search results use it too
+        return 'page' not in self.request.GET and not self.request.GET.get('q')
+
+    def paginate_queryset(self, queryset, page_size):
+        if not self.is_cursor_mode():
+            paginator,page,object_list,is_paginated=super().paginate_queryset(queryset, page_size)
+            page.object_list=mark_liked(self.request.user,object_list)
+            return paginator,page,page.object_list,is_paginated
 
-        return queryset.order_by('-created_at').distinct()
+        paginator=KeysetPaginator(self.get_feed_ordering(),page_size)
+        page=paginator.paginate(queryset,self.request.GET.get('cursor'))
+        mark_liked(self.request.user,page.object_list)
+        return None,page,page.object_list,page.has_next
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
         current_tag = self.request.GET.get('tag')
-        try:
-            feature_herobutton=feature_enabled(1,'Jarvis')
-        except:
-            feature_herobutton=False
+        feature_herobutton=feature_enabled(1,'Jarvis',key=self.request.user.pk)
 
 
         context['current_tag']=current_tag
+        context['query']=self.request.GET.get('q','')
         context['feature_herobutton']=feature_herobutton
 
         return context
 
+    def render_to_response(self, context, **response_kwargs):
+        if self.request.htmx and self.is_cursor_mode():
+            return render(self.request,'partials/posts/feed_page.html',{
+                'posts':context['posts'],
+                'page_obj':context['page_obj'],
+                'current_tag':context['current_tag'],
+            })
+
+        return super().render_to_response(context, **response_kwargs)
+
 class PostDetailView(DetailView):
     model = Post
     template_name = 'posts/post_detail.html'
     context_object_name = 'post'
 
-    def get_queryset(self):
-        replays=Replay.objects.select_related('user','comment').prefetch_related('likes')
-        approved_comments=Comment.objects.filter(is_approved=True).select_related('user','post').prefetch_related('likes')
-        queryset= Post.objects.filter(is_active=True).select_related('user').prefetch_related('tag','likes')
-
-        if self.request.user.is_authenticated:
-            post_type = ContentType.objects.get_for_model(Post)
-            comment_type = ContentType.objects.get_for_model(Comment)
-            replay_type=ContentType.objects.get_for_model(Replay)
-            user_post_likes=Like.objects.filter(
-                user=self.request.user,
-                content_type=post_type,
-                object_id=Cast(OuterRef('pk'),CharField()),
-            )
-            user_comment_likes=Like.objects.filter(
-                user=self.request.user,
-                content_type=comment_type,
-                object_id=Cast(OuterRef('pk'),CharField()),
-            )
-            user_replay_likes=Like.objects.filter(
-                user=self.request.user,
-                content_type=replay_type,
-                object_id=Cast(OuterRef('pk'),CharField()),
-            )
-            queryset = queryset.annotate(is_liked=Exists(user_post_likes))
-            approved_comments=approved_comments.annotate(is_liked=Exists(user_comment_likes))
-            replays=replays.annotate(is_liked=Exists(user_replay_likes))
-        else:
-            queryset = queryset.annotate(is_liked=Value(False,output_field=BooleanField()))
-            approved_comments=approved_comments.annotate(is_liked=Value(False,output_field=BooleanField()))
-            replays=replays.annotate(is_liked=Value(False,output_field=BooleanField()))
+    comments_per_page = 10
 
-        approved_comments=approved_comments.prefetch_related(
-            Prefetch('comment_replays', queryset=replays, to_attr='replies'),
-        )
+    def get_queryset(self):
+        return Post.objects.filter(is_active=True).select_related('user').prefetch_related('tag')
 
-        top_comments=approved_comments.filter(likes_count__gt=0).order_by('-likes_count')[:4]
-        queryset=queryset.prefetch_related(
-            Prefetch('post_comments', queryset=approved_comments,to_attr='approved_comments_list'),
-            Prefetch('post_comments', queryset=top_comments, to_attr='top_comments'),
-        )
+    def get_object(self, queryset=None):
+        post=super().get_object(queryset)
+        mark_liked(self.request.user,[post])
+        return post
 
-        return queryset
+    def is_top_comments(self):
+        return 'top' in self.request.GET
 
-    def get_context_data(self, **kwargs):
-        context= super().get_context_data(**kwargs)
+    def get_comments_page(self):
+        # One page of comments, replies are loaded per comment by CommentRepliesView
         post=self.object
+        comments=Comment.objects.filter(post=post,is_approved=True).select_related('user__profile')
 
-        if 'top' in self.request.GET:
-            comments = post.top_comments
+        if self.is_top_comments():
+            ordering=('-likes_count','-created_at','-id')
+            comments=comments.filter(likes_count__gt=0)
         else:
-            comments=post.approved_comments_list
+            ordering=('-created_at','-id')
 
-        context['display_comments']=comments
+        page=KeysetPaginator(ordering,self.comments_per_page).paginate(comments,self.request.GET.get('cursor'))
+        for comment in page:
+            comment.post=post
+        mark_liked(self.request.user,page.object_list)
+        return page
+
+    def get_context_data(self, **kwargs):
+        context= super().get_context_data(**kwargs)
+        comments_page=self.get_comments_page()
+
+        context['display_comments']=comments_page.object_list
+        context['comments_page']=comments_page
+        context['top_comments']=self.is_top_comments()
         context['current_tag'] = self.request.GET.get('tag')
 
-        context['top_posts'] = Post.objects.select_related('user').prefetch_related(
-            'tag',
-            'likes'
-        ).filter(
-            is_active=True,
-            is_public=True,
-            likes_count__gt=0
-        ).order_by('-likes_count','-comments_count')[:4]
+        context['top_posts'] = get_trending(context['current_tag'])
 
         return context
 
@@ -140,10 +144,45 @@ class PostDetailView(DetailView):
             return render(
                 self.request,
                 'partials/posts/comments_container.html',
-                {'display_comments': context['display_comments'],'post':self.object},)
+                {
+                    'display_comments': context['display_comments'],
+                    'comments_page': context['comments_page'],
+                    'top_comments': context['top_comments'],
+                    'post':self.object,
+                },)
 
         return super().render_to_response(context, **response_kwargs)
 
+class CommentRepliesView(ListView):
+    model = Replay
+    template_name = 'partials/posts/replies_page.html'
+    context_object_name = 'replies'
+    paginate_by = 10
+
+    def get(self, request, *args, **kwargs):
+        self.comment = get_object_or_404(
+            Comment.objects.select_related('post__user'),
+            pk=self.kwargs['pk'],
+            is_approved=True,
+            post__is_active=True,
+        )
+        return super().get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        return Replay.objects.filter(comment=self.comment).select_related('user__profile')
+
+    def paginate_queryset(self, queryset, page_size):
+        page = KeysetPaginator(('-created_at','-id'),page_size).paginate(queryset,self.request.GET.get('cursor'))
+        for replay in page:
+            replay.comment = self.comment
+        mark_liked(self.request.user,page.object_list)
+        return None,page,page.object_list,page.has_next
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['comment'] = self.comment
+        return context
+
 class PostCreateView(LoginRequiredMixin,CreateView):
     model=Post
     form_class=PostForm
@@ -402,33 +441,12 @@ class LikeView(LoginRequiredMixin,View):
         if not target_model:
             return HttpResponse('Model Not Found!',status=404)
 
-        obj=get_object_or_404(target_model, pk=obj_id)
-
-        with transaction.atomic():
-            content_type=ContentType.objects.get_for_model(obj)
-            object_id_str = str(obj.id)
-            like_qs = Like.objects.filter(user=request.user, content_type=content_type,object_id=object_id_str)
-
-            if like_qs.exists():
-                like_qs.delete()
-                is_liked=False
-            else:
-                Like.objects.get_or_create(
-                    user=request.user,
-                    content_type=content_type,
-                    object_id=object_id_str
-                )
-                is_liked=True
-
-            total_likes = Like.objects.filter(
-                content_type=content_type,
-                object_id=object_id_str
-            ).count()
-
-            obj.likes_count=total_likes
-            obj.save(update_fields=['likes_count'])
-
-        obj.is_liked = is_liked
+        state=toggle_like(request.user,target_model,obj_id)
+        if state is None:
+            raise Http404('Object Not Found!')
+
+        obj=target_model(pk=obj_id,user_id=state.user_id,likes_count=state.likes_count)
+        obj.is_liked = state.is_liked
         template_name=f'partials/likes/{model_name.lower()}_like.html'
         return render(request,template_name,{
                 'obj':obj,
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from profiles.search import rebuild_user_search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the user search tokens of every active user in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size',type=int,default=1000)
+
+    def handle(self, *args, **options):
+        total=rebuild_user_search(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Search tokens rebuilt for {total} users.'))
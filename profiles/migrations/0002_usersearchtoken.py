@@ -0,0 +1,31 @@
+# Generated by Django 6.0.2 on 2026-10-18 08:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=150, verbose_name='Token')),
+                ('field', models.PositiveSmallIntegerField(choices=[(0, 'Username'), (1, 'Name')], default=0, verbose_name='Field')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+            options={
+                'verbose_name': 'User Search Token',
+                'verbose_name_plural': 'User Search Tokens',
+                'db_table': 'profiles_user_search_tokens',
+                'indexes': [models.Index(fields=['token'], name='profile_search_token_idx', opclasses=['varchar_pattern_ops'])],
+            },
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 6.0.2 on 2026-10-18 09:30
+
+from django.conf import settings
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+
+def user_tokens(username, first_name, last_name):
+    # Frozen copy of profiles.search.user_tokens
+    def normalize(text):
+        return ' '.join((text or '').casefold().split())
+
+    tokens = {(normalize(username)[:150], 0)}
+    name = normalize(f'{first_name} {last_name}')
+    for word in {*name.split(), name}:
+        tokens.add((word[:150], 1))
+    return {(token, field) for token, field in tokens if token}
+
+
+def backfill_tokens(apps, schema_editor):
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    UserSearchToken = apps.get_model('profiles', 'UserSearchToken')
+
+    last_id = 0
+    while True:
+        users = list(User.objects.filter(is_active=True, pk__gt=last_id).order_by('pk').values_list('pk', 'username', 'first_name', 'last_name')[:BATCH_SIZE])
+        if not users:
+            break
+
+        UserSearchToken.objects.bulk_create([
+            UserSearchToken(user_id=pk, token=token, field=field)
+            for pk, username, first_name, last_name in users
+            for token, field in user_tokens(username, first_name, last_name)
+        ], batch_size=BATCH_SIZE)
+        last_id = users[-1][0]
+
+
+def clear_tokens(apps, schema_editor):
+    apps.get_model('profiles', 'UserSearchToken').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('profiles', '0002_usersearchtoken'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_tokens, clear_tokens),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0.2 on 2026-10-18 09:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0003_backfill_user_search_tokens'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='avatar_status',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'Ready'), (1, 'Pending'), (2, 'Failed')], default=0, verbose_name='Avatar Status'),
+        ),
+        migrations.AlterField(
+            model_name='profile',
+            name='avatar',
+            field=models.ImageField(blank=True, upload_to='avatars/', verbose_name='Avatar'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-18 09:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0004_avatar_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='avatar_renditions',
+            field=models.JSONField(blank=True, default=list, editable=False, verbose_name='Avatar Renditions'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 6.0.2 on 2026-10-18 09:48
+
+import posts.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0005_avatar_renditions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='profile',
+            name='avatar',
+            field=models.ImageField(blank=True, upload_to='avatars/', validators=[posts.validators.validate_image_pixels], verbose_name='Avatar'),
+        ),
+    ]
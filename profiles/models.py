@@ -3,8 +3,8 @@ from django.conf import settings
 from django.utils.translation import gettext_lazy as _
 from django.templatetags.static import static
 
-from imagekit.models import ProcessedImageField
-from imagekit.processors import ResizeToFill
+from posts.models import IMAGE_STATUS_CHOICES,IMAGE_READY
+from posts.validators import validate_image_pixels
 
 
 class Country(models.Model):
@@ -26,14 +26,9 @@ class Profile(models.Model):
     user=models.OneToOneField(settings.AUTH_USER_MODEL,related_name='profile',on_delete=models.CASCADE,verbose_name=_('User'))
     phone_number=models.BigIntegerField(blank=True,null=True,unique=True,db_index=True,verbose_name=_('Phone Number'))
     country=models.ForeignKey(to=Country,related_name='country',on_delete=models.SET_NULL,null=True,blank=True,verbose_name=_('Country'))
-    avatar=ProcessedImageField(
-        blank=True,
-        upload_to='avatars/',
-        processors=[ResizeToFill(150,150)],
-        format='WEBP',
-        options={'quality': 80},
-        verbose_name=_('Avatar'),
-    )
+    avatar=models.ImageField(blank=True,upload_to='avatars/',validators=[validate_image_pixels],verbose_name=_('Avatar'))
+    avatar_status=models.PositiveSmallIntegerField(choices=IMAGE_STATUS_CHOICES,default=IMAGE_READY,verbose_name=_('Avatar Status'))
+    avatar_renditions=models.JSONField(default=list,blank=True,editable=False,verbose_name=_('Avatar Renditions'))
     bio=models.TextField(max_length=500,blank=True,null=True,verbose_name=_('Bio'))
     verified=models.BooleanField(default=False,verbose_name=_('Verified'))
 
@@ -59,6 +54,29 @@ class Profile(models.Model):
 
         return static('images/avatar_default.svg')
 
+class UserSearchToken(models.Model):
+    FIELD_USERNAME=0
+    FIELD_NAME=1
+    FIELD_CHOICES=(
+        (FIELD_USERNAME,_('Username')),
+        (FIELD_NAME,_('Name')),
+    )
+    user=models.ForeignKey(settings.AUTH_USER_MODEL,related_name='search_tokens',on_delete=models.CASCADE,verbose_name=_('User'))
+    token=models.CharField(max_length=150,verbose_name=_('Token'))
+    field=models.PositiveSmallIntegerField(choices=FIELD_CHOICES,default=FIELD_USERNAME,verbose_name=_('Field'))
+
+    class Meta:
+        db_table = 'profiles_user_search_tokens'
+        verbose_name='User Search Token'
+        verbose_name_plural='User Search Tokens'
+        indexes=[
+            # Prefix LIKE scans in token order, whatever the database collation is
+            models.Index(fields=['token'],name='profile_search_token_idx',opclasses=['varchar_pattern_ops']),
+        ]
+
+    def __str__(self):
+        return self.token
+
 # TODO: Add Device Model Too
 # class Device(models.Model):
 #     DEVICE_WEB=1
@@ -0,0 +1,107 @@
+import hashlib
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Q
+
+from .models import UserSearchToken
+
+User=get_user_model()
+
+RESULTS_LIMIT=10
+# Tokens read per result slot, ranking happens among these candidates only
+CANDIDATES=5
+MAX_QUERY_LENGTH=50
+CACHE_TIMEOUT=60
+BATCH_SIZE=1000
+# Sorts after every character, closes the range of tokens sharing a prefix
+MAX_CHAR=chr(0x10FFFF)
+
+
+def normalize(text):
+    return ' '.join((text or '').casefold().split())
+
+def user_tokens(username,first_name,last_name):
+    max_length=UserSearchToken._meta.get_field('token').max_length
+    tokens={(normalize(username)[:max_length],UserSearchToken.FIELD_USERNAME)}
+
+    # Every name word and the full name, so 'ali re' completes 'ali reza'
+    name=normalize(f'{first_name} {last_name}')
+    for word in {*name.split(),name}:
+        tokens.add((word[:max_length],UserSearchToken.FIELD_NAME))
+    return {(token,field) for token,field in tokens if token}
+
+def build_tokens(user):
+    return [
+        UserSearchToken(user_id=user.pk,token=token,field=field)
+        for token,field in user_tokens(user.username,user.first_name,user.last_name)
+    ]
+
+def index_user(user):
+    with transaction.atomic():
+        UserSearchToken.objects.filter(user_id=user.pk).delete()
+        # Inactive users are left out of the index instead of filtered on every search
+        if user.is_active:
+            UserSearchToken.objects.bulk_create(build_tokens(user))
+
+def rebuild_user_search(batch_size=BATCH_SIZE):
+    UserSearchToken.objects.all().delete()
+
+    total=0
+    last_id=0
+    while True:
+        users=list(User.objects.filter(is_active=True,pk__gt=last_id).order_by('pk').only('username','first_name','last_name')[:batch_size])
+        if not users:
+            break
+
+        UserSearchToken.objects.bulk_create([token for user in users for token in build_tokens(user)],batch_size=batch_size)
+        total+=len(users)
+        last_id=users[-1].pk
+
+    return total
+
+def prefix_filter(prefix):
+    # A prefix LIKE only walks the varchar_pattern_ops index on PostgreSQL,
+    # elsewhere (SQLite escapes LIKE) the same range is spelled out for the token index
+    if connection.vendor == 'postgresql':
+        return Q(token__startswith=prefix)
+    return Q(token__gte=prefix,token__lt=prefix+MAX_CHAR)
+
+def candidate_tokens(prefix,limit):
+    # Exact matches are read on their own so completions never crowd them out,
+    # the completions come in index order, so neither query sorts more than limit rows
+    tokens=UserSearchToken.objects.values_list('user_id','token','field')
+    exact=list(tokens.filter(token=prefix).order_by('user_id')[:limit])
+    completions=list(tokens.filter(prefix_filter(prefix),token__gt=prefix).order_by('token')[:limit])
+    return exact+completions
+
+def rank(prefix,candidates,limit):
+    # Exact matches first, then usernames before names, then the closest completion
+    best={}
+    for user_id,token,field in candidates:
+        key=(token != prefix,field,len(token),token)
+        if user_id not in best or key < best[user_id]:
+            best[user_id]=key
+    return sorted(best,key=best.get)[:limit]
+
+def cache_key(prefix,limit):
+    return f'profiles:search:{limit}:{hashlib.blake2b(prefix.encode(),digest_size=16).hexdigest()}'
+
+def ranked_user_ids(prefix,limit):
+    key=cache_key(prefix,limit)
+    user_ids=cache.get(key)
+    if user_ids is None:
+        user_ids=rank(prefix,candidate_tokens(prefix,limit*CANDIDATES),limit)
+        cache.set(key,user_ids,CACHE_TIMEOUT)
+    return user_ids
+
+def search_users(query,limit=RESULTS_LIMIT,exclude=None):
+    prefix=normalize(query)[:MAX_QUERY_LENGTH]
+    if not prefix:
+        return []
+
+    # One extra id covers the searching user dropping out of a shared cached result
+    user_ids=[user_id for user_id in ranked_user_ids(prefix,limit+1) if user_id != exclude][:limit]
+    users=User.objects.filter(pk__in=user_ids,is_active=True).select_related('profile').in_bulk()
+    return [users[user_id] for user_id in user_ids if user_id in users]
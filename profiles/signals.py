@@ -3,9 +3,15 @@ from django.dispatch import receiver
 from django.contrib.auth import get_user_model
 
 from .models import Profile
+from .search import index_user
+from posts.images import register_image
+
+SEARCH_FIELDS={'username','first_name','last_name','is_active'}
 
 User=get_user_model()
 
+register_image(Profile,'avatar',150,150,'avatar_status','avatar_renditions',widths=(48,96))
+
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
@@ -13,4 +19,10 @@ def create_user_profile(sender, instance, created, **kwargs):
 
 @receiver(post_save, sender=User)
 def save_user_profile(sender, instance, **kwargs):
-    instance.profile.save()
\ No newline at end of file
+    instance.profile.save()
+
+@receiver(post_save, sender=User)
+def index_user_search(sender, instance, update_fields=None, **kwargs):
+    # Logins only touch last_login, the search tokens stay as they are
+    if update_fields is None or SEARCH_FIELDS & set(update_fields):
+        index_user(instance)
\ No newline at end of file
@@ -1,4 +1,4 @@
-from django.test import TestCase,Client
+from django.test import TestCase,Client,override_settings
 
 from django.db.models import Exists,OuterRef,CharField
 from django.db.models.functions import Cast
@@ -9,13 +9,20 @@ from django.contrib.messages import get_messages
 from django.urls import reverse
 
 from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
 from django.core.files.uploadedfile import SimpleUploadedFile
 
 from django.utils.http import urlsafe_base64_encode
 from django.utils.encoding import force_bytes
 
-from profiles.models import Country,Profile
-from posts.models import Post,Tag,Comment,Replay,Like
+import io
+from io import StringIO
+from PIL import Image
+
+from profiles.models import Country,Profile,UserSearchToken
+from profiles.search import search_users,rebuild_user_search
+from posts.models import Post,Tag,Comment,Replay,Like,ImageJob,IMAGE_READY,IMAGE_PENDING
 from jnestagram.tokens import generate_token
 
 User = get_user_model()
@@ -304,6 +311,40 @@ class ProfileViewTest(TestCase):
         self.assertEqual(response.status_code, 302)
         self.assertIn('/login/',response.url)
 
+    def test_avatar_is_processed_by_worker(self):
+        small_gif = (
+            b'\x47\x49\x46\x38\x39\x61\x01\x00\x01\x00\x00\x00\x00\x21\xf9'
+            b'\x04\x01\x0a\x00\x01\x00\x2c\x00\x00\x00\x00\x01\x00\x01\x00'
+            b'\x00\x02\x02\x4c\x01\x00\x3b'
+        )
+        avatar=SimpleUploadedFile('avatar.gif',small_gif,content_type='image/gif')
+        self.client.post(self.url,{'email':'test@test.com','avatar':avatar})
+
+        profile=Profile.objects.get(user=self.user)
+        self.assertEqual(profile.avatar_status,IMAGE_PENDING)
+        self.assertEqual(ImageJob.objects.get().source,profile.avatar.name)
+
+        call_command('process_images',workers=0,once=True,stdout=StringIO())
+        profile.refresh_from_db()
+
+        self.assertEqual(profile.avatar_status,IMAGE_READY)
+        self.assertEqual(sorted((rendition['format'],rendition['width']) for rendition in profile.avatar_renditions),
+            [(format,width) for format in ('avif','webp') for width in (48,96,150)])
+        with Image.open(profile.avatar) as image:
+            self.assertEqual((image.format,image.size),('WEBP',(150,150)))
+
+    @override_settings(IMAGE_MAX_DECODE_PIXELS=100)
+    def test_oversized_avatar_is_rejected(self):
+        data=io.BytesIO()
+        Image.new('RGB',(20,20)).save(data,'PNG')
+        avatar=SimpleUploadedFile('avatar.png',data.getvalue(),content_type='image/png')
+        response=self.client.post(self.url,{'email':'test@test.com','avatar':avatar})
+
+        self.assertRedirects(response,self.url)
+        self.assertIn('too large',str(list(get_messages(response.wsgi_request))[0]))
+        self.assertFalse(Profile.objects.get(user=self.user).avatar)
+        self.assertFalse(ImageJob.objects.exists())
+
 class PublicProfileViewTest(TestCase):
     def setUp(self):
         # Create User
@@ -523,3 +564,63 @@ class ApprovedCommentTest(TestCase):
         # Check database for comment should not be approve
         self.comment.refresh_from_db()
         self.assertFalse(self.comment.is_approved)
+
+
+class UserSearchTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.ali=User.objects.create_user(username='ali',password='testpassword',first_name='Reza',last_name='Karimi')
+        self.alireza=User.objects.create_user(username='alireza',password='testpassword')
+        self.sara=User.objects.create_user(username='sara',password='testpassword',first_name='Ali',last_name='Ahmadi')
+
+    def usernames(self,query,**kwargs):
+        return [user.username for user in search_users(query,**kwargs)]
+
+    def test_ranks_exact_matches_then_usernames_then_names(self):
+        self.assertEqual(self.usernames('ALI'),['ali','sara','alireza'])
+        self.assertEqual(self.usernames('al'),['ali','alireza','sara'])
+
+    def test_matches_name_words_and_full_name(self):
+        self.assertEqual(self.usernames('karimi'),['ali'])
+        self.assertEqual(self.usernames('ali ahm'),['sara'])
+
+    def test_excludes_searching_user_and_limits_results(self):
+        self.assertEqual(self.usernames('ali',exclude=self.ali.pk),['sara','alireza'])
+        self.assertEqual(self.usernames('ali',limit=1),['ali'])
+
+    def test_inactive_users_leave_the_index(self):
+        self.alireza.is_active=False
+        self.alireza.save()
+        cache.clear()
+
+        self.assertFalse(UserSearchToken.objects.filter(user=self.alireza).exists())
+        self.assertEqual(self.usernames('ali'),['ali','sara'])
+
+    def test_login_does_not_reindex(self):
+        tokens=set(UserSearchToken.objects.values_list('pk',flat=True))
+        self.client.login(username='ali',password='testpassword')
+        self.assertEqual(set(UserSearchToken.objects.values_list('pk',flat=True)),tokens)
+
+    def test_results_are_cached_per_prefix(self):
+        self.usernames('ali')
+        with self.assertNumQueries(1):
+            self.assertEqual(self.usernames('ali'),['ali','sara','alireza'])
+
+    def test_exact_matches_beat_earlier_sorting_completions(self):
+        for index in range(20):
+            User.objects.create_user(username=f'alaa{index:02}')
+        User.objects.create_user(username='zed',first_name='Al')
+        cache.clear()
+
+        self.assertEqual(self.usernames('al',limit=1),['zed'])
+        self.assertEqual(self.usernames('ala',limit=1),['alaa00'])
+
+    def test_rebuild(self):
+        UserSearchToken.objects.all().delete()
+        self.assertEqual(rebuild_user_search(batch_size=2),3)
+        self.assertEqual(self.usernames('sa'),['sara'])
+
+    def test_search_view(self):
+        self.client.force_login(self.sara)
+        response=self.client.get(reverse('inbox_search_users'),{'search_user':'ali'},HTTP_HX_REQUEST='true')
+        self.assertEqual([user.username for user in response.context['users']],['ali','alireza'])
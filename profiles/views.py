@@ -1,8 +1,5 @@
 from django.db import transaction
-from django.db.models import  Prefetch,Value,BooleanField,OuterRef,Exists,CharField
-from django.db.models.functions import Cast
-
-from django.contrib.contenttypes.models import ContentType
+from django.db.models import  Prefetch
 
 from django.contrib import messages
 
@@ -20,9 +17,13 @@ from django.utils.http import urlsafe_base64_encode,urlsafe_base64_decode
 from django.utils.encoding import force_bytes,force_str
 from django.template.loader import render_to_string
 from django.core.mail import EmailMessage
+from django.core.exceptions import ValidationError
 
 from .models import Profile,Country
-from posts.models import Post, Comment, Like, Replay
+from posts.models import Post, Comment, Replay
+from posts.liked import mark_liked
+from posts.counters import set_comment_approval
+from posts.validators import validate_image_pixels
 from .forms import RegistrationForm,ProfileForm
 from jnestagram.tokens import generate_token
 
@@ -155,6 +156,13 @@ class ProfileView(LoginRequiredMixin,View):
         country_id=request.POST.get('country')
         avatar=request.FILES.get('avatar')
         bio=request.POST.get('bio','').strip()
+
+        if avatar:
+            try:
+                validate_image_pixels(avatar)
+            except ValidationError as error:
+                messages.error(request, error.messages[0])
+                return redirect('profile')
         
         # Update user and profile
         try:
@@ -195,15 +203,6 @@ class PublicProfileView(DetailView):
     def get_queryset(self):
         return Profile.objects.select_related('user','country')
 
-    def annotate_likes(self,queryset,model):
-        content_type=ContentType.objects.get_for_model(model)
-        user_likes=Like.objects.filter(
-            user=self.request.user,
-            content_type=content_type,
-            object_id=Cast(OuterRef('pk'),CharField())
-        )
-        return queryset.annotate(is_liked=Exists(user_likes))
-
     def get_object(self, queryset=None):
         profile=super().get_object(queryset)
         user=profile.user
@@ -213,22 +212,15 @@ class PublicProfileView(DetailView):
         top_comments_qs = Comment.objects.filter(user=user,is_approved=True, likes_count__gt=0).order_by('-likes_count',                                                                                       '-replays_count')[:5]
         replays_qs = Replay.objects.select_related('user')
 
-        if self.request.user.is_authenticated:
-            posts_qs=self.annotate_likes(posts_qs,Post)
-            top_comments_qs=self.annotate_likes(top_comments_qs,Comment)
-            replays_qs=self.annotate_likes(replays_qs,Replay)
-        else:
-            posts_qs = posts_qs.annotate(is_liked=Value(False, output_field=BooleanField()))
-            top_comments_qs = top_comments_qs.annotate(is_liked=Value(False, output_field=BooleanField()))
-            replays_qs = replays_qs.annotate(is_liked=Value(False, output_field=BooleanField()))
-
         top_comments_qs = top_comments_qs.prefetch_related(
             Prefetch('comment_replays', queryset=replays_qs, to_attr='replies'),
         )
 
-        user.all_posts=list(posts_qs)
-        user.top_posts=list(top_posts_qs)
-        user.top_comments=list(top_comments_qs)
+        viewer=self.request.user
+        user.all_posts=mark_liked(viewer,posts_qs)
+        user.top_posts=mark_liked(viewer,top_posts_qs)
+        user.top_comments=mark_liked(viewer,top_comments_qs)
+        mark_liked(viewer,[replay for comment in user.top_comments for replay in comment.replies])
 
         return profile
 
@@ -284,7 +276,6 @@ class UserDeleteView(LoginRequiredMixin,UserPassesTestMixin,DeleteView):
 @login_required
 def approve_comment(request,pk):
     comment=get_object_or_404(Comment,pk=pk,post__user=request.user)
-    comment.is_approved=True
-    comment.save()
+    set_comment_approval(comment,True)
     messages.success(request, _('Comment has been approved and is now public.'))
     return redirect('profile')
\ No newline at end of file
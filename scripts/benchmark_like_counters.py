@@ -0,0 +1,90 @@
+"""
+Concurrency benchmark for likes on a single hot post.
+
+Runs parallel like toggles against one post, first updating likes_count in
+place and then with sharded counters, and prints the throughput of both.
+Needs a database that allows concurrent writers (PostgreSQL), e.g.:
+
+    python scripts/benchmark_like_counters.py --likes 2000 --threads 16 --shards 16
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'jnestagram.settings')
+
+import django
+
+django.setup()
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+
+from posts.likes import toggle_like, rollup_like_shards, fresh_likes_count
+from posts.models import Post
+
+User = get_user_model()
+
+
+def run(post, users, threads, shards):
+    settings.LIKE_COUNTER_SHARDS = shards
+    chunks = [users[index::threads] for index in range(threads)]
+    errors = []
+
+    def worker(chunk):
+        try:
+            for user in chunk:
+                toggle_like(user, Post, post.pk)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            connection.close()
+
+    workers = [threading.Thread(target=worker, args=(chunk,)) for chunk in chunks]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    if errors:
+        raise errors[0]
+
+    rollup_like_shards()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--likes', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--shards', type=int, default=16)
+    args = parser.parse_args()
+
+    prefix = f'bench-{uuid.uuid4().hex[:8]}'
+    users = User.objects.bulk_create([User(username=f'{prefix}-{index}') for index in range(args.likes)])
+    users = list(User.objects.filter(username__startswith=prefix))
+    owner = users[0]
+    post = Post.objects.create(user=owner, title=prefix, text=prefix)
+
+    try:
+        print(f'{args.likes} likes on one post, {args.threads} threads')
+        for label, shards in (('row counter', 0), (f'{args.shards} shards', args.shards)):
+            # Like everything, then unlike everything, so both runs start from zero
+            elapsed = run(post, users, args.threads, shards)
+            count = fresh_likes_count(post)
+            run(post, users, args.threads, shards)
+            print(f'{label:>12}: {args.likes / elapsed:10.1f} likes/s  (likes_count={count})')
+    finally:
+        post.delete()
+        User.objects.filter(username__startswith=prefix).delete()
+
+
+if __name__ == "__main__":
+    main()
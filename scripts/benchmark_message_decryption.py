@@ -0,0 +1,88 @@
+"""
+Rendering benchmark for a 1,000 message conversation.
+
+Times the old per-message decrypt filter against batched decryption with
+a cold and a warm plaintext cache, rendering the same message list each
+time, e.g.:
+
+    python scripts/benchmark_message_decryption.py --messages 1000 --workers 4
+"""
+import argparse
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'jnestagram.settings')
+
+import django
+
+django.setup()
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.template.loader import render_to_string
+from django.test import RequestFactory
+
+from inboxes import crypto
+from inboxes.models import Conversation, Message
+
+User = get_user_model()
+
+
+def render(messages, user):
+    request = RequestFactory().get('/')
+    request.user = user
+    return render_to_string('partials/inboxes/messages.html', {'chats': messages}, request=request)
+
+
+def timed(label, messages, user, decrypt):
+    started = time.perf_counter()
+    decrypt(messages)
+    decrypted = time.perf_counter()
+    render(messages, user)
+    rendered = time.perf_counter()
+    print(f'{label:>18}: decrypt {(decrypted - started) * 1000:8.1f} ms, total {(rendered - started) * 1000:8.1f} ms')
+
+
+def per_message(messages):
+    # What the decrypt template filter did for every message
+    for message in messages:
+        message.plaintext = crypto.get_fernet().decrypt(message.text).decode('utf-8')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=0)
+    args = parser.parse_args()
+    settings.MESSAGE_DECRYPT_WORKERS = args.workers
+
+    prefix = f'bench-{uuid.uuid4().hex[:8]}'
+    alice = User.objects.create(username=f'{prefix}-alice')
+    bob = User.objects.create(username=f'{prefix}-bob')
+    conversation, _ = Conversation.get_or_create_direct(alice, bob)
+
+    try:
+        Message.objects.bulk_create([
+            Message(conversation=conversation, sender=alice if index % 2 else bob, text=crypto.encrypt(f'Message number {index}'))
+            for index in range(args.messages)
+        ])
+
+        def load():
+            return list(Message.objects.filter(conversation=conversation).select_related('sender__profile'))
+
+        print(f'{args.messages} messages, {args.workers} decrypt threads')
+        timed('per message filter', load(), alice, per_message)
+        crypto.plaintexts.clear()
+        timed('batch, cold cache', load(), alice, crypto.decrypt_messages)
+        timed('batch, warm cache', load(), alice, crypto.decrypt_messages)
+        print(crypto.stats())
+    finally:
+        conversation.delete()
+        User.objects.filter(username__startswith=prefix).delete()
+
+
+if __name__ == "__main__":
+    main()
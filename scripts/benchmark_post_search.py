@@ -0,0 +1,98 @@
+"""
+Post search benchmark over a large post table.
+
+Creates the posts and their search terms in bulk, then times the first
+and the last served page of ranked results for common, rare and
+combined queries, counting the matches like the paginator does, e.g.:
+
+    python scripts/benchmark_post_search.py --posts 1000000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'jnestagram.settings')
+
+import django
+
+django.setup()
+
+from django.contrib.auth import get_user_model
+from django.core.paginator import Paginator
+from django.db import connection
+
+from posts.models import Post, PostSearchTerm
+from posts.search import MAX_RESULTS, build_terms, search_posts
+
+User = get_user_model()
+
+BATCH_SIZE = 5000
+PAGE_SIZE = 10
+# Word frequencies fall off like in real text, the first words are on most posts
+WORDS = ['photo', 'travel', 'garden', 'shiraz', 'sunset', 'coffee', 'bridge', 'market', 'mountain', 'desert',
+         'شیراز', 'باغ', 'سفر', 'کتاب', 'غذا', 'دریا', 'کوه', 'بازار', 'عکس', 'شب']
+WEIGHTS = [1 / (rank + 1) for rank in range(len(WORDS))]
+
+
+def random_text(length):
+    return ' '.join(random.choices(WORDS, WEIGHTS, k=length))
+
+
+def create_posts(user, count):
+    for start in range(0, count, BATCH_SIZE):
+        posts = Post.objects.bulk_create([
+            Post(user=user, title=random_text(3), text=random_text(20), image='benchmark.jpg')
+            for _ in range(start, min(start + BATCH_SIZE, count))
+        ])
+        PostSearchTerm.objects.bulk_create([term for post in posts for term in build_terms(post)], batch_size=BATCH_SIZE)
+
+
+def first_page(query):
+    paginator = Paginator(search_posts(Post.objects.all(), query), PAGE_SIZE)
+    return list(paginator.page(1)), paginator.count
+
+
+def last_page(query):
+    paginator = Paginator(search_posts(Post.objects.all(), query), PAGE_SIZE)
+    return list(paginator.page(paginator.num_pages)), paginator.count
+
+
+def timed(label, queries, search, rounds=5):
+    timings = []
+    for query in queries:
+        for _ in range(rounds):
+            started = time.perf_counter()
+            search(query)
+            timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    print(f'{label:>14}: p50 {timings[len(timings) // 2]:8.2f} ms, p95 {timings[int(len(timings) * 0.95)]:8.2f} ms, max {timings[-1]:8.2f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--posts', type=int, default=1000000)
+    args = parser.parse_args()
+
+    user = User.objects.create_user(username=f'benchmark{uuid.uuid4().hex[:8]}')
+    started = time.perf_counter()
+    create_posts(user, args.posts)
+    print(f'{args.posts} posts created in {time.perf_counter() - started:.1f} s, at most {MAX_RESULTS} results per query')
+
+    # Planner statistics, without them SQLite scans every posting of a term
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+    try:
+        for label, queries in (('common', ['photo', 'travel']), ('rare', ['شب', 'عکس']), ('combined', ['photo travel', 'سفر کتاب'])):
+            timed(f'{label} first', queries, first_page)
+            timed(f'{label} last', queries, last_page)
+    finally:
+        user.delete()
+
+
+if __name__ == "__main__":
+    main()
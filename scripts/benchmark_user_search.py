@@ -0,0 +1,100 @@
+"""
+User search benchmark over a large user table.
+
+Creates the users and their search tokens in bulk, then times the old
+three-column icontains filter against the token index with a cold and a
+warm prefix cache, typing each query one key at a time, e.g.:
+
+    python scripts/benchmark_user_search.py --users 1000000
+"""
+import argparse
+import os
+import random
+import string
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'jnestagram.settings')
+
+import django
+
+django.setup()
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import Q
+
+from profiles.models import UserSearchToken
+from profiles.search import build_tokens, search_users
+
+User = get_user_model()
+
+BATCH_SIZE = 5000
+NAMES = ['ali', 'reza', 'sara', 'maryam', 'mohammad', 'zahra', 'hossein', 'fatemeh', 'amir', 'neda']
+
+
+def random_word(length):
+    return ''.join(random.choices(string.ascii_lowercase, k=length))
+
+
+def create_users(prefix, count):
+    for start in range(0, count, BATCH_SIZE):
+        users = User.objects.bulk_create([
+            User(
+                username=f'{prefix}{random_word(6)}{index}',
+                first_name=random.choice(NAMES).title(),
+                last_name=random_word(7).title(),
+                is_active=index % 50 != 0,
+            )
+            for index in range(start, min(start + BATCH_SIZE, count))
+        ])
+        UserSearchToken.objects.bulk_create([token for user in users if user.is_active for token in build_tokens(user)])
+
+
+def keystrokes(query):
+    return [query[:length] for length in range(1, len(query) + 1)]
+
+
+def icontains(letters):
+    return list(User.objects.filter(
+        Q(username__icontains=letters) |
+        Q(first_name__icontains=letters) |
+        Q(last_name__icontains=letters)
+    ))
+
+
+def timed(label, queries, search):
+    timings = []
+    for query in queries:
+        for letters in keystrokes(query):
+            started = time.perf_counter()
+            search(letters)
+            timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    print(f'{label:>18}: p50 {timings[len(timings) // 2]:8.2f} ms, p95 {timings[int(len(timings) * 0.95)]:8.2f} ms, max {timings[-1]:8.2f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=1000000)
+    args = parser.parse_args()
+
+    prefix = f'b{uuid.uuid4().hex[:6]}'
+    queries = ['maryam', 'reza', prefix + 'q']
+    started = time.perf_counter()
+    create_users(prefix, args.users)
+    print(f'{args.users} users created in {time.perf_counter() - started:.1f} s')
+
+    try:
+        timed('icontains', queries, icontains)
+        cache.clear()
+        timed('index, cold cache', queries, search_users)
+        timed('index, warm cache', queries, search_users)
+    finally:
+        User.objects.filter(username__startswith=prefix).delete()
+
+
+if __name__ == "__main__":
+    main()